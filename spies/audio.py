@@ -1,32 +1,193 @@
-"""Audio playback helpers for spy toast alerts."""
+"""Audio playback for spy toast alerts.
+
+`AlertAudioEngine` opens the alert sound once and keeps it resident; each alert
+then only asks a dedicated worker thread to play it again from the start.
+Alerts arriving closer together than `min_interval_seconds` are dropped, so a
+burst of alerts plays the sound once. Playback does not wait for a sound that
+is still playing: MCI's `play ... from 0` returns at once, and an accepted
+request restarts the sound from the beginning. Backends do the actual playback: MCI on
+Windows, and a recording backend that only notes play requests so the engine
+can run (and be benchmarked) on any platform.
+"""
+
+from __future__ import annotations
 
-from pathlib import Path
 import ctypes
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+from spies.metrics import METRICS
 
-WINMM = ctypes.windll.winmm
 MCI_ALIAS = "AgeKeeperSpyAlert"
+DEFAULT_MIN_REPLAY_SECONDS = 1.0
+
+ALERT_AUDIO_REQUESTS = METRICS.counter(
+    "spies_alert_audio_total",
+    "Alert sound requests, by result (played, suppressed, failed).",
+    labelnames=("result",),
+)
+
+_STOP = object()
+
+
+class AudioBackend(ABC):
+    """Interface for something that can hold one sound and replay it."""
+
+    name = "base"
+
+    @abstractmethod
+    def load(self, audio_path: Path) -> bool:
+        """Open (and decode, where the backend does) the sound. Returns success."""
+
+    @abstractmethod
+    def play(self) -> bool:
+        """Start the loaded sound from the beginning without waiting for it to finish. Returns success."""
+
+    def close(self) -> None:
+        """Release the loaded sound."""
+
+
+class MciAudioBackend(AudioBackend):
+    """Play through the Windows MCI API with one long-lived device alias.
+
+    Toast custom file audio can be ignored in some desktop app contexts, so the
+    local media file is played directly. All calls happen on the engine's
+    worker thread.
+    """
+
+    name = "mci"
+
+    def __init__(self, alias: str = MCI_ALIAS):
+        self.alias = alias
+        self._winmm = None
+        self._audio_path: Path | None = None
+
+    def _send(self, command: str) -> int:
+        return self._winmm.mciSendStringW(command, None, 0, None)
+
+    def load(self, audio_path: Path) -> bool:
+        # Resolved here so this module imports on non-Windows hosts.
+        self._winmm = ctypes.windll.winmm
+        self._audio_path = audio_path
+        path_str = str(audio_path.resolve()).replace('"', '""')
+        self._send(f"close {self.alias}")
+        open_result = self._send(f'open "{path_str}" type mpegvideo alias {self.alias}')
+        if open_result != 0:
+            print(f"Failed to open alert audio with MCI (code: {open_result})")
+            return False
+        return True
+
+    def play(self) -> bool:
+        play_result = self._send(f"play {self.alias} from 0")
+        if play_result != 0 and self._audio_path is not None and self.load(self._audio_path):
+            # The device can go away (e.g. after sleep or an audio device change); reopen once.
+            play_result = self._send(f"play {self.alias} from 0")
+        if play_result != 0:
+            print(f"Failed to play alert audio with MCI (code: {play_result})")
+            return False
+        return True
+
+    def close(self) -> None:
+        if self._winmm is not None:
+            self._send(f"close {self.alias}")
+
+
+class RecordingAudioBackend(AudioBackend):
+    """Play nothing; remember when each play was requested."""
+
+    name = "recording"
+
+    def __init__(self):
+        self.loaded_path: Path | None = None
+        self.play_times: list[float] = []
+
+    def load(self, audio_path: Path) -> bool:
+        self.loaded_path = audio_path
+        return True
+
+    def play(self) -> bool:
+        self.play_times.append(time.monotonic())
+        return True
+
+
+class AlertAudioEngine:
+    """Keep one alert sound loaded and play it from a worker thread."""
+
+    def __init__(
+        self,
+        audio_path: Path,
+        backend: AudioBackend | None = None,
+        min_interval_seconds: float = DEFAULT_MIN_REPLAY_SECONDS,
+        clock=time.monotonic,
+    ):
+        self.audio_path = Path(audio_path)
+        self.backend = backend if backend is not None else MciAudioBackend()
+        self.min_interval_seconds = min_interval_seconds
+        self.clock = clock
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._last_accepted: float | None = None
+        # One slot: the worker is only busy for the moment a play call takes, so
+        # one pending request is enough.
+        self._requests: queue.Queue = queue.Queue(maxsize=1)
+        self._thread: threading.Thread | None = None
+        self._closed = False
+
+    def start(self) -> None:
+        """Start the worker, which loads the sound before taking requests."""
+        with self._lock:
+            if self._thread is not None or self._closed:
+                return
+            self._thread = threading.Thread(target=self._run, name="spies-audio", daemon=True)
+            self._thread.start()
+
+    def play(self) -> bool:
+        """Request one playback; returns False when it was rate-limited."""
+        now = self.clock()
+        with self._lock:
+            if self._closed:
+                return False
+            if self._last_accepted is not None and now - self._last_accepted < self.min_interval_seconds:
+                ALERT_AUDIO_REQUESTS.inc("suppressed")
+                return False
+            self._last_accepted = now
+        self.start()
+        try:
+            self._requests.put_nowait(None)
+        except queue.Full:
+            ALERT_AUDIO_REQUESTS.inc("suppressed")
+            return False
+        return True
 
+    def _run(self) -> None:
+        if not self.audio_path.exists():
+            print(f"Audio file not found: {self.audio_path}")
+        else:
+            self.loaded = self.backend.load(self.audio_path)
+        try:
+            while self._requests.get() is not _STOP:
+                if self.loaded and self.backend.play():
+                    ALERT_AUDIO_REQUESTS.inc("played")
+                else:
+                    ALERT_AUDIO_REQUESTS.inc("failed")
+        finally:
+            self.backend.close()
 
-def play_alert_audio(audio_path: Path) -> None:
-    """Play the configured local alert sound through the Windows MCI API."""
-    # Toast custom file audio can be ignored in some desktop app contexts.
-    # Use the Windows MCI API to play the local media file directly.
-    if not audio_path.exists():
-        print(f"Audio file not found: {audio_path}")
-        return
-
-    path_str = str(audio_path.resolve()).replace('"', '""')
-    WINMM.mciSendStringW(f"close {MCI_ALIAS}", None, 0, None)
-    open_result = WINMM.mciSendStringW(
-        f'open "{path_str}" type mpegvideo alias {MCI_ALIAS}',
-        None,
-        0,
-        None,
-    )
-    if open_result != 0:
-        print(f"Failed to open alert audio with MCI (code: {open_result})")
-        return
-
-    play_result = WINMM.mciSendStringW(f"play {MCI_ALIAS}", None, 0, None)
-    if play_result != 0:
-        print(f"Failed to play alert audio with MCI (code: {play_result})")
+    def close(self, timeout: float = 2.0) -> None:
+        """Stop the worker and release the sound."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self._thread is None:
+            return
+        # Drop any queued request so the stop marker always fits.
+        try:
+            self._requests.get_nowait()
+        except queue.Empty:
+            pass
+        self._requests.put(_STOP)
+        self._thread.join(timeout)
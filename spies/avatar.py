@@ -1,65 +1,177 @@
 """Avatar download, resolution, and cleanup helpers for spy toasts."""
 
-import urllib.parse
+import asyncio
+import threading
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 
-from windows_toasts import ToastDisplayImage, ToastImagePosition
-
 from lobby import lobby
+from spies.avatar_cache import AvatarCache
+from spies.records import WatchlistEntry
 
 TEMP_FILE_PATH = "spies/temp_files/temp_image.png"
 DEFAULT_AVATAR_PATH = "spies/assets/default_avatar.png"
-AVATARS_DIR = Path("spies/avatars")
-
-def avatar_url_to_path(avatar_url: str, avatars_dir: Path = AVATARS_DIR) -> Path:
-    """Build a deterministic local avatar path from a remote avatar URL."""
-    parsed = urllib.parse.urlparse(avatar_url)
-    filename = Path(parsed.path).name
-    if not filename:
-        # Fallback: encode the full URL when no basename is present.
-        filename = urllib.parse.quote(avatar_url, safe="")
-    return avatars_dir / filename
+DEFAULT_AVATAR_FETCH_WORKERS = 4
+# Sentinel: look the player's slot up in the match when the caller has not.
+_LOOKUP_SLOT = object()
+
+
+class AvatarFetcher:
+    """Run avatar downloads on a bounded thread pool, coalescing duplicate URLs.
+
+    Each URL has at most one download in flight. Callers asking for a URL that is
+    already being fetched are attached to the existing download, and every
+    callback fires once it completes. Callbacks are delivered on the event loop
+    that was running when they were registered, or on the worker thread when no
+    loop was running.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_AVATAR_FETCH_WORKERS):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="spies-avatar",
+        )
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def is_fetching(self, url: str) -> bool:
+        with self._lock:
+            return url in self._in_flight
+
+    def fetch(self, url: str, download, on_complete=None) -> bool:
+        """Queue `download()` for a URL and return True if a new download started.
+
+        `download` is a blocking callable returning the local file path, or None.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        with self._lock:
+            callbacks = self._in_flight.get(url)
+            started = callbacks is None
+            if started:
+                callbacks = []
+                self._in_flight[url] = callbacks
+            if on_complete is not None:
+                callbacks.append((loop, on_complete))
+
+        if started:
+            self._executor.submit(self._run_download, url, download)
+        return started
+
+    def _run_download(self, url: str, download) -> None:
+        try:
+            local_path = download()
+        except Exception as exc:
+            print(f"Failed to download avatar {url}: {exc}")
+            local_path = None
+
+        with self._lock:
+            callbacks = self._in_flight.pop(url, [])
+
+        if local_path is None:
+            return
+        for loop, callback in callbacks:
+            if loop is None:
+                callback(local_path)
+            elif not loop.is_closed():
+                loop.call_soon_threadsafe(callback, local_path)
+
+    def shutdown(self, wait: bool = False) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def _full_avatar_url(avatar_url: str) -> str:
+    return avatar_url.split(".jpg")[0] + "_full.jpg"
+
+
+def _apply_avatar_filepath(
+    player_entry: WatchlistEntry,
+    avatar_filepath: str,
+    save_entry,
+    cache: AvatarCache,
+) -> None:
+    """Point a watchlist entry at a new avatar file and persist the change."""
+    old_filepath = player_entry.avatar_filepath or ""
+    if old_filepath == avatar_filepath:
+        return
+    # Files tracked by the cache are reclaimed by its eviction policy; only
+    # untracked leftovers in the cache directory are removed here.
+    if old_filepath and cache.owns(old_filepath) and not cache.contains_path(old_filepath):
+        remove_image(old_filepath)
+    player_entry.avatar_filepath = avatar_filepath
+    save_entry(player_entry)
+
+
+def _current_avatar_filepath(player_entry: WatchlistEntry, cache: AvatarCache, default_avatar_path: str) -> str:
+    """Return the entry's avatar unless the cache has since evicted it."""
+    avatar_filepath = player_entry.avatar_filepath
+    if not avatar_filepath:
+        return default_avatar_path
+    if cache.owns(avatar_filepath) and not cache.contains_path(avatar_filepath):
+        return default_avatar_path
+    return avatar_filepath
 
 
 def resolve_avatar_filepath(
-    player_entry: dict,
+    player_entry: WatchlistEntry,
     match,
-    watchlist_by_id,
-    save_watchlist,
+    save_entry,
+    cache: AvatarCache,
     default_avatar_path: str = DEFAULT_AVATAR_PATH,
-    avatars_dir: Path = AVATARS_DIR,
+    fetcher: AvatarFetcher | None = None,
+    player_slot=_LOOKUP_SLOT,
 ) -> str:
-    """Resolve and persist the best avatar path for a player entry."""
-    player_name = player_entry.get("userName") or ""
+    """Resolve and persist the best avatar path for a player entry.
+
+    Lookups go through the in-memory cache index. With a `fetcher`, missing or
+    stale avatars are (re)downloaded in the background and the currently known
+    avatar (or the default) is returned immediately; the entry is updated once
+    the download lands, so later toasts pick up the new image. Without one, the
+    download happens inline. `save_entry(entry)` persists the entry whenever
+    its avatar path changes. Callers that already looked up the player's match
+    slot pass it as `player_slot` to skip a second lookup.
+    """
+    if player_slot is _LOOKUP_SLOT:
+        player_name = player_entry.user_name or ""
+        player_slot = lobby.get_player_slot(player_name, match) if player_name else None
     avatar_url = None
-    player_slot = lobby.get_player_slot(player_name, match) if player_name else None
     if player_slot:
         avatar_url = player_slot.get("steam_avatar", None)
 
     if not avatar_url:
         print("No avatar URL found, using fallback avatar.")
-        return player_entry.get("avatar_filepath") or default_avatar_path
-
-    avatar_path = avatar_url_to_path(avatar_url, avatars_dir=avatars_dir)
-    if not avatar_path.exists():
-        full_avatar_url = avatar_url.split(".jpg")[0] + "_full.jpg"
-        download_image(full_avatar_url, filepath=str(avatar_path))
-
-    avatar_filepath = str(avatar_path)
-    if player_entry.get("avatar_filepath") != avatar_filepath:
-        old_path = Path(player_entry.get("avatar_filepath") or "")
-        if old_path.exists() and avatars_dir in old_path.parents:
-            remove_image(str(old_path))
-        player_entry["avatar_filepath"] = avatar_filepath
-        save_watchlist(watchlist_by_id)
-
-    return avatar_filepath
-
-
-def add_player_avatar_to_toast(spy_toast, avatar_filepath: str):
-    """Attach an avatar image as the app logo for the toast payload."""
-    spy_toast.AddImage(ToastDisplayImage.fromPath(avatar_filepath, position=ToastImagePosition.AppLogo))
+        return _current_avatar_filepath(player_entry, cache, default_avatar_path)
+
+    full_avatar_url = _full_avatar_url(avatar_url)
+    avatar_filepath = cache.lookup(full_avatar_url)
+    if avatar_filepath is not None and not cache.is_stale(full_avatar_url):
+        _apply_avatar_filepath(player_entry, avatar_filepath, save_entry, cache)
+        return avatar_filepath
+
+    if fetcher is None:
+        avatar_filepath = cache.fetch(full_avatar_url) or avatar_filepath
+        if avatar_filepath is None:
+            return _current_avatar_filepath(player_entry, cache, default_avatar_path)
+        _apply_avatar_filepath(player_entry, avatar_filepath, save_entry, cache)
+        return avatar_filepath
+
+    fetcher.fetch(
+        full_avatar_url,
+        partial(cache.fetch, full_avatar_url),
+        on_complete=lambda filepath: _apply_avatar_filepath(
+            player_entry, filepath, save_entry, cache
+        ),
+    )
+    if avatar_filepath is not None:
+        # Stale but still usable while revalidation runs.
+        _apply_avatar_filepath(player_entry, avatar_filepath, save_entry, cache)
+        return avatar_filepath
+    return _current_avatar_filepath(player_entry, cache, default_avatar_path)
 
 
 def download_image(url, filepath=TEMP_FILE_PATH):
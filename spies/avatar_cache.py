@@ -0,0 +1,322 @@
+"""On-disk avatar cache with an LRU index, size budget, and HTTP revalidation."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from contextlib import suppress
+from pathlib import Path
+
+from spies.metrics import METRICS
+
+AVATARS_DIR = Path("spies/avatars")
+INDEX_FILENAME = "index.json"
+DEFAULT_MAX_BYTES = 50_000_000
+DEFAULT_MAX_ENTRIES = 2_000
+DEFAULT_REVALIDATE_AFTER_SECONDS = 7 * 24 * 60 * 60
+# A hit only dirties the index when it moves `last_used` by at least this much.
+LAST_USED_RESOLUTION_SECONDS = 60 * 60
+PARTIAL_SUFFIX = ".part"
+
+AVATAR_CACHE_LOOKUPS = METRICS.counter(
+    "spies_avatar_cache_lookups_total",
+    "Avatar cache lookups, by result (hit or miss).",
+    labelnames=("result",),
+)
+
+
+class AvatarCache:
+    """Track downloaded avatars in an on-disk index and keep them within budget.
+
+    Files are named by the SHA-256 of their source URL. Steam avatar URLs already
+    embed the image hash, so the same image is never stored twice. The index
+    records path, size, last use and the validators (ETag/Last-Modified) needed
+    for conditional requests, and is kept in memory so lookups never touch the
+    filesystem. Least recently used files are evicted once either the byte or the
+    entry budget is exceeded. Files held for a queued toast are skipped until
+    released, so a toast never points at an avatar that was deleted under it.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path = AVATARS_DIR,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        revalidate_after_seconds: float = DEFAULT_REVALIDATE_AFTER_SECONDS,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.index_path = self.cache_dir / INDEX_FILENAME
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.revalidate_after_seconds = revalidate_after_seconds
+
+        self._lock = threading.RLock()
+        # Serialises index writes, so an older snapshot never replaces a newer one.
+        self._save_lock = threading.Lock()
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._paths: set[str] = set()
+        # path -> number of queued toasts still showing that file
+        self._held: dict[str, int] = {}
+        self._total_bytes = 0
+        self._dirty = False
+        self._load_index()
+
+    @staticmethod
+    def key_for(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _path_for(self, url: str, key: str) -> Path:
+        suffix = Path(urllib.parse.urlparse(url).path).suffix or ".img"
+        return self.cache_dir / f"{key}{suffix}"
+
+    def _load_index(self) -> None:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            raw = None
+        except (OSError, ValueError):
+            print(f"Avatar cache index unreadable, starting empty: {self.index_path}")
+            raw = None
+
+        records = raw.get("entries", {}) if isinstance(raw, dict) else {}
+        for key, record in sorted(records.items(), key=lambda item: item[1].get("last_used", 0)):
+            self._entries[key] = record
+            self._paths.add(record["path"])
+            self._total_bytes += int(record.get("size", 0))
+        self._prune_untracked_files(adopt=raw is None)
+        self._evict()
+
+    def _prune_untracked_files(self, adopt: bool = False) -> None:
+        """Reconcile the cache directory with the index.
+
+        Leftover partial downloads are removed, and so are index rows whose file
+        is gone. Files the index does not know about are deleted, unless `adopt`
+        is set because there was no index to go by (the first run of the cache
+        over an existing avatars folder); they are then added to the index so
+        watchlist entries pointing at them keep their avatar.
+        """
+        adopted = []
+        if self.cache_dir.exists():
+            for child in self.cache_dir.iterdir():
+                if child.name == INDEX_FILENAME or not child.is_file() or str(child) in self._paths:
+                    continue
+                if adopt and child.suffix not in (PARTIAL_SUFFIX, ".tmp"):
+                    adopted.append(child)
+                else:
+                    _unlink(child)
+        for path in sorted(adopted, key=_mtime):
+            self._adopt(path)
+        for key, record in list(self._entries.items()):
+            if not Path(record["path"]).exists():
+                self._drop(key)
+
+    def _adopt(self, path: Path) -> None:
+        try:
+            stat = path.stat()
+        except OSError:
+            return
+        # Not keyed by URL, so lookups miss and the avatar is fetched again under
+        # its URL key; until then the file stays in use and ages out normally.
+        self._entries[path.name] = {
+            "url": None,
+            "path": str(path),
+            "size": stat.st_size,
+            "last_used": stat.st_mtime,
+            "validated": 0,
+        }
+        self._paths.add(str(path))
+        self._total_bytes += stat.st_size
+        self._dirty = True
+
+    def _drop(self, key: str) -> dict | None:
+        record = self._entries.pop(key, None)
+        if record is None:
+            return None
+        self._paths.discard(record["path"])
+        self._total_bytes -= int(record.get("size", 0))
+        self._dirty = True
+        return record
+
+    def _evict(self) -> None:
+        excess_bytes = self._total_bytes - self.max_bytes
+        excess_entries = len(self._entries) - self.max_entries
+        victims = []
+        for key, record in self._entries.items():
+            if excess_bytes <= 0 and excess_entries <= 0:
+                break
+            if record["path"] in self._held:
+                continue
+            victims.append(key)
+            excess_bytes -= int(record.get("size", 0))
+            excess_entries -= 1
+        for key in victims:
+            record = self._drop(key)
+            _unlink(Path(record["path"]))
+
+    def hold(self, filepath: str) -> bool:
+        """Keep a cached file from eviction until `release`. Returns False if it is already gone.
+
+        Paths outside the cache directory need no holding and always return True.
+        """
+        if not self.owns(filepath):
+            return True
+        with self._lock:
+            if filepath not in self._paths:
+                return False
+            self._held[filepath] = self._held.get(filepath, 0) + 1
+            return True
+
+    def release(self, filepath: str) -> None:
+        """Drop one `hold` on a file, evicting anything deferred while it was held."""
+        with self._lock:
+            count = self._held.get(filepath)
+            if count is None:
+                return
+            if count > 1:
+                self._held[filepath] = count - 1
+                return
+            del self._held[filepath]
+            self._evict()
+
+    def lookup(self, url: str) -> str | None:
+        """Return the cached file path for a URL and mark it as recently used."""
+        key = self.key_for(url)
+        with self._lock:
+            record = self._entries.get(key)
+            if record is None:
+                AVATAR_CACHE_LOOKUPS.inc("miss")
+                return None
+            AVATAR_CACHE_LOOKUPS.inc("hit")
+            self._entries.move_to_end(key)
+            now = time.time()
+            if now - record.get("last_used", 0) >= LAST_USED_RESOLUTION_SECONDS:
+                record["last_used"] = now
+                self._dirty = True
+            return record["path"]
+
+    def owns(self, filepath: str) -> bool:
+        """Return True if the path lives in the cache directory."""
+        return Path(filepath).parent == self.cache_dir
+
+    def contains_path(self, filepath: str) -> bool:
+        with self._lock:
+            return filepath in self._paths
+
+    def is_stale(self, url: str) -> bool:
+        with self._lock:
+            record = self._entries.get(self.key_for(url))
+            if record is None:
+                return True
+            return time.time() - record.get("validated", 0) > self.revalidate_after_seconds
+
+    def fetch(self, url: str) -> str | None:
+        """Download or revalidate one URL and return its cached path.
+
+        Blocking; intended to run on a worker thread.
+        """
+        key = self.key_for(url)
+        with self._lock:
+            record = dict(self._entries.get(key) or {})
+
+        headers = {}
+        if record.get("etag"):
+            headers["If-None-Match"] = record["etag"]
+        if record.get("last_modified"):
+            headers["If-Modified-Since"] = record["last_modified"]
+
+        target = self._path_for(url, key)
+        partial_path = target.with_name(target.name + PARTIAL_SUFFIX)
+        request = urllib.request.Request(url, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=15) as response:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                with open(partial_path, "wb") as f:
+                    size = 0
+                    while chunk := response.read(64 * 1024):
+                        f.write(chunk)
+                        size += len(chunk)
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+        except urllib.error.HTTPError as exc:
+            _unlink(partial_path)
+            if exc.code == 304 and record:
+                return self._mark_validated(key)
+            raise
+        except BaseException:
+            _unlink(partial_path)
+            raise
+        partial_path.replace(target)
+
+        now = time.time()
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = {
+                "url": url,
+                "path": str(target),
+                "size": size,
+                "last_used": now,
+                "validated": now,
+                "etag": etag,
+                "last_modified": last_modified,
+            }
+            self._paths.add(str(target))
+            self._total_bytes += size
+            self._dirty = True
+            self._evict()
+            cached = key in self._entries
+        # Written outside the lock so lookups on the event loop never wait on the disk.
+        self.save_index()
+        return str(target) if cached else None
+
+    def _mark_validated(self, key: str) -> str | None:
+        with self._lock:
+            record = self._entries.get(key)
+            if record is None:
+                return None
+            record["validated"] = time.time()
+            self._dirty = True
+            return record["path"]
+
+    def save_index(self) -> None:
+        """Persist the index if anything changed since the last save."""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                payload = {"version": 1, "entries": {k: dict(v) for k, v in self._entries.items()}}
+                self._dirty = False
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=f".{INDEX_FILENAME}.", suffix=".tmp", dir=self.cache_dir)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(payload, f, separators=(",", ":"))
+                os.replace(tmp_path, self.index_path)
+            except BaseException:
+                with self._lock:
+                    self._dirty = True
+                with suppress(OSError):
+                    os.unlink(tmp_path)
+                raise
+
+
+def _mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return 0.0
+
+
+def _unlink(path: Path) -> None:
+    try:
+        path.unlink()
+    except OSError:
+        pass
@@ -1,8 +1,15 @@
-"""Command-line argument parsing and command dispatch for Spies."""
+"""Command-line argument parsing and command dispatch for Spies.
+
+`run` is the `agekeeper-spies` entry point. Task and log-tail commands only
+import the modules they need; the watcher runtime (lobby, match books, toasts)
+is imported only when the watcher is actually started.
+"""
 
 import argparse
+from pathlib import Path
 
 from spies import task_registration
+from spies.sinks import SINK_CHOICES
 
 
 def build_cli_parser() -> argparse.ArgumentParser:
@@ -23,6 +30,75 @@ def build_cli_parser() -> argparse.ArgumentParser:
         action="store_true",
         help="When used with --tail-logs, print lines and exit without follow mode.",
     )
+    parser.add_argument(
+        "--filter-player",
+        default=None,
+        help="With --tail-logs, only show status records whose player name or ID contains this text.",
+    )
+    parser.add_argument(
+        "--filter-status",
+        default=None,
+        help="With --tail-logs, only show status records with this status (e.g. lobby, spectate).",
+    )
+    parser.add_argument(
+        "--filter-match-id",
+        default=None,
+        help="With --tail-logs, only show status records for this match ID.",
+    )
+    parser.add_argument(
+        "--filter-level",
+        choices=("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"),
+        type=str.upper,
+        default=None,
+        help="With --tail-logs, only show records at or above this level.",
+    )
+    parser.add_argument(
+        "--since",
+        default=None,
+        help="With --tail-logs, show every matching record since a time: 15m, 2h, 1d or '2024-05-01 18:30'.",
+    )
+    parser.add_argument(
+        "--notify-sink",
+        choices=SINK_CHOICES,
+        default=None,
+        help="Where alerts are delivered (default: windows on Windows, console elsewhere).",
+    )
+    parser.add_argument(
+        "--record-events",
+        type=Path,
+        default=None,
+        help="Record raw player events and match snapshots to this file for replay with `python -m spies.replay`.",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics.",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        type=Path,
+        default=None,
+        help="Write a JSON metrics snapshot to this file every 30 seconds.",
+    )
+    parser.add_argument(
+        "--watchlist-store",
+        choices=("json", "sqlite"),
+        default="json",
+        help="Where the watchlist is kept: spies/watchlist.json, or spies/watchlist.db for very large watchlists (default: json).",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=None,
+        help="Split player subscriptions across N worker processes (for very large watchlists).",
+    )
+    parser.add_argument(
+        "--dispatch",
+        choices=("batch", "event"),
+        default="batch",
+        help="Handle player events once per loop tick with only each player's latest state, or one at a time (default: batch).",
+    )
     parser.add_argument(
         "--task-register",
         action="store_true",
@@ -91,3 +167,44 @@ def handle_task_cli(cli_args) -> int | None:
     if cli_args.task_stop:
         return task_registration.stop_task(task_name=cli_args.task_name)
     return task_registration.show_status(task_name=cli_args.task_name)
+
+
+def handle_tail_cli(cli_args) -> int:
+    """Print (and optionally follow) the watcher log."""
+    from spies.log_reader import LogFilter, parse_since
+    from spies.logging_utils import resolve_written_log_file, tail_logs
+
+    try:
+        since = parse_since(cli_args.since) if cli_args.since else None
+    except ValueError as exc:
+        print(exc)
+        return 2
+    log_filter = LogFilter(
+        player=cli_args.filter_player,
+        status=cli_args.filter_status,
+        match_id=cli_args.filter_match_id,
+        level=cli_args.filter_level,
+        since=since,
+    )
+    # Rather than run the watcher, tail (display) the log file.
+    # Most useful for when a separate process is already running the watcher.
+    return tail_logs(
+        log_file=resolve_written_log_file(),
+        lines=cli_args.tail_lines,
+        follow=not cli_args.no_follow,
+        log_filter=log_filter,
+    )
+
+
+def run(argv=None) -> int:
+    """Parse the command line and run the selected command."""
+    cli_args = build_cli_parser().parse_args(argv)
+    task_cli_result = handle_task_cli(cli_args)
+    if task_cli_result is not None:
+        return task_cli_result
+    if cli_args.tail_logs:
+        return handle_tail_cli(cli_args)
+
+    from spies import spies as runtime
+
+    return runtime.run_from_cli(cli_args)
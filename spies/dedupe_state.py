@@ -0,0 +1,139 @@
+"""Toast dedupe state carried across restarts.
+
+`ToastQueueManager` only alerts once per player, match and status, but that
+memory lives in the process. Without it, every watched player already in a
+lobby or game would be alerted again after a restart, including the logon
+restarts of the scheduled task, and each of those alerts would resolve an
+avatar and render a toast for nothing.
+
+The runtime writes a compact snapshot of the shown toast keys and last-seen
+player states to `spies/dedupe_state.json` every minute and on shutdown, and
+loads it at startup. Toast keys keep their remaining TTL as a wall-clock expiry
+time. A snapshot older than the toast key TTL is ignored.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import suppress
+from pathlib import Path
+
+from spies.toast_queue import DEFAULT_TOAST_KEY_TTL_SECONDS
+
+DEDUPE_STATE_PATH = Path("spies/dedupe_state.json")
+DEFAULT_SAVE_INTERVAL_SECONDS = 60.0
+DEFAULT_MAX_AGE_SECONDS = DEFAULT_TOAST_KEY_TTL_SECONDS
+DEDUPE_STATE_VERSION = 1
+
+logger = logging.getLogger("agekeeper.spies.dedupe_state")
+
+
+def save_dedupe_state(manager, path: Path = DEDUPE_STATE_PATH) -> bool:
+    """Atomically write `manager`'s dedupe state to `path`. Returns False if the write failed."""
+    try:
+        _write_state(path, _snapshot(manager))
+    except OSError as exc:
+        logger.warning("Could not save dedupe state to %s: %s", path, exc)
+        return False
+    return True
+
+
+def _snapshot(manager) -> dict:
+    # Runs on the event loop; only the file write happens in a thread.
+    state = manager.export_dedupe_state()
+    now = time.time()
+    return {
+        "version": DEDUPE_STATE_VERSION,
+        "saved_at": round(now, 1),
+        "toasts": [
+            [player_id, match_id, status, round(now + seconds_left, 1)]
+            for player_id, match_id, status, seconds_left in state["toasts"]
+        ],
+        "players": state["players"],
+    }
+
+
+def _write_state(path: Path, snapshot: dict) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # A unique temporary file, so overlapping writers never share one.
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    except BaseException:
+        with suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+
+async def _write_state_in_thread(path: Path, snapshot: dict) -> None:
+    try:
+        await asyncio.to_thread(_write_state, path, snapshot)
+    except OSError as exc:
+        logger.warning("Could not save dedupe state to %s: %s", path, exc)
+
+
+def load_dedupe_state(
+    manager,
+    path: Path = DEDUPE_STATE_PATH,
+    max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS,
+) -> int:
+    """Restore dedupe state saved by an earlier run. Returns the entries restored.
+
+    A missing, unreadable or stale snapshot restores nothing, so the worst case
+    is the old behaviour of alerting again.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return 0
+    except (OSError, ValueError):
+        print(f"Dedupe state unreadable, starting empty: {path}")
+        return 0
+    if not isinstance(snapshot, dict) or snapshot.get("version") != DEDUPE_STATE_VERSION:
+        return 0
+    now = time.time()
+    if now - snapshot.get("saved_at", 0) > max_age_seconds:
+        return 0
+    try:
+        return manager.import_dedupe_state({
+            "toasts": [
+                [player_id, match_id, status, expires_at - now]
+                for player_id, match_id, status, expires_at in snapshot.get("toasts", ())
+            ],
+            "players": snapshot.get("players", ()),
+        })
+    except (TypeError, ValueError):
+        print(f"Dedupe state malformed, starting empty: {path}")
+        return 0
+
+
+async def save_dedupe_state_periodically(
+    manager,
+    path: Path = DEDUPE_STATE_PATH,
+    interval_seconds: float = DEFAULT_SAVE_INTERVAL_SECONDS,
+) -> None:
+    """Save the dedupe state every `interval_seconds` until cancelled, then once more.
+
+    Failed writes are logged and retried on the next interval.
+    """
+    write = None
+    try:
+        while True:
+            await asyncio.sleep(interval_seconds)
+            write = asyncio.create_task(_write_state_in_thread(path, _snapshot(manager)))
+            # Shielded: cancelling this task must not abandon a write half-way.
+            await asyncio.shield(write)
+    finally:
+        if write is not None and not write.done():
+            # The thread keeps running after cancellation; the final save must land after it.
+            await asyncio.wait({write})
+        save_dedupe_state(manager, path)
@@ -0,0 +1,90 @@
+"""Per-tick batching of subscription events.
+
+`lobby.connect_to_subscriptions` calls its callback once per event. When a
+tournament starts, hundreds of frames arrive together and each one would walk
+the whole per-event path. `EventBatcher` is a drop-in callback that only
+collects events and hands everything received in the current loop tick to a
+batch handler in one call.
+"""
+
+from __future__ import annotations
+
+import asyncio
+
+from spies.metrics import METRICS
+
+DEFAULT_MAX_BATCH_EVENTS = 1_024
+
+DISPATCH_BATCHES = METRICS.counter(
+    "spies_dispatch_batches_total",
+    "Batches handed to the batch handler.",
+)
+DISPATCH_BATCHED_EVENTS = METRICS.counter(
+    "spies_dispatch_batched_events_total",
+    "Subscription events handed to the batch handler.",
+)
+
+
+class EventBatcher:
+    """Subscription callback that delivers events to `dispatch_batch(events)` once per loop tick.
+
+    A batch is also delivered early once it reaches `max_batch_events`, so one
+    very busy tick cannot hold events back without bound. Called outside a
+    running event loop, events are delivered straight away.
+
+    `handle_inline(event)` runs first on each event that arrives while nothing
+    is waiting. When it returns True the event is done and is not batched, so
+    cheap rejections such as the prefilter do not pay for scheduling a flush.
+    Once an event is waiting, later events are batched behind it without the
+    inline check, so they are never handled ahead of it. The first event of
+    every batch is therefore the only one `handle_inline` has already seen.
+    """
+
+    def __init__(self, dispatch_batch, max_batch_events: int = DEFAULT_MAX_BATCH_EVENTS, handle_inline=None):
+        self.dispatch_batch = dispatch_batch
+        self.max_batch_events = max_batch_events
+        self.handle_inline = handle_inline
+        # Plain tallies, read by the counters when metrics are collected.
+        self.batches = 0
+        self.batched_events = 0
+        self._events = []
+        self._flush_handle = None
+        DISPATCH_BATCHES.add_source(self._batch_totals)
+        DISPATCH_BATCHED_EVENTS.add_source(self._event_totals)
+
+    def _batch_totals(self) -> dict:
+        return {(): self.batches}
+
+    def _event_totals(self) -> dict:
+        return {(): self.batched_events}
+
+    def close(self) -> None:
+        """Deliver anything still collected and stop reporting to the metrics."""
+        self.flush()
+        DISPATCH_BATCHES.remove_source(self._batch_totals)
+        DISPATCH_BATCHED_EVENTS.remove_source(self._event_totals)
+
+    def __call__(self, event, **kwargs) -> None:
+        if not self._events and self.handle_inline is not None and self.handle_inline(event):
+            return
+        self._events.append(event)
+        if len(self._events) >= self.max_batch_events:
+            self.flush()
+        elif self._flush_handle is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.flush()
+                return
+            self._flush_handle = loop.call_soon(self.flush)
+
+    def flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._events:
+            return
+        events, self._events = self._events, []
+        self.batches += 1
+        self.batched_events += len(events)
+        self.dispatch_batch(events)
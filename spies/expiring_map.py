@@ -0,0 +1,102 @@
+"""Size- and time-bounded mapping used for long-lived runtime state."""
+
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class ExpiringLRUMap:
+    """Mapping that forgets entries after a TTL or once it exceeds a size cap.
+
+    Writing a key refreshes both its position and its expiry. Reads do not,
+    so entries age out on their own schedule. Expired entries are dropped lazily
+    on access and in bulk whenever the map is written to.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float | None = None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._data: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value) -> None:
+        expires_at = None if self.ttl_seconds is None else self._clock() + self.ttl_seconds
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        self.prune()
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        value, expires_at = item
+        if expires_at is not None and expires_at <= self._clock():
+            del self._data[key]
+            return default
+        return value
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, None)
+        if item is None:
+            return default
+        return item[0]
+
+    def keys(self):
+        return list(self._data.keys())
+
+    def items_with_ttl(self) -> list[tuple]:
+        """Return `(key, value, seconds_left)` for live entries, oldest first.
+
+        `seconds_left` is None when the map has no TTL.
+        """
+        now = self._clock()
+        items = []
+        for key, (value, expires_at) in self._data.items():
+            if expires_at is None:
+                items.append((key, value, None))
+            elif expires_at > now:
+                items.append((key, value, expires_at - now))
+        return items
+
+    def restore(self, key, value, seconds_left: float | None) -> None:
+        """Write an entry that expires after `seconds_left` instead of the full TTL.
+
+        Used to reload saved state. Restore entries in expiry order and before
+        any regular writes, so insertion order keeps matching expiry order.
+        """
+        if self.ttl_seconds is not None and seconds_left is not None:
+            seconds_left = min(seconds_left, self.ttl_seconds)
+            expires_at = self._clock() + seconds_left
+        else:
+            expires_at = None if self.ttl_seconds is None else self._clock() + self.ttl_seconds
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        self.prune()
+
+    def prune(self) -> None:
+        """Drop expired entries from the oldest end, then enforce the size cap."""
+        if self.ttl_seconds is not None:
+            now = self._clock()
+            # Insertion order matches expiry order because every write uses the same TTL.
+            while self._data:
+                _, expires_at = next(iter(self._data.values()))
+                if expires_at > now:
+                    break
+                self._data.popitem(last=False)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
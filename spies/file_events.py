@@ -0,0 +1,137 @@
+"""Wait for changes in a directory without busy polling.
+
+`create_change_waiter` returns an object whose `wait(timeout)` blocks until
+something in the directory changes or the timeout passes. Linux uses inotify
+and Windows uses directory change notifications, both through ctypes so no
+extra dependency is needed. Anything else falls back to sleeping, which
+callers pair with a stat check.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import time
+from pathlib import Path
+
+# inotify_init1 flags and the events that matter for an appended/rotated file.
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_IN_MODIFY = 0x002
+_IN_ATTRIB = 0x004
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_FROM = 0x040
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_INOTIFY_MASK = (
+    _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+)
+
+_FILE_NOTIFY_CHANGE_FILE_NAME = 0x01
+_FILE_NOTIFY_CHANGE_SIZE = 0x08
+_FILE_NOTIFY_CHANGE_LAST_WRITE = 0x10
+_WAIT_OBJECT_0 = 0x0
+_INVALID_HANDLE_VALUE = ctypes.c_void_p(-1).value
+
+
+class PollingWaiter:
+    """Fallback waiter: sleeps for the timeout and reports a possible change."""
+
+    kind = "stat"
+
+    def wait(self, timeout: float) -> bool:
+        time.sleep(timeout)
+        return True
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWaiter:
+    """Linux inotify watch on a directory."""
+
+    kind = "inotify"
+
+    def __init__(self, directory: Path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self._fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self._fd, os.fsencode(directory), _INOTIFY_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+    def wait(self, timeout: float) -> bool:
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return False
+        # Drain queued events; the caller re-checks the file itself.
+        try:
+            while os.read(self._fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class WindowsChangeWaiter:
+    """Windows FindFirstChangeNotification handle on a directory.
+
+    NTFS may report size changes of a file that is still held open lazily, so
+    callers should keep a modest timeout as a safety net.
+    """
+
+    kind = "win32"
+
+    def __init__(self, directory: Path):
+        kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        kernel32.FindFirstChangeNotificationW.restype = ctypes.c_void_p
+        kernel32.FindFirstChangeNotificationW.argtypes = [ctypes.c_wchar_p, ctypes.c_int, ctypes.c_uint32]
+        kernel32.FindNextChangeNotification.argtypes = [ctypes.c_void_p]
+        kernel32.FindCloseChangeNotification.argtypes = [ctypes.c_void_p]
+        kernel32.WaitForSingleObject.argtypes = [ctypes.c_void_p, ctypes.c_uint32]
+        kernel32.WaitForSingleObject.restype = ctypes.c_uint32
+        self._kernel32 = kernel32
+        self._handle = kernel32.FindFirstChangeNotificationW(
+            str(directory),
+            False,
+            _FILE_NOTIFY_CHANGE_FILE_NAME | _FILE_NOTIFY_CHANGE_SIZE | _FILE_NOTIFY_CHANGE_LAST_WRITE,
+        )
+        if self._handle in (None, _INVALID_HANDLE_VALUE):
+            raise ctypes.WinError(ctypes.get_last_error())
+
+    def wait(self, timeout: float) -> bool:
+        result = self._kernel32.WaitForSingleObject(self._handle, int(timeout * 1000))
+        if result != _WAIT_OBJECT_0:
+            return False
+        self._kernel32.FindNextChangeNotification(self._handle)
+        return True
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._kernel32.FindCloseChangeNotification(self._handle)
+            self._handle = None
+
+
+def create_change_waiter(directory: Path, use_notifications: bool = True):
+    """Return the best available change waiter for `directory`."""
+    if use_notifications:
+        try:
+            if sys.platform.startswith("linux"):
+                return InotifyWaiter(directory)
+            if sys.platform == "win32":
+                return WindowsChangeWaiter(directory)
+        except (OSError, AttributeError):
+            # No inotify symbol, watch limit reached, unsupported filesystem...
+            pass
+    return PollingWaiter()
@@ -0,0 +1,387 @@
+"""Reading, filtering and time-indexing of Spies log files for `tail_logs`.
+
+Handles both the plain-text format (`time | LEVEL | logger | message`, where a
+record may continue over several lines) and the JSON-lines format. Recent
+records are found by reading backwards from the end of the file in blocks, and
+`--since` lookups use a small sidecar index (`spies.log.idx`) that maps
+timestamps to byte offsets. `LogFollower` implements follow mode on top of
+filesystem change notifications.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+
+from spies.file_events import create_change_waiter
+
+READ_BLOCK_SIZE = 64 * 1024
+INDEX_STRIDE_BYTES = 64 * 1024
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+TEXT_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DEFAULT_FOLLOW_POLL_SECONDS = 0.5
+DEFAULT_FOLLOW_IDLE_TIMEOUT_SECONDS = 2.0
+
+TEXT_HEADER_RE = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d) \| (\w+) \| ([^|]*?) \| ?(.*)$")
+STATUS_MESSAGE_RE = re.compile(r"^(?P<player>.+)'s status: (?P<status>\S+), matchid: (?P<match_id>\S+)$")
+RELATIVE_SINCE_RE = re.compile(r"^(\d+(?:\.\d+)?)\s*([smhd])$")
+RELATIVE_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_record_header(line: str) -> dict | None:
+    """Return the fields of a record's first line, or None for continuation lines."""
+    if line.startswith("{"):
+        try:
+            fields = json.loads(line)
+        except ValueError:
+            return None
+        return fields if isinstance(fields, dict) else None
+
+    match = TEXT_HEADER_RE.match(line.rstrip("\r\n"))
+    if match is None:
+        return None
+    timestamp, level, logger_name, message = match.groups()
+    fields = {
+        "ts": time.mktime(time.strptime(timestamp, TEXT_TIME_FORMAT)),
+        "level": level,
+        "logger": logger_name,
+        "msg": message,
+    }
+    status_match = STATUS_MESSAGE_RE.match(message)
+    if status_match:
+        fields.update(status_match.groupdict())
+    return fields
+
+
+def parse_since(value: str, now: float | None = None) -> float:
+    """Parse `--since` as a relative age (`30s`, `15m`, `2h`, `1d`) or a local date/time."""
+    value = value.strip()
+    relative = RELATIVE_SINCE_RE.match(value)
+    if relative:
+        amount, unit = relative.groups()
+        return (time.time() if now is None else now) - float(amount) * RELATIVE_UNITS[unit]
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(
+            f"Invalid --since value {value!r}; use e.g. 15m, 2h, 1d or '2024-05-01 18:30'."
+        ) from None
+
+
+class LogFilter:
+    """Record filter on player, status, match id, minimum level and start time."""
+
+    def __init__(self, player=None, status=None, match_id=None, level=None, since: float | None = None):
+        self.player = player.lower() if player else None
+        self.status = status.lower() if status else None
+        self.match_id = str(match_id) if match_id is not None else None
+        self.min_level = logging.getLevelName(level.upper()) if level else None
+        self.since = since
+
+    @property
+    def active(self) -> bool:
+        return any(
+            value is not None
+            for value in (self.player, self.status, self.match_id, self.min_level, self.since)
+        )
+
+    def matches(self, fields: dict) -> bool:
+        if self.since is not None and float(fields.get("ts", 0)) < self.since:
+            return False
+        if self.min_level is not None:
+            level = logging.getLevelName(str(fields.get("level", "")).upper())
+            if not isinstance(level, int) or level < self.min_level:
+                return False
+        if self.player is not None:
+            candidates = (fields.get("player"), fields.get("player_id"))
+            if not any(self.player in str(value).lower() for value in candidates if value):
+                return False
+        if self.status is not None and str(fields.get("status", "")).lower() != self.status:
+            return False
+        if self.match_id is not None and str(fields.get("match_id", "")) != self.match_id:
+            return False
+        return True
+
+
+class RecordPrinter:
+    """Stream lines through a filter, keeping continuation lines with their record."""
+
+    def __init__(self, log_filter: LogFilter, write):
+        self.log_filter = log_filter
+        self.write = write
+        self._current_matches = not log_filter.active
+
+    def feed(self, line: str) -> None:
+        fields = parse_record_header(line)
+        if fields is not None:
+            self._current_matches = self.log_filter.matches(fields)
+        if self._current_matches:
+            self.write(line)
+
+
+def iter_lines_reverse(path: Path, block_size: int = READ_BLOCK_SIZE, end: int | None = None):
+    """Yield the lines of a file from last to first, reading fixed-size blocks from the end."""
+    with open(path, "rb") as handle:
+        position = handle.seek(0, os.SEEK_END) if end is None else end
+        remainder = b""
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            handle.seek(position)
+            block = handle.read(read_size) + remainder
+            lines = block.split(b"\n")
+            remainder = lines.pop(0)
+            for raw in reversed(lines):
+                yield raw.decode("utf-8", errors="replace") + "\n"
+        if remainder:
+            yield remainder.decode("utf-8", errors="replace") + "\n"
+
+
+def read_last_lines(path: Path, count: int) -> list[str]:
+    """Return the last `count` lines without reading the whole file."""
+    if count <= 0:
+        return []
+    size = path.stat().st_size
+    lines = []
+    for line in iter_lines_reverse(path, end=size):
+        lines.append(line)
+        if len(lines) > count:
+            break
+    # A trailing newline produces an empty final "line" that is not a real line.
+    if lines and lines[0] == "\n":
+        lines.pop(0)
+    return list(reversed(lines[:count]))
+
+
+def read_last_records(path: Path, count: int, log_filter: LogFilter) -> list[str]:
+    """Return the lines of the last `count` records that pass `log_filter`.
+
+    Rotated backups are searched newest first when the live file does not hold
+    enough matching records.
+    """
+    if count <= 0:
+        return []
+    records = []
+    for log_path in reversed(rotated_log_files(path)):
+        continuation = []
+        for line in iter_lines_reverse(log_path):
+            if line == "\n" and not continuation:
+                continue
+            fields = parse_record_header(line)
+            if fields is None:
+                continuation.append(line)
+                continue
+            if log_filter.since is not None and float(fields.get("ts", 0)) < log_filter.since:
+                return _flatten_records(records)
+            if log_filter.matches(fields):
+                records.append([line, *reversed(continuation)])
+                if len(records) >= count:
+                    return _flatten_records(records)
+            continuation = []
+    return _flatten_records(records)
+
+
+def _flatten_records(records: list[list[str]]) -> list[str]:
+    return [line for record in reversed(records) for line in record]
+
+
+def rotated_log_files(log_file: Path) -> list[Path]:
+    """Return the log file and its existing rotated backups, oldest first."""
+    backups = []
+    index = 1
+    while (candidate := log_file.with_name(f"{log_file.name}.{index}")).exists():
+        backups.append(candidate)
+        index += 1
+    files = list(reversed(backups))
+    if log_file.exists():
+        files.append(log_file)
+    return files
+
+
+def remove_orphan_indexes(log_file: Path) -> None:
+    """Delete sidecar indexes whose log file has rotated away."""
+    log_file = Path(log_file)
+    for index_path in log_file.parent.glob(f"{log_file.name}*{INDEX_SUFFIX}"):
+        if not index_path.with_name(index_path.name[: -len(INDEX_SUFFIX)]).exists():
+            try:
+                index_path.unlink()
+            except OSError:
+                pass
+
+
+class LogOffsetIndex:
+    """Sidecar index of (timestamp, byte offset) pairs for one log file.
+
+    A point is recorded roughly every `stride` bytes, so seeking to a time means
+    one small scan after a lookup. The index is extended incrementally as the
+    log grows, and rebuilt when the file was rotated or truncated (detected by
+    its first line changing or its size shrinking).
+    """
+
+    def __init__(self, log_file: Path, stride: int = INDEX_STRIDE_BYTES):
+        self.log_file = Path(log_file)
+        self.index_path = self.log_file.with_name(self.log_file.name + INDEX_SUFFIX)
+        self.stride = stride
+        self.points: list[list[float]] = []
+        self.indexed_bytes = 0
+        self.head = ""
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except (OSError, ValueError):
+            return
+        if raw.get("version") != INDEX_VERSION:
+            return
+        self.points = raw.get("points", [])
+        self.indexed_bytes = raw.get("indexed_bytes", 0)
+        self.head = raw.get("head", "")
+
+    def _save(self) -> None:
+        payload = {
+            "version": INDEX_VERSION,
+            "head": self.head,
+            "indexed_bytes": self.indexed_bytes,
+            "points": self.points,
+        }
+        try:
+            tmp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, separators=(",", ":"))
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            # Read-only log directories simply go without a persisted index.
+            pass
+
+    def _read_head(self, handle) -> str:
+        handle.seek(0)
+        return handle.readline(256).decode("utf-8", errors="replace")
+
+    def update(self) -> None:
+        """Extend (or rebuild) the index to cover the whole file."""
+        with open(self.log_file, "rb") as handle:
+            size = handle.seek(0, os.SEEK_END)
+            head = self._read_head(handle)
+            if head != self.head or size < self.indexed_bytes:
+                self.points, self.indexed_bytes, self.head = [], 0, head
+            if size == self.indexed_bytes:
+                return
+
+            handle.seek(self.indexed_bytes)
+            offset = self.indexed_bytes
+            next_point = self.points[-1][1] + self.stride if self.points else 0
+            for raw in handle:
+                if not raw.endswith(b"\n"):
+                    break
+                if offset >= next_point:
+                    fields = parse_record_header(raw.decode("utf-8", errors="replace"))
+                    if fields is not None and "ts" in fields:
+                        self.points.append([float(fields["ts"]), offset])
+                        next_point = offset + self.stride
+                offset += len(raw)
+            self.indexed_bytes = offset
+        self._save()
+
+    def offset_for(self, since: float) -> int:
+        """Return a byte offset at or before the first record logged at `since`."""
+        self.update()
+        offset = 0
+        for timestamp, point_offset in self.points:
+            if timestamp >= since:
+                break
+            offset = int(point_offset)
+        return offset
+
+
+def print_records_since(log_file: Path, log_filter: LogFilter, write) -> None:
+    """Write every record since `log_filter.since` across the log and its backups."""
+    remove_orphan_indexes(log_file)
+    for path in rotated_log_files(log_file):
+        index = LogOffsetIndex(path)
+        start = index.offset_for(log_filter.since)
+        printer = RecordPrinter(log_filter, write)
+        with open(path, "r", encoding="utf-8", errors="replace", newline="") as handle:
+            handle.seek(start)
+            for line in handle:
+                printer.feed(line)
+
+
+class LogFollower:
+    """Follow a log file across rotations, reading new data in large chunks.
+
+    The follower sleeps on filesystem change notifications when they are
+    available (with `idle_timeout` as a safety net) and otherwise re-checks
+    every `poll_interval`. When the path starts naming a different file, or
+    the file shrinks, whatever is left in the old handle is read first and the
+    new file is then read from the beginning, so no records are lost.
+    """
+
+    def __init__(
+        self,
+        log_file: Path,
+        printer: RecordPrinter,
+        poll_interval: float = DEFAULT_FOLLOW_POLL_SECONDS,
+        idle_timeout: float = DEFAULT_FOLLOW_IDLE_TIMEOUT_SECONDS,
+        chunk_size: int = READ_BLOCK_SIZE,
+        use_notifications: bool = True,
+    ):
+        self.log_file = Path(log_file)
+        self.printer = printer
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.chunk_size = chunk_size
+        self.use_notifications = use_notifications
+        self.rotations = 0
+        self._partial = b""
+
+    def follow(self, start_offset: int) -> None:
+        """Print new records until interrupted."""
+        waiter = create_change_waiter(self.log_file.parent, self.use_notifications)
+        timeout = self.poll_interval if waiter.kind == "stat" else self.idle_timeout
+        handle = open(self.log_file, "rb")
+        try:
+            handle.seek(min(start_offset, os.fstat(handle.fileno()).st_size))
+            while True:
+                self._read_available(handle)
+                if self._was_replaced(handle):
+                    # Anything written before the rename is still in the old file.
+                    self._read_available(handle)
+                    self._flush_partial()
+                    handle.close()
+                    handle = open(self.log_file, "rb")
+                    self.rotations += 1
+                    continue
+                waiter.wait(timeout)
+        finally:
+            handle.close()
+            waiter.close()
+
+    def _read_available(self, handle) -> None:
+        while chunk := handle.read(self.chunk_size):
+            lines = (self._partial + chunk).split(b"\n")
+            # The last piece has no newline yet; the writer may still be mid-record.
+            self._partial = lines.pop()
+            for raw in lines:
+                self.printer.feed(raw.decode("utf-8", errors="replace") + "\n")
+
+    def _flush_partial(self) -> None:
+        if self._partial:
+            self.printer.feed(self._partial.decode("utf-8", errors="replace") + "\n")
+            self._partial = b""
+
+    def _was_replaced(self, handle) -> bool:
+        try:
+            current = self.log_file.stat()
+        except FileNotFoundError:
+            # Mid-rotation: keep reading the old handle until the new file appears.
+            return False
+        opened = os.fstat(handle.fileno())
+        return current.st_ino != opened.st_ino or current.st_size < handle.tell()
@@ -2,13 +2,208 @@
 
 from __future__ import annotations
 
+import atexit
+import json
 import logging
 import os
-import time
-from collections import deque
-from logging.handlers import RotatingFileHandler
+import queue
+import threading
+from logging.handlers import QueueHandler, RotatingFileHandler
 from pathlib import Path
 
+from spies.log_reader import (
+    DEFAULT_FOLLOW_POLL_SECONDS,
+    TEXT_TIME_FORMAT,
+    LogFilter,
+    LogFollower,
+    RecordPrinter,
+    print_records_since,
+    read_last_lines,
+    read_last_records,
+)
+from spies.metrics import METRICS
+
+DEFAULT_LOG_QUEUE_SIZE = 10_000
+DEFAULT_LOG_BATCH_SIZE = 256
+OVERFLOW_POLICIES = ("drop_new", "drop_oldest", "block")
+LOG_FORMATS = ("text", "json")
+FALLBACK_LOG_FILE = Path(__file__).resolve().parent / "logs" / "spies.log"
+
+LOG_RECORDS_DROPPED = METRICS.counter(
+    "spies_log_records_dropped_total",
+    "Log records discarded because the log queue was full.",
+)
+
+_active_listeners: list[BatchingLogListener] = []
+
+
+class _DeferredFlushMixin:
+    """Let a listener hold back per-record flushes until a batch is written."""
+
+    defer_flush = False
+
+    def flush(self):
+        if not self.defer_flush:
+            super().flush()
+
+
+class BatchedRotatingFileHandler(_DeferredFlushMixin, RotatingFileHandler):
+    pass
+
+
+class BatchedStreamHandler(_DeferredFlushMixin, logging.StreamHandler):
+    pass
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Format each record as one JSON object per line.
+
+    Structured fields passed through `extra=` (player, player_id, status,
+    match_id) are kept as top-level keys so `tail_logs` can filter on them.
+    """
+
+    EXTRA_FIELDS = ("player", "player_id", "status", "match_id")
+
+    def format(self, record):
+        payload = {
+            "ts": round(record.created, 3),
+            "time": self.formatTime(record, TEXT_TIME_FORMAT),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in self.EXTRA_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                payload[field] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class BoundedQueueHandler(QueueHandler):
+    """Queue handler that applies an overflow policy when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue, overflow: str = "drop_new"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown log overflow policy: {overflow}")
+        super().__init__(log_queue)
+        self.overflow = overflow
+        self.dropped = 0
+
+    def enqueue(self, record):
+        if self.overflow == "block":
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if self.overflow == "drop_oldest":
+            try:
+                self.queue.get_nowait()
+                self.queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                pass
+        self.dropped += 1
+        LOG_RECORDS_DROPPED.inc()
+
+
+class BatchingLogListener:
+    """Background thread that owns the real handlers and writes records in batches.
+
+    When `logger` is given, `stop` hands the real handlers back to it, so records
+    logged after shutdown (atexit hooks, late threads) are written directly
+    instead of waiting on a queue nobody reads.
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        log_queue: queue.Queue,
+        handlers,
+        batch_size: int = DEFAULT_LOG_BATCH_SIZE,
+        logger: logging.Logger | None = None,
+    ):
+        self.queue = log_queue
+        self.handlers = list(handlers)
+        self.batch_size = batch_size
+        self.logger = logger
+        self._thread = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="spies-log-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = self._write_batch(batch)
+            if stopping:
+                return
+
+    def _write_batch(self, batch) -> bool:
+        stopping = False
+        for handler in self.handlers:
+            handler.defer_flush = True
+        try:
+            for record in batch:
+                if record is self._STOP:
+                    stopping = True
+                    continue
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+        finally:
+            for handler in self.handlers:
+                handler.defer_flush = False
+                handler.flush()
+        return stopping
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Write everything still queued, then stop the thread."""
+        if self._thread is None:
+            return
+        # Always enqueue the sentinel, even when the queue is full.
+        self.queue.put(self._STOP)
+        self._thread.join(timeout)
+        self._thread = None
+        if self.logger is None:
+            for handler in self.handlers:
+                handler.close()
+            return
+        for handler in list(self.logger.handlers):
+            if isinstance(handler, QueueHandler) and handler.queue is self.queue:
+                self.logger.removeHandler(handler)
+        for handler in self.handlers:
+            self.logger.addHandler(handler)
+        # Records that reached the queue after the thread's last batch; draining
+        # also releases any caller blocked on a full queue.
+        leftover = []
+        while True:
+            try:
+                leftover.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if leftover:
+            self._write_batch(leftover)
+
+
+def shutdown_logging() -> None:
+    """Flush and stop every queued logging listener. Safe to call more than once."""
+    while _active_listeners:
+        _active_listeners.pop().stop()
+
+
+atexit.register(shutdown_logging)
+
 
 def resolve_log_file() -> Path:
     override_dir = os.getenv("AGEKEEPER_LOG_DIR")
@@ -19,14 +214,46 @@ def resolve_log_file() -> Path:
     if programdata:
         return Path(programdata) / "AgeKeeper" / "logs" / "spies.log"
 
-    return Path(__file__).resolve().parent / "logs" / "spies.log"
+    return FALLBACK_LOG_FILE
+
+
+def resolve_written_log_file() -> Path:
+    """Return the log file a running watcher writes to, without configuring logging.
+
+    Mirrors `configure_rotating_logger`: the preferred file unless it could not
+    be created, in which case the package fallback is used.
+    """
+    preferred = resolve_log_file()
+    if not preferred.exists() and FALLBACK_LOG_FILE.exists():
+        return FALLBACK_LOG_FILE
+    return preferred
+
+
+def resolve_log_format() -> str:
+    """Return the log file format from `AGEKEEPER_LOG_FORMAT` (`text` or `json`)."""
+    log_format = (os.getenv("AGEKEEPER_LOG_FORMAT") or "text").strip().lower()
+    return log_format if log_format in LOG_FORMATS else "text"
 
 
 def configure_rotating_logger(
     logger_name: str,
     preferred_log_file: Path,
     fallback_log_file: Path,
+    queued: bool = False,
+    queue_size: int = DEFAULT_LOG_QUEUE_SIZE,
+    overflow: str = "drop_new",
+    log_format: str = "text",
 ) -> tuple[logging.Logger, Path]:
+    """Attach rotating file and console handlers to `logger_name`.
+
+    With `queued=True`, the logger only enqueues records; a background listener
+    owns the handlers and writes records in batches. At most `queue_size` records
+    are buffered, and `overflow` decides what happens when the buffer is full
+    (`drop_new`, `drop_oldest` or `block`). Queued records are flushed at exit or
+    by `shutdown_logging()`, after which the logger writes to its handlers
+    directly. `log_format="json"` writes the file as JSON lines; the console
+    always gets plain text.
+    """
     logger = logging.getLogger(logger_name)
     if logger.handlers:
         return logger, preferred_log_file
@@ -34,13 +261,13 @@ def configure_rotating_logger(
     logger.setLevel(logging.INFO)
     formatter = logging.Formatter(
         "%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-        "%Y-%m-%d %H:%M:%S",
+        TEXT_TIME_FORMAT,
     )
 
     effective_log_file = preferred_log_file
     try:
         effective_log_file.parent.mkdir(parents=True, exist_ok=True)
-        file_handler = RotatingFileHandler(
+        file_handler = BatchedRotatingFileHandler(
             effective_log_file,
             maxBytes=1_000_000,
             backupCount=5,
@@ -48,7 +275,7 @@ def configure_rotating_logger(
         )
     except OSError:
         fallback_log_file.parent.mkdir(parents=True, exist_ok=True)
-        file_handler = RotatingFileHandler(
+        file_handler = BatchedRotatingFileHandler(
             fallback_log_file,
             maxBytes=1_000_000,
             backupCount=5,
@@ -56,12 +283,19 @@ def configure_rotating_logger(
         )
         effective_log_file = fallback_log_file
 
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-
-    console_handler = logging.StreamHandler()
+    file_handler.setFormatter(JsonLinesFormatter() if log_format == "json" else formatter)
+    console_handler = BatchedStreamHandler()
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+
+    if queued:
+        log_queue = queue.Queue(maxsize=queue_size)
+        listener = BatchingLogListener(log_queue, [file_handler, console_handler], logger=logger)
+        listener.start()
+        _active_listeners.append(listener)
+        logger.addHandler(BoundedQueueHandler(log_queue, overflow=overflow))
+    else:
+        logger.addHandler(file_handler)
+        logger.addHandler(console_handler)
 
     logger.propagate = False
     return logger, effective_log_file
@@ -71,8 +305,17 @@ def tail_logs(
     log_file: Path,
     lines: int = 100,
     follow: bool = True,
-    poll_interval: float = 0.5,
+    poll_interval: float = DEFAULT_FOLLOW_POLL_SECONDS,
+    log_filter: LogFilter | None = None,
 ) -> int:
+    """Print recent log records and optionally follow new ones.
+
+    Without filters the last `lines` lines are printed. With filters, the last
+    `lines` matching records are printed instead, or every matching record since
+    `log_filter.since` when a start time is given. Follow mode keeps applying the
+    filter, waits on filesystem change notifications (falling back to polling
+    every `poll_interval` seconds) and carries on into the new file on rotation.
+    """
     if lines < 0:
         print("--tail-lines must be >= 0")
         return 2
@@ -81,22 +324,26 @@ def tail_logs(
         print(f"Log file does not exist yet: {log_file}")
         return 1
 
+    log_filter = log_filter or LogFilter()
+
+    def write(line: str) -> None:
+        print(line, end="", flush=True)
+
     try:
-        with log_file.open("r", encoding="utf-8", errors="replace") as handle:
-            if lines > 0:
-                for line in deque(handle, maxlen=lines):
-                    print(line, end="")
-            else:
-                handle.seek(0, os.SEEK_END)
-
-            if not follow:
-                return 0
-
-            while True:
-                line = handle.readline()
-                if line:
-                    print(line, end="", flush=True)
-                    continue
-                time.sleep(poll_interval)
+        start_offset = log_file.stat().st_size
+        if log_filter.since is not None:
+            print_records_since(log_file, log_filter, write)
+            start_offset = log_file.stat().st_size
+        elif log_filter.active:
+            for line in read_last_records(log_file, lines, log_filter):
+                write(line)
+        else:
+            for line in read_last_lines(log_file, lines):
+                write(line)
+
+        if not follow:
+            return 0
+        LogFollower(log_file, RecordPrinter(log_filter, write), poll_interval=poll_interval).follow(start_offset)
     except KeyboardInterrupt:
         return 0
+    return 0
@@ -0,0 +1,287 @@
+"""In-process counters, gauges and histograms for the watcher runtime.
+
+Metrics are registered on the module-level `METRICS` registry and can be served
+as Prometheus text over a local HTTP endpoint, or written periodically to a
+JSON snapshot file. All metric updates are thread-safe and cheap enough for the
+event hot path.
+"""
+
+from __future__ import annotations
+
+import bisect
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import suppress
+from pathlib import Path
+
+DEFAULT_METRICS_HOST = "127.0.0.1"
+DEFAULT_SNAPSHOT_INTERVAL_SECONDS = 30.0
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 12.0, 30.0)
+
+logger = logging.getLogger("agekeeper.spies.metrics")
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, labelvalues) -> str:
+    if not labelnames:
+        return ""
+    pairs = (f'{name}="{_escape_label_value(value)}"' for name, value in zip(labelnames, labelvalues))
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    """Monotonic counter, optionally split by label values."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+        self._sources = []
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def add_source(self, read) -> None:
+        """Also count the totals returned by `read()` as `{labelvalues: total}`.
+
+        For paths too hot for `inc`: they keep plain integer tallies, which are
+        only read when metrics are collected.
+        """
+        with self._lock:
+            self._sources.append(read)
+
+    def remove_source(self, read) -> None:
+        """Stop reading `read`, keeping the totals it reported so far."""
+        totals = read()
+        with self._lock:
+            if read not in self._sources:
+                return
+            self._sources.remove(read)
+            for labels, total in totals.items():
+                self._values[labels] = self._values.get(labels, 0.0) + total
+
+    def _collect(self) -> dict[tuple, float]:
+        with self._lock:
+            values = dict(self._values)
+            sources = list(self._sources)
+        for read in sources:
+            for labels, total in read().items():
+                values[labels] = values.get(labels, 0.0) + total
+        return values
+
+    def value(self, *labelvalues) -> float:
+        if self._sources:
+            return self._collect().get(labelvalues, 0.0)
+        return self._values.get(labelvalues, 0.0)
+
+    def render(self) -> list[str]:
+        items = sorted(self._collect().items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value}" for labels, value in items]
+
+    def snapshot(self):
+        values = self._collect()
+        if not self.labelnames:
+            return values.get((), 0.0)
+        return {",".join(map(str, labels)): value for labels, value in values.items()}
+
+
+class Gauge:
+    """Point-in-time value read from a callback when metrics are collected."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, read=None):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+
+    def _current(self):
+        if self.read is None:
+            return None
+        try:
+            return float(self.read())
+        except Exception:
+            return None
+
+    def render(self) -> list[str]:
+        value = self._current()
+        return [] if value is None else [f"{self.name} {value}"]
+
+    def snapshot(self):
+        return self._current()
+
+
+class Histogram:
+    """Cumulative-bucket histogram of observed durations (seconds)."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "count": self._count,
+                "sum": self._sum,
+                "buckets": dict(zip(map(str, (*self.buckets, "+Inf")), self._counts)),
+            }
+
+
+class MetricsRegistry:
+    """Named collection of metrics."""
+
+    def __init__(self):
+        self._metrics: dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, buckets=DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets))
+
+    def gauge(self, name: str, help_text: str, read=None) -> Gauge:
+        """Register a gauge, or point an existing one at a new `read` callback."""
+        gauge = self._register(Gauge(name, help_text, read))
+        if read is not None:
+            gauge.read = read
+        return gauge
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {"timestamp": time.time(), "metrics": {metric.name: metric.snapshot() for metric in metrics}}
+
+
+METRICS = MetricsRegistry()
+
+
+def start_metrics_server(port: int, host: str = DEFAULT_METRICS_HOST, registry: MetricsRegistry = METRICS):
+    """Serve `registry` as Prometheus text at http://host:port/metrics on a daemon thread."""
+    # Imported here: every module defines its metrics at import, including the
+    # light CLI paths that never serve them.
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="spies-metrics", daemon=True)
+    thread.start()
+    return server
+
+
+def write_snapshot(path: Path, registry: MetricsRegistry = METRICS) -> None:
+    """Atomically write a JSON snapshot of `registry` to `path`."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # A unique temporary file, so the final write never shares one with a periodic write.
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(registry.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+
+def _write_snapshot_logged(path: Path, registry: MetricsRegistry) -> None:
+    try:
+        write_snapshot(path, registry)
+    except OSError as exc:
+        logger.warning("Could not write metrics snapshot to %s: %s", path, exc)
+
+
+async def write_snapshots_periodically(
+    path: Path,
+    interval_seconds: float = DEFAULT_SNAPSHOT_INTERVAL_SECONDS,
+    registry: MetricsRegistry = METRICS,
+) -> None:
+    """Write a snapshot every `interval_seconds` until cancelled, then once more.
+
+    Failed writes are logged and retried on the next interval.
+    """
+    import asyncio
+
+    write = None
+    try:
+        while True:
+            write = asyncio.create_task(asyncio.to_thread(_write_snapshot_logged, path, registry))
+            # Shielded: cancelling this task must not abandon a write half-way.
+            await asyncio.shield(write)
+            await asyncio.sleep(interval_seconds)
+    finally:
+        if write is not None and not write.done():
+            # The thread keeps running after cancellation; the final write must land after it.
+            await asyncio.wait({write})
+        _write_snapshot_logged(path, registry)
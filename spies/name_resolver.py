@@ -0,0 +1,141 @@
+"""Batched, cached profile ID <-> username resolution for the watchlist."""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+RESOLUTION_CACHE_PATH = Path("spies/resolution_cache.json")
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_MAX_CONCURRENT_BATCHES = 4
+DEFAULT_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+
+
+class NameResolver:
+    """Resolve missing usernames/IDs in batches, backed by a persistent TTL cache.
+
+    Lookups are split into `batch_size` chunks and up to `max_concurrent_batches`
+    chunks run at once. Successful results are cached in both directions, so a
+    restart resolves already-known players without any network round-trips.
+    The lookup functions default to `aoe2api` and can be swapped for stubs.
+    """
+
+    def __init__(
+        self,
+        get_usernames_from_ids=None,
+        get_ids_from_usernames=None,
+        cache_path: Path | None = RESOLUTION_CACHE_PATH,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_concurrent_batches: int = DEFAULT_MAX_CONCURRENT_BATCHES,
+        ttl_seconds: float = DEFAULT_CACHE_TTL_SECONDS,
+    ):
+        if get_usernames_from_ids is None or get_ids_from_usernames is None:
+            from aoe2api import aoe2api
+
+            get_usernames_from_ids = get_usernames_from_ids or aoe2api.get_usernames_from_ids
+            get_ids_from_usernames = get_ids_from_usernames or aoe2api.get_ids_from_usernames
+        self.get_usernames_from_ids = get_usernames_from_ids
+        self.get_ids_from_usernames = get_ids_from_usernames
+        self.cache_path = cache_path
+        self.batch_size = max(1, batch_size)
+        self.max_concurrent_batches = max(1, max_concurrent_batches)
+        self.ttl_seconds = ttl_seconds
+
+        self._username_by_id: dict[str, list] = {}
+        self._id_by_username: dict[str, list] = {}
+        self._dirty = False
+        self._load_cache()
+
+    def _load_cache(self) -> None:
+        if self.cache_path is None:
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            print(f"Resolution cache unreadable, starting empty: {self.cache_path}")
+            return
+        if isinstance(raw, dict):
+            self._username_by_id = dict(raw.get("usernames", {}))
+            self._id_by_username = dict(raw.get("ids", {}))
+
+    def save_cache(self) -> None:
+        """Persist the cache if anything changed since it was loaded."""
+        if self.cache_path is None or not self._dirty:
+            return
+        payload = {"version": 1, "usernames": self._username_by_id, "ids": self._id_by_username}
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.cache_path.with_name(self.cache_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, separators=(",", ":"))
+        os.replace(tmp_path, self.cache_path)
+        self._dirty = False
+
+    def _cached(self, table: dict, key: str, now: float):
+        record = table.get(key)
+        if record is None or now - record[1] > self.ttl_seconds:
+            return None
+        return record[0]
+
+    def _remember(self, profile_id: str, username: str, now: float) -> None:
+        self._username_by_id[profile_id] = [username, now]
+        self._id_by_username[username.lower()] = [profile_id, now]
+        self._dirty = True
+
+    def _run_batches(self, lookup, keys: list) -> list:
+        batches = [keys[i:i + self.batch_size] for i in range(0, len(keys), self.batch_size)]
+        if len(batches) == 1:
+            batch_results = [lookup(batches[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrent_batches, len(batches))) as pool:
+                batch_results = list(pool.map(lookup, batches))
+
+        results = []
+        for batch, batch_result in zip(batches, batch_results):
+            batch_result = list(batch_result or [])
+            # Keep results aligned with keys even if a batch comes back short.
+            results.extend(batch_result + [None] * (len(batch) - len(batch_result)))
+        return results
+
+    def usernames_for_ids(self, profile_ids) -> dict[str, str]:
+        """Return `{profile_id: username}` for every ID that could be resolved."""
+        now = time.time()
+        resolved = {}
+        missing = []
+        for profile_id in dict.fromkeys(str(pid) for pid in profile_ids):
+            username = self._cached(self._username_by_id, profile_id, now)
+            if username:
+                resolved[profile_id] = username
+            else:
+                missing.append(profile_id)
+
+        if missing:
+            for profile_id, username in zip(missing, self._run_batches(self.get_usernames_from_ids, missing)):
+                if username:
+                    resolved[profile_id] = username
+                    self._remember(profile_id, username, now)
+        return resolved
+
+    def ids_for_usernames(self, usernames) -> dict[str, str]:
+        """Return `{username: profile_id}` for every username that could be resolved."""
+        now = time.time()
+        resolved = {}
+        missing = []
+        for username in dict.fromkeys(usernames):
+            profile_id = self._cached(self._id_by_username, username.lower(), now)
+            if profile_id:
+                resolved[username] = profile_id
+            else:
+                missing.append(username)
+
+        if missing:
+            for username, profile_id in zip(missing, self._run_batches(self.get_ids_from_usernames, missing)):
+                if profile_id:
+                    resolved[username] = str(profile_id)
+                    self._remember(str(profile_id), username, now)
+        return resolved
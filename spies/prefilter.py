@@ -0,0 +1,200 @@
+"""Cheap rejection of redundant player status frames before full parsing.
+
+Most frames on a busy "players" subscription repeat a player's current state or
+describe a player nobody is watching. `PlayerStatusPrefilter` keeps a small
+table keyed by the raw player ID and answers from it without calling
+`lobby.get_response_type` or `extract_player_status_update`.
+
+The frame layout belongs to the lobby client, so the filter does not hard-code
+it. After the real parser has handled a frame, the filter finds where the
+parsed player ID, status and match ID appear in the raw frame and keeps those
+key paths. A layout is only used once it has matched several frames with
+different values, so a field that equals the status or match ID by coincidence
+is not mistaken for it. After that the paths are checked again against every
+frame that goes through the full parse, and they are dropped as soon as they
+disagree. That includes one in `verify_every` of the frames the filter would
+reject, so a layout that went wrong is noticed even while it keeps calling
+frames repeats. Frames the paths cannot read are always fully parsed.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from operator import itemgetter
+
+from spies.metrics import METRICS
+
+DEFAULT_MAX_PLAYERS = 100_000
+MAX_SEARCH_DEPTH = 3
+MAX_LEARN_ATTEMPTS = 32
+LEARN_CONFIRMATIONS = 3
+DEFAULT_VERIFY_EVERY = 16
+
+# Verdict for frames about players that are not on the watchlist.
+UNTRACKED = object()
+
+EVENTS_PREFILTERED = METRICS.counter(
+    "spies_events_prefiltered_total",
+    "Frames rejected before full parsing, by reason.",
+    labelnames=("reason",),
+)
+
+
+def _find_path(event, target: str):
+    """Return the key path of the first scalar in `event` whose text is `target`."""
+    queue = deque([(event, ())])
+    while queue:
+        node, path = queue.popleft()
+        if isinstance(node, dict):
+            children = node.items()
+        elif isinstance(node, list):
+            children = enumerate(node)
+        else:
+            continue
+        for key, value in children:
+            if isinstance(value, (str, int)) and not isinstance(value, bool):
+                if str(value) == target:
+                    return path + (key,)
+            elif len(path) + 1 < MAX_SEARCH_DEPTH:
+                queue.append((value, path + (key,)))
+    return None
+
+
+def _compile_getter(paths):
+    """Build a function returning the raw values at `paths` in one frame."""
+    prefix = paths[0][:-1]
+    if all(path[:-1] == prefix for path in paths):
+        # Fields side by side in one object: a single C call reads all three.
+        read_fields = itemgetter(*(path[-1] for path in paths))
+        if not prefix:
+            return read_fields
+        if len(prefix) == 1:
+            (key,) = prefix
+            return lambda event: read_fields(event[key])
+
+    def get(event):
+        values = []
+        for path in paths:
+            node = event
+            for key in path:
+                node = node[key]
+            values.append(node)
+        return tuple(values)
+
+    return get
+
+
+class PlayerStatusPrefilter:
+    """Reject duplicate and untracked player status frames from a raw-ID table.
+
+    `check(event)` returns None when the frame must be parsed, `UNTRACKED` for
+    a player that is not watched, or the cached `(player_id, status, match_id)`
+    when the frame repeats the player's last known state. After parsing a frame,
+    callers report it with `record`.
+    """
+
+    def __init__(self, max_players: int = DEFAULT_MAX_PLAYERS, verify_every: int = DEFAULT_VERIFY_EVERY):
+        self.max_players = max_players
+        self.verify_every = verify_every
+        self.enabled = True
+        # Plain tallies; EVENTS_PREFILTERED reads them when metrics are collected.
+        self.duplicates = 0
+        self.untracked = 0
+        # raw player ID -> (raw status, raw match ID, parsed status tuple) or UNTRACKED
+        self._table = {}
+        self._paths = None
+        self._getter = None
+        # Paths found but not yet confirmed by LEARN_CONFIRMATIONS frames.
+        self._candidate_getter = None
+        self._confirmations = 0
+        self._last_confirmed = None
+        self._learn_attempts = 0
+        self._until_verify = verify_every
+        EVENTS_PREFILTERED.add_source(self._rejected_totals)
+
+    def close(self) -> None:
+        """Stop reporting to `EVENTS_PREFILTERED`, keeping the totals counted so far."""
+        EVENTS_PREFILTERED.remove_source(self._rejected_totals)
+
+    def _rejected_totals(self) -> dict:
+        return {("duplicate",): self.duplicates, ("untracked",): self.untracked}
+
+    @property
+    def learned(self) -> bool:
+        return self._getter is not None
+
+    def check(self, event):
+        getter = self._getter
+        if getter is None or not self.enabled:
+            return None
+        try:
+            player_id, status, match_id = getter(event)
+            seen = self._table.get(player_id)
+        except (LookupError, TypeError):
+            return None
+        if seen is None:
+            return None
+        if seen is not UNTRACKED and (seen[0] != status or seen[1] != match_id):
+            return None
+        self._until_verify -= 1
+        if not self._until_verify:
+            # Parse this one anyway; `record` re-checks the layout against it.
+            self._until_verify = self.verify_every
+            return None
+        if seen is UNTRACKED:
+            self.untracked += 1
+            return UNTRACKED
+        self.duplicates += 1
+        return seen[2]
+
+    def record(self, event, parsed_status, tracked: bool) -> None:
+        """Remember the state of a fully parsed player status frame."""
+        if not self.enabled:
+            return
+        getter = self._getter or self._candidate_getter
+        if getter is None:
+            self._learn(event, parsed_status)
+            return
+        try:
+            raw = getter(event)
+        except (LookupError, TypeError):
+            return
+        if tuple(map(str, raw)) != tuple(map(str, parsed_status)):
+            # This frame does not match the learned layout; stop trusting it.
+            self._forget_layout()
+            return
+        if self._getter is None:
+            if parsed_status != self._last_confirmed:
+                self._confirmations += 1
+                self._last_confirmed = parsed_status
+            if self._confirmations < LEARN_CONFIRMATIONS:
+                return
+            self._getter = getter
+        if len(self._table) >= self.max_players:
+            self._table.clear()
+        player_id, status, match_id = raw
+        self._table[player_id] = (status, match_id, parsed_status) if tracked else UNTRACKED
+
+    def _learn(self, event, parsed_status) -> None:
+        if self._learn_attempts >= MAX_LEARN_ATTEMPTS or None in parsed_status:
+            return
+        self._learn_attempts += 1
+        paths = tuple(_find_path(event, str(value)) for value in parsed_status)
+        if None in paths or len(set(paths)) != len(paths):
+            return
+        self._paths = paths
+        self._candidate_getter = _compile_getter(paths)
+        self._confirmations = 1
+        self._last_confirmed = parsed_status
+
+    def _forget_layout(self) -> None:
+        self._paths = None
+        self._getter = None
+        self._candidate_getter = None
+        self._confirmations = 0
+        self._last_confirmed = None
+        self._table.clear()
+
+    def clear(self) -> None:
+        """Drop remembered states, e.g. after the watchlist changed."""
+        self._table.clear()
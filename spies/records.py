@@ -0,0 +1,144 @@
+"""Compact record types for watchlist entries, toast payloads and dedupe keys.
+
+Large watchlists and busy event streams keep many of these alive at once, so
+they use `__slots__` (or tuples) rather than per-instance dicts. Profile IDs and
+statuses are interned so every record and key for a player shares one string.
+"""
+
+from __future__ import annotations
+
+import sys
+from typing import NamedTuple
+
+_JSON_FIELDS = (("userName", "user_name"), ("profileid", "profile_id"), ("avatar_filepath", "avatar_filepath"))
+
+
+def intern_id(value) -> str:
+    """Return `value` as an interned string."""
+    return sys.intern(value if type(value) is str else str(value))
+
+
+class ToastKey(NamedTuple):
+    """Dedupe key for one toast: a player in one match with one status."""
+
+    player_id: str
+    match_id: str
+    status: str
+
+
+class WatchlistEntry:
+    """One watched player.
+
+    `to_json` returns the same JSON object `from_json` was given, apart from
+    the normalisations the watchlist has always applied: IDs become strings,
+    a missing avatar becomes the default and fields resolved at runtime replace
+    explicit nulls. Unknown fields are kept in `extra`.
+    """
+
+    __slots__ = ("profile_id", "user_name", "avatar_filepath", "extra")
+
+    def __init__(self, profile_id=None, user_name=None, avatar_filepath=None, extra=None):
+        self.profile_id = profile_id
+        self.user_name = user_name
+        self.avatar_filepath = avatar_filepath
+        self.extra = extra
+
+    @classmethod
+    def from_json(cls, item, default_avatar_path: str) -> WatchlistEntry | None:
+        """Build an entry from a watchlist item (object, ID string or ID number)."""
+        if isinstance(item, (int, str)):
+            return cls(intern_id(item), None, default_avatar_path)
+        if not isinstance(item, dict):
+            return None
+        fields = dict(item)
+        entry = cls()
+        for json_name, attribute in _JSON_FIELDS:
+            # Explicit nulls stay in `extra` so they round-trip unchanged.
+            if fields.get(json_name) is not None:
+                setattr(entry, attribute, fields.pop(json_name))
+        if entry.profile_id is not None:
+            entry.profile_id = intern_id(entry.profile_id)
+        if not entry.avatar_filepath:
+            fields.pop("avatar_filepath", None)
+            entry.avatar_filepath = default_avatar_path
+        entry.extra = fields or None
+        return entry
+
+    def to_json(self) -> dict:
+        item = {}
+        for json_name, attribute in _JSON_FIELDS:
+            value = getattr(self, attribute)
+            if value is not None:
+                item[json_name] = value
+        if self.extra:
+            # An explicit null in `extra` only survives while the field is still unset.
+            item.update((json_name, value) for json_name, value in self.extra.items() if json_name not in item)
+        return item
+
+    def update_from(self, other: WatchlistEntry) -> None:
+        """Refresh fields from a reloaded entry, keeping the runtime-managed avatar."""
+        self.profile_id = other.profile_id
+        self.user_name = other.user_name
+        self.extra = other.extra
+
+    def __eq__(self, other):
+        if not isinstance(other, WatchlistEntry):
+            return NotImplemented
+        return self.to_json() == other.to_json()
+
+    def __repr__(self) -> str:
+        return f"WatchlistEntry({self.to_json()!r})"
+
+
+class QueuedToast:
+    """State the render queue attaches to anything it renders."""
+
+    __slots__ = ("enqueued_at", "after")
+
+    # Set only on summaries; a future resolved once the summary has rendered.
+    rendered = None
+
+    def __init__(self):
+        self.enqueued_at = 0.0
+        self.after = None
+
+
+class ToastPayload(QueuedToast):
+    """Everything a render worker needs to show one player's toast."""
+
+    __slots__ = ("player_name", "match", "status", "avatar_filepath", "civ_name", "left_match", "key")
+
+    def __init__(
+        self,
+        player_name: str,
+        match,
+        status: str,
+        avatar_filepath: str,
+        civ_name: str | None = None,
+        left_match: bool = False,
+    ):
+        super().__init__()
+        self.player_name = player_name
+        self.match = match
+        self.status = status
+        self.avatar_filepath = avatar_filepath
+        self.civ_name = civ_name
+        self.left_match = left_match
+        self.key = None
+
+    @property
+    def keys(self):
+        return (self.key,) if self.key is not None else ()
+
+
+class SummaryPayload(QueuedToast):
+    """One toast standing in for a burst of player payloads."""
+
+    __slots__ = ("payloads", "keys", "player_ids", "rendered")
+
+    def __init__(self, payloads):
+        super().__init__()
+        self.payloads = payloads
+        self.keys = ()
+        self.player_ids = ()
+        self.rendered = None
@@ -0,0 +1,842 @@
+"""Record, replay, and benchmark the spy event pipeline.
+
+A recording is a JSON-lines file (gzip-compressed when the name ends in `.gz`).
+The first line holds the watchlist that was active; every later line is either
+a raw subscription event (`{"t": offset, "e": event}`) or the first snapshot of
+a match the runtime looked up (`{"t": offset, "s": status, "m": match}`).
+
+Replaying feeds the events through `spies.spies.spy` into a real
+`ToastQueueManager`, with the match books, avatar downloads and toaster swapped
+for local stand-ins, so the whole pipeline can run headless at real-time,
+accelerated or maximum speed::
+
+    agekeeper-spies --record-events spies-events.jsonl.gz
+    python -m spies.replay spies-events.jsonl.gz --speed 0
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import functools
+import gzip
+import json
+import logging
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+RECORDING_VERSION = 1
+DRAIN_TIMEOUT_SECONDS = 30.0
+STATE_GROWTH_CHECKPOINTS = 4
+STATE_GROWTH_CHUNK_EVENTS = 1_000
+
+
+def _open_recording(path: Path, mode: str):
+    if str(path).endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class EventRecorder:
+    """Append raw subscription events and match snapshots to a recording."""
+
+    def __init__(self, path: Path, watchlist_entries):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._handle = _open_recording(self.path, "w")
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._seen_matches = set()
+        players = [
+            {"profileid": entry.profile_id, "userName": entry.user_name}
+            for entry in watchlist_entries
+        ]
+        self._write({"version": RECORDING_VERSION, "watchlist": players})
+
+    def _write(self, record: dict) -> None:
+        line = json.dumps(record, default=str, separators=(",", ":"))
+        with self._lock:
+            self._handle.write(line + "\n")
+
+    def _offset(self) -> float:
+        return round(time.monotonic() - self._start, 6)
+
+    def record_event(self, event) -> None:
+        self._write({"t": self._offset(), "e": event})
+
+    def record_match(self, status: str, match) -> None:
+        """Record a match the first time it is seen for a status."""
+        key = (status, str(match.get("matchid")))
+        if key in self._seen_matches:
+            return
+        self._seen_matches.add(key)
+        self._write({"t": self._offset(), "s": status, "m": match})
+
+    def wrap_dispatch(self, dispatch):
+        """Return a subscription callback that records each event before dispatching it."""
+        def recording_dispatch(event, **kwargs):
+            self.record_event(event)
+            return dispatch(event, **kwargs)
+        return recording_dispatch
+
+    def close(self) -> None:
+        with self._lock:
+            self._handle.close()
+
+
+def load_recording(path: Path) -> tuple[list[dict], list[dict]]:
+    """Return `(watchlist_entries, records)` from a recording file."""
+    with _open_recording(Path(path), "r") as handle:
+        header = json.loads(handle.readline() or "{}")
+        records = [json.loads(line) for line in handle if line.strip()]
+    if header.get("version") != RECORDING_VERSION:
+        raise ValueError(f"Unsupported recording version: {header.get('version')}")
+    return header.get("watchlist", []), records
+
+
+async def replay_records(
+    records, dispatch, match_book: dict, speed: float = 0.0, events_per_tick: int = 1
+) -> int:
+    """Feed records into `dispatch` and `match_book`, returning the event count.
+
+    `speed` scales the recorded timing (1.0 is real-time, 10.0 is ten times
+    faster); 0 replays as fast as possible. By default every event gets its own
+    loop tick, as it would when arriving from a socket one frame at a time;
+    `events_per_tick` delivers bursts, as when many frames are read at once.
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    event_count = 0
+    for record in records:
+        if speed > 0:
+            delay = start + record["t"] / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        if "m" in record:
+            match_book[(record["s"], str(record["m"].get("matchid")))] = record["m"]
+            continue
+        dispatch(record["e"])
+        event_count += 1
+        if event_count % events_per_tick == 0:
+            await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    return event_count
+
+
+class _OfflineAvatarFetcher:
+    """Avatar fetcher stand-in that never touches the network."""
+
+    def fetch(self, url, download, on_complete=None) -> bool:
+        return False
+
+    def shutdown(self, wait: bool = False) -> None:
+        pass
+
+
+def _percentile(samples, fraction: float):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def _peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in KiB on Linux and bytes on macOS.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _prepare_runtime(watchlist_entries, sink_name: str, with_logging: bool):
+    """Point the runtime module at a scratch watchlist, offline avatars and `sink_name`."""
+    from spies import spies as runtime
+    from spies.avatar_cache import AvatarCache
+    from spies.prefilter import PlayerStatusPrefilter
+    from spies.records import WatchlistEntry
+    from spies.sinks import create_sink
+    from spies.watchlist import Watchlist
+
+    if not with_logging:
+        runtime.logger.setLevel(logging.WARNING)
+
+    scratch_dir = Path(tempfile.mkdtemp(prefix="spies-replay-"))
+    runtime.watchlist = Watchlist(scratch_dir / "watchlist.json")
+    entries = (WatchlistEntry.from_json(entry, runtime.default_avatar_path) for entry in watchlist_entries)
+    runtime.watchlist.by_id = {entry.profile_id: entry for entry in entries if entry and entry.profile_id}
+    runtime.avatar_cache = AvatarCache(scratch_dir / "avatars")
+    runtime.avatar_fetcher = _OfflineAvatarFetcher()
+    # A fresh filter per run, so earlier runs neither warm it nor add to its counts.
+    runtime.status_prefilter.close()
+    runtime.status_prefilter = PlayerStatusPrefilter()
+    runtime.notification_sink = create_sink(sink_name, runtime.logger)
+    runtime.notification_sink.preload_audio(runtime.toast_templates.audio_path)
+    return runtime
+
+
+async def run_benchmark(
+    recording_path: Path,
+    speed: float = 0.0,
+    render_workers: int | None = None,
+    sink_name: str = "memory",
+    with_logging: bool = False,
+    prefilter: bool = True,
+    dispatch_mode: str = "batch",
+    events_per_tick: int = 1,
+) -> dict:
+    """Replay a recording through the runtime pipeline and return metrics.
+
+    `prefilter=False` sends every frame through full parsing, for comparison.
+    `dispatch_mode="batch"` goes through `EventBatcher` and `spy_batch` as the
+    runtime does by default; "event" calls `spy` for every event.
+    """
+    from spies.dispatch import EventBatcher
+    from spies.toast_queue import DEFAULT_RENDER_WORKERS, ToastQueueManager
+
+    watchlist_entries, records = load_recording(recording_path)
+    runtime = _prepare_runtime(watchlist_entries, sink_name, with_logging)
+    runtime.status_prefilter.enabled = prefilter
+
+    match_book = {}
+    event_times = {}
+    latencies = []
+    current_event_time = [0.0]
+
+    def get_match(status: str, match_id, print_match_count: bool = False):
+        return match_book.get((status, str(match_id)))
+
+    def timed_status_logger(player_id: str, status: str, match_id) -> None:
+        event_times[(str(player_id), str(match_id))] = current_event_time[0]
+        runtime._log_player_status_update(player_id, status, match_id)
+
+    def timed_display(payload) -> None:
+        runtime._display_toast_payload(payload)
+        now = time.perf_counter()
+        for key in payload.keys:
+            started = event_times.pop((key[0], key[1]), None)
+            if started is not None:
+                latencies.append(now - started)
+
+    def timed_spy(event) -> None:
+        current_event_time[0] = time.perf_counter()
+        runtime.spy(event)
+
+    # In batch mode, latency is measured from the first event of each batch.
+    batch_started = [None]
+
+    def timed_spy_batch(events) -> None:
+        current_event_time[0] = batch_started[0]
+        batch_started[0] = None
+        runtime.spy_batch(events)
+
+    def timed_prefiltered(event) -> bool:
+        # The runtime's inline hook; an event it leaves starts the timed batch.
+        if runtime._prefiltered(event):
+            return True
+        batch_started[0] = time.perf_counter()
+        return False
+
+    batcher = EventBatcher(timed_spy_batch, handle_inline=timed_prefiltered)
+    dispatch = batcher if dispatch_mode == "batch" else timed_spy
+
+    manager = ToastQueueManager(
+        get_match=get_match,
+        build_toast_payload=runtime._build_toast_payload,
+        display_payload=timed_display,
+        status_logger=timed_status_logger,
+        build_summary_payload=runtime._build_summary_payload,
+        render_workers=render_workers or DEFAULT_RENDER_WORKERS,
+    )
+    runtime.toast_queue_manager = manager
+    manager.start()
+
+    started = time.perf_counter()
+    event_count = await replay_records(records, dispatch, match_book, speed=speed, events_per_tick=events_per_tick)
+    batcher.close()
+    dispatch_seconds = time.perf_counter() - started
+
+    # Let waiting toasts, aggregation windows and render workers settle.
+    drain_deadline = time.perf_counter() + DRAIN_TIMEOUT_SECONDS
+    while time.perf_counter() < drain_deadline and (
+        manager.pending_by_match or manager.queue_depth or manager._aggregate_buffer
+    ):
+        await asyncio.sleep(0.05)
+    await asyncio.gather(*(queue.join() for queue in manager.render_queues))
+    total_seconds = time.perf_counter() - started
+    await manager.stop()
+    runtime.notification_sink.close()
+    audio_backend = getattr(runtime.notification_sink, "audio_backend", None)
+
+    return {
+        "events": event_count,
+        "prefiltered": runtime.status_prefilter.duplicates + runtime.status_prefilter.untracked,
+        "toasts": len(latencies),
+        "alert_sounds": len(audio_backend.play_times) if audio_backend is not None else None,
+        "dispatch_seconds": dispatch_seconds,
+        "total_seconds": total_seconds,
+        "events_per_second": event_count / dispatch_seconds if dispatch_seconds else None,
+        "latency_p50_ms": _ms(_percentile(latencies, 0.50)),
+        "latency_p99_ms": _ms(_percentile(latencies, 0.99)),
+        "peak_rss_bytes": _peak_rss_bytes(),
+    }
+
+
+def run_toast_microbenchmark(recording_path: Path, iterations: int = 20_000, sink_name: str = "memory") -> dict:
+    """Time building and rendering single-player toasts, bypassing the queue.
+
+    Each iteration builds a payload for a (player, match) pair taken from the
+    recording and renders it, as a render worker would. Match-slot and civ-name
+    lookups are counted so redundant lookups show up next to the timing.
+    """
+    from lobby import lobby
+    from lobby.utils import extract_player_status_update
+
+    watchlist_entries, records = load_recording(recording_path)
+    runtime = _prepare_runtime(watchlist_entries, sink_name, with_logging=False)
+
+    matches = {}
+    pairs = []
+    for record in records:
+        if "m" in record:
+            matches[(record["s"], str(record["m"].get("matchid")))] = record["m"]
+            continue
+        parsed = extract_player_status_update(record["e"])
+        if parsed is None:
+            continue
+        player_id, status, match_id = parsed
+        match = matches.get((status, str(match_id)))
+        if match is not None and runtime.watchlist.get_entry(player_id) is not None:
+            pairs.append((player_id, status, match_id, match))
+    if not pairs:
+        raise ValueError("Recording has no watched player status events with match snapshots.")
+
+    lookups = {"slot": 0, "civ": 0}
+    original_get_player_slot = lobby.get_player_slot
+    original_get_civ_name = lobby.get_civ_name
+
+    def counted_get_player_slot(*args, **kwargs):
+        lookups["slot"] += 1
+        return original_get_player_slot(*args, **kwargs)
+
+    def counted_get_civ_name(*args, **kwargs):
+        lookups["civ"] += 1
+        return original_get_civ_name(*args, **kwargs)
+
+    original_cached_civ_name = runtime._cached_civ_name
+    lobby.get_player_slot = counted_get_player_slot
+    lobby.get_civ_name = counted_get_civ_name
+    # The runtime caches civ names; a fresh cache makes its misses count too.
+    runtime._cached_civ_name = functools.lru_cache(maxsize=None)(counted_get_civ_name)
+    try:
+        started = time.perf_counter()
+        for index in range(iterations):
+            player_id, status, match_id, match = pairs[index % len(pairs)]
+            payload = runtime._build_toast_payload(player_id, match, status, match_id)
+            runtime._display_toast_payload(payload)
+        elapsed = time.perf_counter() - started
+    finally:
+        lobby.get_player_slot = original_get_player_slot
+        lobby.get_civ_name = original_get_civ_name
+        runtime._cached_civ_name = original_cached_civ_name
+        runtime.notification_sink.close()
+
+    return {
+        "toasts": iterations,
+        "seconds": elapsed,
+        "microseconds_per_toast": elapsed / iterations * 1_000_000,
+        "slot_lookups_per_toast": lookups["slot"] / iterations,
+        "civ_lookups_per_toast": lookups["civ"] / iterations,
+    }
+
+
+def _replay_shard_worker(events_by_shard, start_barrier, shard_index, profile_ids, updates_queue, control_queue) -> None:
+    """Shard worker target that replays recorded events instead of subscribing."""
+    from lobby import lobby
+    from lobby.utils import extract_player_status_update
+    from spies.shards import ShardForwarder
+
+    events = events_by_shard[shard_index]
+
+    async def replay() -> None:
+        forwarder = ShardForwarder(shard_index, updates_queue.put, lobby.get_response_type, extract_player_status_update)
+        for event in events:
+            forwarder.dispatch(event)
+            await asyncio.sleep(0)
+        forwarder.close()
+
+    start_barrier.wait()
+    asyncio.run(replay())
+    # Stay up until the supervisor stops us so it does not restart this worker.
+    while control_queue.get() is not None:
+        pass
+
+
+async def run_shard_benchmark(recording_path: Path, shards: int) -> dict:
+    """Replay a recording through `shards` shard workers and time the forwarding.
+
+    Events are split by the shard of the player they describe, as the live
+    subscriptions would be, and each worker parses and forwards its share to
+    this process through `ShardSupervisor`. Only parsing and forwarding are
+    timed; alerts are not rendered.
+    """
+    import multiprocessing
+
+    from lobby.utils import extract_player_status_update
+    from spies.shards import ShardSupervisor, shard_for
+
+    watchlist_entries, records = load_recording(recording_path)
+    events_by_shard = [[] for _ in range(shards)]
+    for record in records:
+        if "e" not in record:
+            continue
+        parsed = extract_player_status_update(record["e"])
+        shard_index = shard_for(parsed[0], shards) if parsed is not None else 0
+        events_by_shard[shard_index].append(record["e"])
+    event_count = sum(len(events) for events in events_by_shard)
+
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    counts = {"events": 0, "updates": 0}
+
+    def on_response_types(response_types) -> None:
+        counts["events"] += sum(response_types.values())
+        if counts["events"] >= event_count and not done.done():
+            done.set_result(None)
+
+    def on_updates(updates) -> None:
+        counts["updates"] += sum(1 for update in updates if update[3])
+
+    start_barrier = multiprocessing.get_context("spawn").Barrier(shards + 1)
+    supervisor = ShardSupervisor(
+        shards,
+        on_updates,
+        on_response_types=on_response_types,
+        worker_target=functools.partial(_replay_shard_worker, events_by_shard, start_barrier),
+    )
+    profile_ids = [entry["profileid"] for entry in watchlist_entries if entry.get("profileid")]
+    supervisor.start(profile_ids)
+    try:
+        # Workers start replaying together once every process has spawned.
+        await asyncio.to_thread(start_barrier.wait)
+        started = time.perf_counter()
+        if event_count:
+            await asyncio.wait_for(done, DRAIN_TIMEOUT_SECONDS)
+        elapsed = time.perf_counter() - started
+    finally:
+        await supervisor.stop()
+
+    return {
+        "shards": shards,
+        "events": event_count,
+        "updates_forwarded": counts["updates"],
+        "seconds": elapsed,
+        "events_per_second": event_count / elapsed if elapsed else None,
+        "largest_shard_events": max(len(events) for events in events_by_shard),
+    }
+
+
+async def run_memory_benchmark(entries: int = 50_000, events: int = 100_000, store: str = "json") -> dict:
+    """Measure memory held by a synthetic watchlist and per-event queue state.
+
+    Writes an `entries`-player watchlist, loads it through `Watchlist` (from
+    JSON, or from a SQLite store imported beforehand when `store` is "sqlite"), then
+    feeds `events` status updates for those players into a `ToastQueueManager`
+    whose render workers are not started, so every payload stays queued.
+    Sizes come from tracemalloc; no network, recording or `lobby` is needed.
+    """
+    import tracemalloc
+
+    from spies.records import ToastPayload
+    from spies.toast_queue import ToastQueueManager
+    from spies.watchlist import DEFAULT_AVATAR_PATH, Watchlist
+
+    scratch_dir = Path(tempfile.mkdtemp(prefix="spies-memory-"))
+    watchlist_path = scratch_dir / "watchlist.json"
+    with open(watchlist_path, "w", encoding="utf-8") as handle:
+        json.dump(
+            [
+                {"userName": f"player{index}", "profileid": str(10_000_000 + index), "avatar_filepath": DEFAULT_AVATAR_PATH}
+                for index in range(entries)
+            ],
+            handle,
+        )
+
+    def traced_blocks() -> int:
+        return sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+
+    watchlist_store = None
+    if store == "sqlite":
+        from spies.watchlist_store import SqliteWatchlistStore, import_json
+
+        watchlist_store = SqliteWatchlistStore(scratch_dir / "watchlist.db")
+        import_json(watchlist_store, watchlist_path)
+
+    tracemalloc.start()
+    load_started = time.perf_counter()
+    watchlist = Watchlist(watchlist_path, store=watchlist_store)
+    watchlist.load_index()
+    load_seconds = time.perf_counter() - load_started
+    watchlist_bytes, _ = tracemalloc.get_traced_memory()
+    watchlist_blocks = traced_blocks()
+
+    match = {"matchid": 1, "description": "benchmark", "slots_taken": 2}
+
+    def build_toast_payload(player_id, match, status, match_id):
+        entry = watchlist.get_entry(player_id)
+        return ToastPayload(entry.user_name, match, status, entry.avatar_filepath, "Britons")
+
+    manager = ToastQueueManager(
+        get_match=lambda status, match_id, print_match_count=False: match,
+        build_toast_payload=build_toast_payload,
+        display_payload=lambda payload: None,
+    )
+    profile_ids = list(watchlist.by_id)
+    statuses = ("lobby", "spectate")
+    before_bytes, _ = tracemalloc.get_traced_memory()
+    before_blocks = traced_blocks()
+    started = time.perf_counter()
+    for index in range(events):
+        # Fresh strings per event, as parsed JSON would produce.
+        player_id = str(int(profile_ids[index % len(profile_ids)]))
+        manager.handle_player_status_update(player_id, statuses[index % 2], str(index))
+    elapsed = time.perf_counter() - started
+    after_bytes, _ = tracemalloc.get_traced_memory()
+    after_blocks = traced_blocks()
+    tracemalloc.stop()
+
+    if watchlist_store is not None:
+        watchlist_store.close()
+
+    return {
+        "entries": entries,
+        "events": events,
+        "store": store,
+        "watchlist_load_seconds": load_seconds,
+        "watchlist_bytes": watchlist_bytes,
+        "watchlist_bytes_per_entry": watchlist_bytes / entries if entries else None,
+        "watchlist_blocks_per_entry": watchlist_blocks / entries if entries else None,
+        "retained_bytes_per_event": (after_bytes - before_bytes) / events if events else None,
+        "retained_blocks_per_event": (after_blocks - before_blocks) / events if events else None,
+        "microseconds_per_event": elapsed / events * 1_000_000 if events else None,
+        "peak_rss_bytes": _peak_rss_bytes(),
+    }
+
+
+async def run_state_growth_benchmark(events: int = 200_000, players: int | None = None) -> dict:
+    """Check that the toast queue's dedupe state stays bounded over a long stream.
+
+    Feeds `events` status updates from `players` players, each for a new match,
+    into a `ToastQueueManager` whose render workers are running, so every update
+    creates a toast key that is rendered and then kept only as dedupe state.
+    `players` defaults to twice the last-seen state cap, so both dedupe maps
+    fill up. Traced memory is sampled at `STATE_GROWTH_CHECKPOINTS` evenly
+    spaced points; once the maps reach their caps it should stop growing.
+    """
+    import gc
+    import tracemalloc
+
+    from spies.records import ToastPayload
+    from spies.toast_queue import DEFAULT_MAX_TRACKED_PLAYERS, ToastQueueManager
+
+    if players is None:
+        players = 2 * DEFAULT_MAX_TRACKED_PLAYERS
+
+    match = {"matchid": 1, "description": "benchmark", "slots_taken": 2}
+    manager = ToastQueueManager(
+        get_match=lambda status, match_id, print_match_count=False: match,
+        build_toast_payload=lambda player_id, match, status, match_id: ToastPayload(
+            f"player{player_id}", match, status, "avatar.png", "Britons"
+        ),
+        display_payload=lambda payload: None,
+    )
+    manager.start()
+    statuses = ("lobby", "spectate")
+    checkpoint_every = max(1, events // STATE_GROWTH_CHECKPOINTS)
+    checkpoints = []
+    tracemalloc.start()
+    started = time.perf_counter()
+    for index in range(events):
+        manager.handle_player_status_update(str(10_000_000 + index % players), statuses[index % 2], str(index))
+        done = index + 1
+        if done % STATE_GROWTH_CHUNK_EVENTS == 0 or done == events:
+            # Let the render workers catch up so queued payloads do not count as state.
+            await asyncio.gather(*(queue.join() for queue in manager.render_queues))
+        if done % checkpoint_every == 0 or done == events:
+            gc.collect()
+            traced_bytes, _ = tracemalloc.get_traced_memory()
+            checkpoints.append({"events": done, "traced_bytes": traced_bytes})
+    elapsed = time.perf_counter() - started
+    tracemalloc.stop()
+    toast_keys = len(manager.toast_status_by_key)
+    tracked_players = len(manager.last_seen_state_by_player)
+    await manager.stop()
+
+    # Measured over the second half, after both maps have filled and settled.
+    first, last = checkpoints[(len(checkpoints) - 1) // 2], checkpoints[-1]
+    later_events = last["events"] - first["events"]
+    return {
+        "events": events,
+        "players": players,
+        "checkpoints": checkpoints,
+        "growth_bytes_per_event": (last["traced_bytes"] - first["traced_bytes"]) / later_events if later_events else None,
+        "toast_keys": toast_keys,
+        "max_toast_keys": manager.toast_status_by_key.max_entries,
+        "tracked_players": tracked_players,
+        "max_tracked_players": manager.last_seen_state_by_player.max_entries,
+        "microseconds_per_event": elapsed / events * 1_000_000,
+        "peak_rss_bytes": _peak_rss_bytes(),
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000.0
+
+
+def format_report(report: dict) -> str:
+    def fmt(value, unit=""):
+        return "n/a" if value is None else f"{value:,.2f}{unit}"
+
+    peak_rss = report["peak_rss_bytes"]
+    return "\n".join([
+        f"Events replayed:   {report['events']:,}",
+        f"Prefiltered:       {report['prefiltered']:,}",
+        f"Toasts rendered:   {report['toasts']:,}",
+        f"Alert sounds:      {'n/a' if report['alert_sounds'] is None else format(report['alert_sounds'], ',')}",
+        f"Dispatch time:     {fmt(report['dispatch_seconds'], 's')}",
+        f"Total time:        {fmt(report['total_seconds'], 's')}",
+        f"Throughput:        {fmt(report['events_per_second'], ' events/s')}",
+        f"Event->toast p50:  {fmt(report['latency_p50_ms'], ' ms')}",
+        f"Event->toast p99:  {fmt(report['latency_p99_ms'], ' ms')}",
+        f"Peak RSS:          {fmt(None if peak_rss is None else peak_rss / 1_048_576, ' MiB')}",
+    ])
+
+
+def format_toast_report(report: dict) -> str:
+    return "\n".join([
+        f"Toasts built:      {report['toasts']:,}",
+        f"Total time:        {report['seconds']:,.2f}s",
+        f"Per toast:         {report['microseconds_per_toast']:,.1f} us",
+        f"Slot lookups:      {report['slot_lookups_per_toast']:.2f} per toast",
+        f"Civ lookups:       {report['civ_lookups_per_toast']:.4f} per toast",
+    ])
+
+
+def format_shard_report(report: dict) -> str:
+    return "\n".join([
+        f"Shard workers:     {report['shards']}",
+        f"Events replayed:   {report['events']:,} (largest shard {report['largest_shard_events']:,})",
+        f"Updates forwarded: {report['updates_forwarded']:,}",
+        f"Total time:        {report['seconds']:,.2f}s",
+        f"Throughput:        {'n/a' if report['events_per_second'] is None else format(report['events_per_second'], ',.2f')} events/s",
+    ])
+
+
+def format_memory_report(report: dict) -> str:
+    peak_rss = report["peak_rss_bytes"]
+    return "\n".join([
+        f"Watchlist entries: {report['entries']:,} ({report['store']})",
+        f"Watchlist load:    {report['watchlist_load_seconds'] * 1000:,.1f} ms (traced)",
+        f"Watchlist memory:  {report['watchlist_bytes'] / 1_048_576:,.2f} MiB "
+        f"({report['watchlist_bytes_per_entry']:,.0f} B, {report['watchlist_blocks_per_entry']:.1f} blocks per entry)",
+        f"Events:            {report['events']:,}",
+        f"Retained/event:    {report['retained_bytes_per_event']:,.0f} B, {report['retained_blocks_per_event']:.1f} blocks",
+        f"Per event:         {report['microseconds_per_event']:,.1f} us (traced)",
+        f"Peak RSS:          {'n/a' if peak_rss is None else format(peak_rss / 1_048_576, ',.2f')} MiB",
+    ])
+
+
+def format_state_growth_report(report: dict) -> str:
+    peak_rss = report["peak_rss_bytes"]
+    growth = report["growth_bytes_per_event"]
+    lines = [f"Events:            {report['events']:,} from {report['players']:,} players"]
+    lines.extend(
+        f"  after {checkpoint['events']:>10,}: {checkpoint['traced_bytes'] / 1_048_576:,.2f} MiB traced"
+        for checkpoint in report["checkpoints"]
+    )
+    lines.extend([
+        f"Growth/event:      {'n/a' if growth is None else format(growth, ',.2f')} B over the second half",
+        f"Toast keys:        {report['toast_keys']:,} (cap {report['max_toast_keys']:,})",
+        f"Tracked players:   {report['tracked_players']:,} (cap {report['max_tracked_players']:,})",
+        f"Per event:         {report['microseconds_per_event']:,.1f} us (traced)",
+        f"Peak RSS:          {'n/a' if peak_rss is None else format(peak_rss / 1_048_576, ',.2f')} MiB",
+    ])
+    return "\n".join(lines)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    from spies.sinks import SINK_CHOICES
+
+    parser = argparse.ArgumentParser(
+        description="Replay a recorded Spies event stream through the alert pipeline and report throughput."
+    )
+    parser.add_argument("recording", type=Path, nargs="?", help="Recording made with --record-events.")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=0.0,
+        help="Replay speed multiplier; 1 is real-time, 0 is as fast as possible (default: 0).",
+    )
+    parser.add_argument(
+        "--render-workers",
+        type=int,
+        default=None,
+        help="Toast render workers (default: the runtime default).",
+    )
+    parser.add_argument(
+        "--sink",
+        choices=SINK_CHOICES,
+        default="memory",
+        help="Notification sink receiving replayed alerts (default: memory).",
+    )
+    parser.add_argument(
+        "--with-logging",
+        action="store_true",
+        help="Keep runtime INFO logging enabled while replaying.",
+    )
+    parser.add_argument(
+        "--no-prefilter",
+        action="store_true",
+        help="Fully parse every frame instead of rejecting repeated and unwatched ones early.",
+    )
+    parser.add_argument(
+        "--dispatch",
+        choices=("batch", "event"),
+        default="batch",
+        help="Hand each loop tick's events to spy_batch, as the runtime does, or call spy per event (default: batch).",
+    )
+    parser.add_argument(
+        "--burst",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Deliver N events per loop tick, as when many frames arrive together (default: 1).",
+    )
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        default=None,
+        metavar="FRAMES",
+        help="Generate a recording of FRAMES synthetic player frames and replay it with an offline lobby stand-in "
+        "(no lobby client or live recording needed). A given recording path receives the generated file.",
+    )
+    parser.add_argument(
+        "--toasts",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Instead of replaying, build and render N single-player toasts from the recording and report the cost per toast.",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Instead of replaying through the alert pipeline, split events across N shard worker processes and report forwarding throughput.",
+    )
+    parser.add_argument(
+        "--memory",
+        type=int,
+        default=None,
+        metavar="ENTRIES",
+        help="Instead of replaying, measure memory for a synthetic watchlist of ENTRIES players (no recording needed).",
+    )
+    parser.add_argument(
+        "--memory-events",
+        type=int,
+        default=100_000,
+        help="Status updates fed through the toast queue with --memory (default: 100000).",
+    )
+    parser.add_argument(
+        "--memory-store",
+        choices=("json", "sqlite"),
+        default="json",
+        help="Watchlist storage measured with --memory (default: json).",
+    )
+    parser.add_argument(
+        "--state-growth",
+        type=int,
+        default=None,
+        metavar="EVENTS",
+        help="Instead of replaying, feed EVENTS updates for new matches through the toast queue and sample memory "
+        "to check that dedupe state stays bounded (no recording needed).",
+    )
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    return parser
+
+
+def main() -> int:
+    args = build_parser().parse_args()
+    if args.speed < 0:
+        print("--speed must be >= 0")
+        return 2
+    if args.burst < 1:
+        print("--burst must be >= 1")
+        return 2
+    if args.memory is not None:
+        if args.memory <= 0 or args.memory_events <= 0:
+            print("--memory and --memory-events must be > 0")
+            return 2
+        report = asyncio.run(run_memory_benchmark(args.memory, args.memory_events, args.memory_store))
+        print(json.dumps(report, indent=2) if args.json else format_memory_report(report))
+        return 0
+    if args.state_growth is not None:
+        if args.state_growth <= 0:
+            print("--state-growth must be > 0")
+            return 2
+        report = asyncio.run(run_state_growth_benchmark(args.state_growth))
+        print(json.dumps(report, indent=2) if args.json else format_state_growth_report(report))
+        return 0
+    if args.synthetic is not None:
+        if args.synthetic <= 0:
+            print("--synthetic must be > 0")
+            return 2
+        if args.shards is not None:
+            # Shard workers are separate processes and would load the real lobby client.
+            print("--synthetic cannot be combined with --shards")
+            return 2
+        from spies.replay_synthetic import install_offline_lobby, write_synthetic_recording
+
+        install_offline_lobby()
+        if args.recording is None:
+            args.recording = Path(tempfile.mkdtemp(prefix="spies-synthetic-")) / "synthetic.jsonl"
+        write_synthetic_recording(args.recording, args.synthetic)
+    if args.recording is None:
+        print("A recording is required unless --memory, --state-growth or --synthetic is given.")
+        return 2
+    if args.toasts is not None:
+        if args.toasts <= 0:
+            print("--toasts must be > 0")
+            return 2
+        report = run_toast_microbenchmark(args.recording, iterations=args.toasts, sink_name=args.sink)
+        print(json.dumps(report, indent=2) if args.json else format_toast_report(report))
+        return 0
+    if args.shards is not None:
+        if args.shards <= 0:
+            print("--shards must be > 0")
+            return 2
+        report = asyncio.run(run_shard_benchmark(args.recording, args.shards))
+        print(json.dumps(report, indent=2) if args.json else format_shard_report(report))
+        return 0
+    report = asyncio.run(
+        run_benchmark(
+            args.recording,
+            speed=args.speed,
+            render_workers=args.render_workers,
+            sink_name=args.sink,
+            with_logging=args.with_logging,
+            prefilter=not args.no_prefilter,
+            dispatch_mode=args.dispatch,
+            events_per_tick=args.burst,
+        )
+    )
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
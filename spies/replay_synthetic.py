@@ -0,0 +1,129 @@
+"""Synthetic recordings and an offline lobby client for `spies.replay --synthetic`.
+
+Benchmarks normally replay a recording made with `--record-events`, which needs
+a live lobby connection and the `agekeeper` lobby client. `--synthetic FRAMES`
+generates a reproducible recording instead and replays it with the stand-in
+lobby modules below, so runs such as `--no-prefilter` can be compared anywhere.
+
+The synthetic frames only imitate the shape of a "players" status frame. The
+stand-in parser reads that shape and nothing else, so timings show the cost of
+the Spies pipeline, not of the real lobby client.
+"""
+
+from __future__ import annotations
+
+import json
+import random
+import sys
+import types
+from pathlib import Path
+
+DEFAULT_WATCHED_PLAYERS = 500
+DEFAULT_OTHER_PLAYERS = 5_000
+DEFAULT_MATCHES = 200
+# Share of frames about watched players, and chance a frame changes the player's state.
+WATCHED_SHARE = 0.5
+STATE_CHANGE_CHANCE = 0.05
+
+
+def write_synthetic_recording(
+    path: Path,
+    frames: int,
+    watched_players: int = DEFAULT_WATCHED_PLAYERS,
+    other_players: int = DEFAULT_OTHER_PLAYERS,
+    matches: int = DEFAULT_MATCHES,
+    seed: int = 1,
+) -> None:
+    """Write a recording of `frames` player status frames, mostly repeated states.
+
+    Half the frames describe watched players. A player keeps their lobby or
+    spectate state for about twenty frames before moving to another match.
+    Match snapshots follow the frames, so toasts wait for match data as they
+    do when a burst of players joins new lobbies.
+    """
+    rng = random.Random(seed)
+    watched = [str(1_000 + index) for index in range(watched_players)]
+    others = [str(900_000 + index) for index in range(other_players)]
+    state = {}
+    with open(path, "w", encoding="utf-8") as handle:
+        header = {"version": 1, "watchlist": [{"profileid": pid, "userName": f"u{pid}"} for pid in watched]}
+        handle.write(json.dumps(header) + "\n")
+        for _ in range(frames):
+            player_id = rng.choice(watched if rng.random() < WATCHED_SHARE else others)
+            if rng.random() < STATE_CHANGE_CHANCE or player_id not in state:
+                state[player_id] = (rng.choice(("lobby", "spectate")), rng.randint(1, matches))
+            status, match_id = state[player_id]
+            event = {
+                "type": "player_status",
+                "data": {
+                    "profile_id": int(player_id),
+                    "status": status,
+                    "match_id": match_id,
+                    "name": f"u{player_id}",
+                    "country": "de",
+                    "rating": 1500,
+                    "games": 10,
+                },
+            }
+            handle.write(json.dumps({"t": 0, "e": event}) + "\n")
+        for status in ("lobby", "spectate"):
+            for match_id in range(1, matches + 1):
+                match = {"matchid": match_id, "slots_taken": 2, "description": "Synthetic", "map_name": "Arabia"}
+                handle.write(json.dumps({"t": 0, "s": status, "m": match}) + "\n")
+
+
+def _get_response_type(event) -> str:
+    data = event.get("data") if isinstance(event, dict) else None
+    if isinstance(data, dict) and "status" in data and "profile_id" in data:
+        return "player_status"
+    return "unknown"
+
+
+def _extract_player_status_update(event):
+    data = event.get("data") or {}
+    player_id = data.get("profile_id")
+    if player_id is None:
+        return None
+    return str(player_id), str(data.get("status") or "").lower(), data.get("match_id")
+
+
+class _OfflineMatchBook:
+    @classmethod
+    def resolve_pending_lobby_leave_from_player_status(cls, player_id, status, match_id) -> None:
+        pass
+
+
+def install_offline_lobby() -> None:
+    """Register stand-in `lobby` and `shared` modules for synthetic replays.
+
+    Must run before `spies.spies` is imported. The stand-ins replace any
+    installed client, since the real parser does not read synthetic frames.
+    """
+    lobby_package = types.ModuleType("lobby")
+    lobby_module = types.ModuleType("lobby.lobby")
+    lobby_module.get_response_type = _get_response_type
+    lobby_module.get_player_slot = lambda player_name, match: {"civilization": 1, "steam_avatar": None}
+    lobby_module.get_civ_name = lambda civilization: "Britons"
+    lobby_module.subscribe = lambda *args, **kwargs: []
+    lobby_module.connect_to_subscriptions = lambda *args, **kwargs: None
+    match_book_module = types.ModuleType("lobby.match_book")
+    match_book_module.MatchBook = _OfflineMatchBook
+    utils_module = types.ModuleType("lobby.utils")
+    utils_module.extract_player_status_update = _extract_player_status_update
+    lobby_package.lobby = lobby_module
+    lobby_package.match_book = match_book_module
+    lobby_package.utils = utils_module
+
+    shared_package = types.ModuleType("shared")
+    process_guard_module = types.ModuleType("shared.process_guard")
+    process_guard_module.acquire_single_instance_lock = lambda name: True
+    shared_package.process_guard = process_guard_module
+
+    sys.modules.update({
+        "lobby": lobby_package,
+        "lobby.lobby": lobby_module,
+        "lobby.match_book": match_book_module,
+        "lobby.utils": utils_module,
+        "shared": shared_package,
+        "shared.process_guard": process_guard_module,
+    })
@@ -0,0 +1,395 @@
+"""Sharded player subscriptions for very large watchlists.
+
+With `--shards N` the watcher process becomes a supervisor. It keeps the single
+lobby/spectate MatchBook feed, the toast queue and the notification sink, and
+splits `Watchlist.by_id` across N worker processes. Each worker owns one
+"players" subscription for its share of the IDs, parses the raw events and
+forwards compact `(player_id, status, match_id, changed)` updates back over one
+shared multiprocessing queue. Parsing and socket work therefore scale with the number
+of workers while match tracking and alerts stay in one place.
+
+A worker that exits is restarted after an exponentially growing delay. A shard
+that keeps failing (the lobby client cannot be imported, authentication fails)
+is given up on after `max_restarts` attempts, and the supervisor reports the
+failure so the runtime can exit instead of respawning interpreters forever.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import zlib
+from collections import Counter as TallyCounter
+from contextlib import suppress
+
+from spies.expiring_map import ExpiringLRUMap
+from spies.metrics import METRICS
+from spies.prefilter import PlayerStatusPrefilter
+from spies.toast_queue import tracked_players_cap
+
+DEFAULT_MAX_BATCH_UPDATES = 512
+DEFAULT_WORKER_CHECK_SECONDS = 5.0
+DEFAULT_MAX_RESTARTS = 5
+RESTART_BACKOFF_BASE_SECONDS = 1.0
+MAX_RESTART_BACKOFF_SECONDS = 60.0
+# A worker that ran at least this long before exiting starts its backoff afresh.
+WORKER_STABLE_SECONDS = 120.0
+DEFAULT_MAX_TRACKED_PLAYERS = 50_000
+WORKER_JOIN_TIMEOUT_SECONDS = 5.0
+
+SHARD_UPDATES = METRICS.counter(
+    "spies_shard_updates_total",
+    "Player status updates forwarded by shard workers, by shard.",
+    labelnames=("shard",),
+)
+SHARD_RESTARTS = METRICS.counter(
+    "spies_shard_restarts_total",
+    "Shard worker processes restarted after exiting, by shard.",
+    labelnames=("shard",),
+)
+
+logger = logging.getLogger("agekeeper.spies.shards")
+
+
+def shard_for(profile_id, shard_count: int) -> int:
+    """Return the shard index for a profile ID.
+
+    crc32 is stable across processes and runs, unlike `hash()` on strings.
+    """
+    return zlib.crc32(str(profile_id).encode("utf-8")) % shard_count
+
+
+def partition_profile_ids(profile_ids, shard_count: int) -> list[list[str]]:
+    """Split profile IDs into `shard_count` lists by `shard_for`."""
+    shards = [[] for _ in range(shard_count)]
+    for profile_id in profile_ids:
+        shards[shard_for(profile_id, shard_count)].append(str(profile_id))
+    return shards
+
+
+class ShardForwarder:
+    """Parse subscription events in a worker and forward status updates in batches.
+
+    Updates are collected for the rest of the current loop tick and sent as one
+    message, so a burst of events costs one queue put rather than one per event.
+    Each update is `(player_id, status, match_id, changed)`. Repeated
+    `(status, match_id)` states are detected here, most of them by the prefilter
+    before they are even parsed, and forwarded with `changed=False` so the
+    supervisor still resolves pending lobby leaves for them as the in-process
+    path does. A repeat identical to the player's previous update in the same
+    batch is not sent again.
+    """
+
+    def __init__(
+        self,
+        shard_index: int,
+        send,
+        get_response_type,
+        parse_player_status,
+        max_batch_updates: int = DEFAULT_MAX_BATCH_UPDATES,
+        max_tracked_players: int = DEFAULT_MAX_TRACKED_PLAYERS,
+    ):
+        self.shard_index = shard_index
+        self.send = send
+        self.get_response_type = get_response_type
+        self.parse_player_status = parse_player_status
+        self.max_batch_updates = max_batch_updates
+        self.last_seen_state_by_player = ExpiringLRUMap(max_tracked_players)
+        self._subscribed_players = 0
+        self.prefilter = PlayerStatusPrefilter()
+        self._updates = []
+        # player_id -> last update added to the current batch
+        self._batched_by_player = {}
+        self._response_types = TallyCounter()
+        self._flush_handle = None
+
+    def dispatch(self, event, **kwargs) -> None:
+        """Subscription callback for one raw event."""
+        known_status = self.prefilter.check(event)
+        if known_status is not None:
+            # Every player in a shard is watched, so this is a repeated state.
+            self._add_update(*known_status, changed=False)
+        else:
+            response_type = self.get_response_type(event)
+            self._response_types[response_type] += 1
+            if response_type == "player_status":
+                parsed_status = self.parse_player_status(event)
+                if parsed_status is not None:
+                    self.prefilter.record(event, parsed_status, tracked=True)
+                    player_id, status, match_id = parsed_status
+                    state = (str(status), str(match_id))
+                    changed = self.last_seen_state_by_player.get(str(player_id)) != state
+                    if changed:
+                        self.last_seen_state_by_player[str(player_id)] = state
+                    self._add_update(player_id, status, match_id, changed=changed)
+        if not self._updates and not self._response_types:
+            return
+        if len(self._updates) >= self.max_batch_updates:
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_soon(self.flush)
+
+    def _add_update(self, player_id, status, match_id, changed: bool) -> None:
+        player_key = str(player_id)
+        update = (player_key, status, match_id, changed)
+        if not changed and self._batched_by_player.get(player_key, (None,) * 3)[:3] == update[:3]:
+            return
+        self._batched_by_player[player_key] = update
+        self._updates.append(update)
+
+    def track_players(self, player_ids) -> None:
+        """Count newly subscribed players and grow the last-seen cap to fit them."""
+        self._subscribed_players += len(player_ids)
+        cap = tracked_players_cap(self._subscribed_players)
+        if cap > self.last_seen_state_by_player.max_entries:
+            self.last_seen_state_by_player.max_entries = cap
+
+    def forget_players(self, player_ids) -> None:
+        """Drop dedupe state so re-added players alert on their next update."""
+        self.prefilter.clear()
+        for player_id in player_ids:
+            self.last_seen_state_by_player.pop(str(player_id), None)
+
+    def close(self) -> None:
+        """Send anything still batched and detach the prefilter from the metrics."""
+        self.flush()
+        self.prefilter.close()
+
+    def flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._updates and not self._response_types:
+            return
+        updates, self._updates = self._updates, []
+        self._batched_by_player = {}
+        response_types, self._response_types = dict(self._response_types), TallyCounter()
+        self.send((self.shard_index, response_types, updates))
+
+
+async def _shard_worker_async(shard_index: int, profile_ids, updates_queue, control_queue) -> None:
+    from lobby import lobby
+    from lobby.utils import extract_player_status_update
+
+    loop = asyncio.get_running_loop()
+    forwarder = ShardForwarder(
+        shard_index,
+        updates_queue.put,
+        lobby.get_response_type,
+        extract_player_status_update,
+    )
+    stopped = asyncio.Event()
+
+    def subscribe(player_ids) -> None:
+        forwarder.track_players(player_ids)
+        forwarder.forget_players(player_ids)
+        subscriptions = lobby.subscribe(["players"], player_ids=list(player_ids))
+        lobby.connect_to_subscriptions(subscriptions, forwarder.dispatch, create_task=True)
+
+    def read_control() -> None:
+        # Commands are (name, player_ids); None asks the worker to exit.
+        while True:
+            command = control_queue.get()
+            if command is None:
+                loop.call_soon_threadsafe(stopped.set)
+                return
+            name, player_ids = command
+            if name == "subscribe":
+                loop.call_soon_threadsafe(subscribe, player_ids)
+
+    if profile_ids:
+        subscribe(profile_ids)
+    threading.Thread(target=read_control, name="spies-shard-control", daemon=True).start()
+    try:
+        await stopped.wait()
+    finally:
+        forwarder.close()
+
+
+def run_shard_worker(shard_index: int, profile_ids, updates_queue, control_queue) -> None:
+    """Process entry point for one shard worker."""
+    with suppress(KeyboardInterrupt):
+        asyncio.run(_shard_worker_async(shard_index, profile_ids, updates_queue, control_queue))
+
+
+class ShardSupervisor:
+    """Start shard workers and deliver their updates on the supervisor's loop.
+
+    `on_updates(updates)` receives lists of `(player_id, status, match_id, changed)`
+    on the event loop that called `start`; repeats have `changed=False`. Workers that exit are restarted with the IDs
+    currently assigned to their shard. After `max_restarts` restarts in a row
+    without a stable run, `wait_for_failure()` returns.
+    """
+
+    def __init__(
+        self,
+        shard_count: int,
+        on_updates,
+        on_response_types=None,
+        worker_check_seconds: float = DEFAULT_WORKER_CHECK_SECONDS,
+        worker_target=run_shard_worker,
+        max_restarts: int = DEFAULT_MAX_RESTARTS,
+    ):
+        if shard_count < 1:
+            raise ValueError("shard_count must be >= 1")
+        self.shard_count = shard_count
+        self.on_updates = on_updates
+        self.on_response_types = on_response_types
+        self.worker_check_seconds = worker_check_seconds
+        self.worker_target = worker_target
+        self.max_restarts = max_restarts
+        self.failed_shard: int | None = None
+        # spawn behaves the same on Windows and elsewhere and never forks a running loop.
+        self._context = multiprocessing.get_context("spawn")
+        self._updates_queue = self._context.Queue()
+        self._control_queues = [None] * shard_count
+        self._processes = [None] * shard_count
+        self._shard_ids = [[] for _ in range(shard_count)]
+        self._restart_counts = [0] * shard_count
+        self._started_at = [0.0] * shard_count
+        # Monotonic time a dead worker is due to be restarted, or None.
+        self._restart_at = [None] * shard_count
+        self._failed = None
+        self._loop = None
+        self._reader_thread = None
+        self._monitor_task = None
+
+    @property
+    def alive_workers(self) -> int:
+        return sum(1 for process in self._processes if process is not None and process.is_alive())
+
+    def start(self, profile_ids) -> None:
+        """Partition `profile_ids`, start one worker per shard and begin reading updates."""
+        self._loop = asyncio.get_running_loop()
+        self._failed = asyncio.Event()
+        self._shard_ids = partition_profile_ids(profile_ids, self.shard_count)
+        for shard_index in range(self.shard_count):
+            self._start_worker(shard_index)
+        self._reader_thread = threading.Thread(target=self._read_updates, name="spies-shard-reader", daemon=True)
+        self._reader_thread.start()
+        self._monitor_task = asyncio.create_task(self._monitor_workers())
+
+    def _start_worker(self, shard_index: int) -> None:
+        control_queue = self._context.Queue()
+        process = self._context.Process(
+            target=self.worker_target,
+            args=(shard_index, list(self._shard_ids[shard_index]), self._updates_queue, control_queue),
+            name=f"spies-shard-{shard_index}",
+            daemon=True,
+        )
+        process.start()
+        self._control_queues[shard_index] = control_queue
+        self._processes[shard_index] = process
+        self._started_at[shard_index] = time.monotonic()
+        self._restart_at[shard_index] = None
+
+    async def wait_for_failure(self) -> int:
+        """Wait until a shard has used up its restarts and return its index."""
+        await self._failed.wait()
+        return self.failed_shard
+
+    def add_players(self, profile_ids) -> None:
+        """Subscribe newly watched players on the shards they belong to."""
+        added = partition_profile_ids(profile_ids, self.shard_count)
+        for shard_index, shard_ids in enumerate(added):
+            if not shard_ids:
+                continue
+            known = set(self._shard_ids[shard_index])
+            self._shard_ids[shard_index].extend(pid for pid in shard_ids if pid not in known)
+            self._control_queues[shard_index].put(("subscribe", shard_ids))
+
+    def _read_updates(self) -> None:
+        """Move worker batches onto the event loop, draining whatever is queued at once."""
+        while True:
+            message = self._updates_queue.get()
+            if message is None:
+                return
+            messages = [message]
+            stopping = False
+            while len(messages) < DEFAULT_MAX_BATCH_UPDATES:
+                try:
+                    message = self._updates_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if message is None:
+                    stopping = True
+                    break
+                messages.append(message)
+            self._loop.call_soon_threadsafe(self._deliver, messages)
+            if stopping:
+                return
+
+    def _deliver(self, messages) -> None:
+        for shard_index, response_types, updates in messages:
+            if self.on_response_types is not None and response_types:
+                self.on_response_types(response_types)
+            if updates:
+                SHARD_UPDATES.inc(str(shard_index), amount=sum(1 for update in updates if update[3]))
+                self.on_updates(updates)
+
+    async def _monitor_workers(self) -> None:
+        sleep_seconds = self.worker_check_seconds
+        while True:
+            await asyncio.sleep(sleep_seconds)
+            now = time.monotonic()
+            for shard_index, process in enumerate(self._processes):
+                if process is None or process.is_alive():
+                    continue
+                if self._restart_at[shard_index] is None and not self._schedule_restart(shard_index, process, now):
+                    return
+                if now >= self._restart_at[shard_index]:
+                    self._restart_counts[shard_index] += 1
+                    SHARD_RESTARTS.inc(str(shard_index))
+                    self._start_worker(shard_index)
+            pending = [restart_at for restart_at in self._restart_at if restart_at is not None]
+            sleep_seconds = self.worker_check_seconds
+            if pending:
+                sleep_seconds = max(0.0, min(sleep_seconds, min(pending) - now))
+
+    def _schedule_restart(self, shard_index: int, process, now: float) -> bool:
+        """Set when a dead worker restarts. Returns False once the shard is given up on."""
+        if now - self._started_at[shard_index] >= WORKER_STABLE_SECONDS:
+            self._restart_counts[shard_index] = 0
+        restarts = self._restart_counts[shard_index]
+        if restarts >= self.max_restarts:
+            logger.error(
+                "Shard worker %s exited with code %s after %s restarts; giving up.",
+                shard_index,
+                process.exitcode,
+                restarts,
+            )
+            self.failed_shard = shard_index
+            self._failed.set()
+            return False
+        delay = min(RESTART_BACKOFF_BASE_SECONDS * 2 ** restarts, MAX_RESTART_BACKOFF_SECONDS)
+        logger.warning(
+            "Shard worker %s exited with code %s; restarting it in %.0f s.", shard_index, process.exitcode, delay
+        )
+        self._restart_at[shard_index] = now + delay
+        return True
+
+    async def stop(self) -> None:
+        """Ask every worker to exit, then stop reading updates."""
+        if self._monitor_task is not None:
+            self._monitor_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._monitor_task
+            self._monitor_task = None
+        for control_queue in self._control_queues:
+            if control_queue is not None:
+                control_queue.put(None)
+        for process in self._processes:
+            if process is None:
+                continue
+            await asyncio.to_thread(process.join, WORKER_JOIN_TIMEOUT_SECONDS)
+            if process.is_alive():
+                process.terminate()
+        self._processes = [None] * self.shard_count
+        self._updates_queue.put(None)
+        if self._reader_thread is not None:
+            await asyncio.to_thread(self._reader_thread.join, WORKER_JOIN_TIMEOUT_SECONDS)
+            self._reader_thread = None
@@ -0,0 +1,211 @@
+"""Notification sink backends for spy alerts.
+
+A sink receives backend-neutral alert dicts from the runtime and turns them into
+something a user (or a benchmark) can observe. The Windows sink shows toasts and
+plays the alert sound; the console sink prints text or JSON lines; the memory
+sink records everything for tests and load runs on any platform.
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import threading
+from abc import ABC, abstractmethod
+from functools import partial
+from pathlib import Path
+
+from spies.audio import AlertAudioEngine, MciAudioBackend, RecordingAudioBackend
+
+SINK_CHOICES = ("windows", "console", "jsonl", "memory")
+TOAST_APP_NAME = "AOE2: Spies"
+TOAST_AUMID = "AgeKeeper.AgeKeeper.Spies"
+MAX_INLINE_AVATARS = 4
+# Bounded by the avatar cache in practice; the limit only guards against churn.
+MAX_CACHED_IMAGES = 512
+
+
+class NotificationSink(ABC):
+    """Interface for alert backends.
+
+    `show_alert` receives a dict with `title`, `text_fields`, `hero_image`,
+    `avatar_image`, `launch_action` (an `aoe2de://` link or None), plus the
+    `player_name`, `status`, `match_id` and `left_match` it describes. Summary
+    alerts also carry `avatar_strip`, the avatars of every player covered.
+    Implementations must be safe to call from render worker threads.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def show_alert(self, alert: dict) -> None:
+        """Deliver one alert."""
+
+    def preload_audio(self, audio_path: Path) -> None:
+        """Load the alert sound ahead of the first alert. Sinks without audio ignore it."""
+
+    def play_audio(self, audio_path: Path) -> None:
+        """Play the alert sound. Sinks without audio ignore it."""
+
+    def close(self) -> None:
+        """Release backend resources."""
+
+
+class _AlertAudioMixin(ABC):
+    """Play alert sounds through one resident, rate-limited AlertAudioEngine."""
+
+    _audio_engine: AlertAudioEngine | None = None
+    _audio_lock = threading.Lock()
+
+    @abstractmethod
+    def _create_audio_backend(self):
+        """Return the AudioBackend the engine plays through."""
+
+    def _audio_engine_for(self, audio_path: Path) -> AlertAudioEngine:
+        with self._audio_lock:
+            engine = self._audio_engine
+            if engine is None or engine.audio_path != Path(audio_path):
+                if engine is not None:
+                    engine.close()
+                engine = AlertAudioEngine(audio_path, self._create_audio_backend())
+                engine.start()
+                self._audio_engine = engine
+            return engine
+
+    def preload_audio(self, audio_path: Path) -> None:
+        self._audio_engine_for(audio_path)
+
+    def play_audio(self, audio_path: Path) -> None:
+        self._audio_engine_for(audio_path).play()
+
+    def close(self) -> None:
+        if self._audio_engine is not None:
+            self._audio_engine.close()
+
+
+class WindowsToastSink(_AlertAudioMixin, NotificationSink):
+    """Show alerts as Windows toasts and play the alert through MCI."""
+
+    name = "windows"
+
+    def __init__(self, logger, app_name: str = TOAST_APP_NAME, aumid: str = TOAST_AUMID):
+        import windows_toasts
+
+        from spies.toast_handlers import log_toast_dismissal, log_toast_failure
+
+        self.logger = logger
+        self.toaster = windows_toasts.InteractableWindowsToaster(app_name, notifierAUMID=aumid)
+        self._toasts = windows_toasts
+        # Pieces shared by every toast are built once.
+        self._on_dismissed = partial(log_toast_dismissal, logger=logger)
+        self._on_failed = partial(log_toast_failure, logger=logger)
+        # Disable native toast audio to avoid the default Windows ding.
+        # The custom alert is played explicitly through play_audio instead.
+        # BUG: The built in ToastAudio was not playing the .mp3 file for some reason,
+        # so instead we play the audio file ourselves.
+        self._silent_audio = windows_toasts.ToastAudio(silent=True)
+        self._images: dict[tuple[str, object], object] = {}
+
+    def _display_image(self, path, position):
+        """Return a cached ToastDisplayImage for a file and position."""
+        key = (str(path), position)
+        image = self._images.get(key)
+        if image is None:
+            if len(self._images) >= MAX_CACHED_IMAGES:
+                self._images.clear()
+            image = self._toasts.ToastDisplayImage.fromPath(key[0], position=position)
+            self._images[key] = image
+        return image
+
+    def show_alert(self, alert: dict) -> None:
+        positions = self._toasts.ToastImagePosition
+        spy_toast = self._toasts.Toast(alert["title"])
+        if alert.get("launch_action"):
+            # Use protocol launch on the toast itself to avoid intermittent WinRT callback drops.
+            spy_toast.launch_action = alert["launch_action"]
+
+        # Register toast callbacks
+        spy_toast.on_dismissed = self._on_dismissed
+        spy_toast.on_failed = self._on_failed
+
+        # Set toast duration so they display for a long time
+        spy_toast.duration = self._toasts.ToastDuration.Long
+        spy_toast.text_fields = alert["text_fields"]
+        if alert.get("hero_image"):
+            spy_toast.AddImage(self._display_image(alert["hero_image"], positions.Hero))
+        if alert.get("avatar_image"):
+            spy_toast.AddImage(self._display_image(alert["avatar_image"], positions.AppLogo))
+        # Summary toasts show the remaining avatars inline beneath the text.
+        for avatar_path in alert.get("avatar_strip", [])[1:MAX_INLINE_AVATARS + 1]:
+            spy_toast.AddImage(self._display_image(avatar_path, positions.Inline))
+        spy_toast.audio = self._silent_audio
+        self.toaster.show_toast(spy_toast)
+
+    def _create_audio_backend(self):
+        return MciAudioBackend()
+
+
+class ConsoleSink(NotificationSink):
+    """Write alerts to a stream as readable text or as JSON lines."""
+
+    def __init__(self, stream=None, json_lines: bool = False):
+        self.stream = stream if stream is not None else sys.stdout
+        self.json_lines = json_lines
+        self.name = "jsonl" if json_lines else "console"
+        self._lock = threading.Lock()
+
+    def show_alert(self, alert: dict) -> None:
+        if self.json_lines:
+            text = json.dumps(alert, default=str, separators=(",", ":")) + "\n"
+        else:
+            lines = [f"[{alert['title']}]", *alert["text_fields"]]
+            if alert.get("launch_action"):
+                lines.append(f"Open: {alert['launch_action']}")
+            text = "\n".join(lines) + "\n\n"
+        with self._lock:
+            self.stream.write(text)
+            self.stream.flush()
+
+
+class MemorySink(_AlertAudioMixin, NotificationSink):
+    """Record alerts and audio requests in memory.
+
+    Audio still goes through the alert audio engine, with a recording backend,
+    so `audio_backend.play_times` shows which requests survived rate limiting.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self.alerts: list[dict] = []
+        self.audio_paths: list[Path] = []
+        self.audio_backend = RecordingAudioBackend()
+
+    def _create_audio_backend(self):
+        return self.audio_backend
+
+    def show_alert(self, alert: dict) -> None:
+        self.alerts.append(alert)
+
+    def play_audio(self, audio_path: Path) -> None:
+        self.audio_paths.append(audio_path)
+        super().play_audio(audio_path)
+
+
+def default_sink_name() -> str:
+    return "windows" if sys.platform == "win32" else "console"
+
+
+def create_sink(name: str | None, logger) -> NotificationSink:
+    """Build a sink by CLI name; `None` picks the platform default."""
+    match name or default_sink_name():
+        case "windows":
+            return WindowsToastSink(logger)
+        case "console":
+            return ConsoleSink()
+        case "jsonl":
+            return ConsoleSink(json_lines=True)
+        case "memory":
+            return MemorySink()
+        case other:
+            raise ValueError(f"Unknown notification sink: {other}")
@@ -7,21 +7,24 @@ construction, alert delivery, and startup/CLI behavior.
 from pathlib import Path                            #Creating path objects
 import os
 import sys
-from windows_toasts import (                        #Creating the Windows toasts
-    InteractableWindowsToaster,
-    Toast,
-    ToastAudio,
-    ToastDuration,
-    ToastDisplayImage,
-    ToastImagePosition,
-)
-import asyncio                                      #Asyncronous functions
-import time                                         #Getting/parsing current time
-from functools import partial
 
 # Allow running this file directly (e.g., via pythonw spies/spies.py).
 if __package__ is None or __package__ == "":
     sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+if __name__ == "__main__":
+    # Dispatch the CLI before any runtime imports so task and tail commands stay
+    # fast. Starting the watcher imports this file again as `spies.spies`.
+    from spies.cli import run
+
+    raise SystemExit(run())
+
+import asyncio                                      #Asyncronous functions
+import time                                         #Getting/parsing current time
+from contextlib import suppress
+from functools import lru_cache
+from itertools import islice
+
 os.chdir(Path(__file__).resolve().parent.parent)
 
 from lobby import lobby
@@ -29,70 +32,137 @@ from lobby.match_book import MatchBook
 from lobby.utils import extract_player_status_update
 from spies.watchlist import DEFAULT_AVATAR_PATH, Watchlist
 from spies.avatar import (
-    add_player_avatar_to_toast,
+    AvatarFetcher,
     resolve_avatar_filepath
     )
-from spies.audio import play_alert_audio
-from spies.cli import build_cli_parser, handle_task_cli
-from spies.register_hkey_aumid import register_hkey
+from spies.avatar_cache import AvatarCache
+from spies.dedupe_state import DEDUPE_STATE_PATH, load_dedupe_state, save_dedupe_state_periodically
+from spies.dispatch import EventBatcher
+from spies.sinks import TOAST_AUMID, NotificationSink, create_sink
+from spies.prefilter import UNTRACKED, PlayerStatusPrefilter
+from spies.records import SummaryPayload, ToastPayload
 from spies.toast_queue import ToastQueueManager
-from spies.logging_utils import configure_rotating_logger, resolve_log_file, tail_logs
-from spies.toast_handlers import (
-    configure_toast_launch_action,
-    log_toast_dismissal,
-    log_toast_failure,
+from spies.logging_utils import (
+    FALLBACK_LOG_FILE,
+    configure_rotating_logger,
+    resolve_log_file,
+    resolve_log_format,
 )
+from spies.metrics import METRICS, start_metrics_server, write_snapshots_periodically
+from spies.toast_templates import ToastTemplates
 from shared.process_guard import acquire_single_instance_lock
 
 # Assign default variables
 default_avatar_path = DEFAULT_AVATAR_PATH
 SPIES_ASSETS_DIR = Path(__file__).resolve().parent / "assets"
+BANNER_PATH = SPIES_ASSETS_DIR / "AgeKeeper-SpiesBanner_Cropped.png"
+ALERT_AUDIO_PATH = SPIES_ASSETS_DIR / "16_enemy_sighted.mp3"
 SPIES_LOG_FILE = resolve_log_file()
 
-# Set logger 
+# Set logger. Records are queued and written by a background thread so logging
+# never does file I/O on the event loop.
 logger, SPIES_LOG_FILE = configure_rotating_logger(
     logger_name="agekeeper.spies",
     preferred_log_file=SPIES_LOG_FILE,
-    fallback_log_file=Path(__file__).resolve().parent / "logs" / "spies.log",
+    fallback_log_file=FALLBACK_LOG_FILE,
+    queued=True,
+    log_format=resolve_log_format(),
 )
 
-# Instantiate the toaster object for later use
-toaster = InteractableWindowsToaster("AOE2: Spies", notifierAUMID="AgeKeeper.AgeKeeper.Spies")
+# Alerts are delivered through a notification sink (Windows toasts by default on
+# Windows). Chosen in main() so importing this module never needs Windows APIs.
+notification_sink: NotificationSink | None = None
+
+# Static toast pieces (banner, audio, wording) are prepared once for every alert.
+toast_templates = ToastTemplates(BANNER_PATH, ALERT_AUDIO_PATH, default_avatar_path, logger)
+ALERT_LOG_RULE = "=" * 40
+# Civ ids form a small fixed set, so their names are cached after first use.
+_cached_civ_name = lru_cache(maxsize=None)(lobby.get_civ_name)
 
 # Instantiate the player watchlist object
 watchlist = Watchlist()
 
+# Avatar downloads run on a small thread pool so a slow CDN never stalls the loop.
+# Downloaded files are tracked by a size-bounded LRU cache in spies/avatars.
+avatar_cache = AvatarCache()
+avatar_fetcher = AvatarFetcher()
+
 # Instantiation happens in main_async().
 toast_queue_manager = None
 
+# Rejects repeated and unwatched player frames before they are parsed.
+status_prefilter = PlayerStatusPrefilter()
+
+EVENTS_RECEIVED = METRICS.counter(
+    "spies_events_received_total",
+    "Subscription events received, by response type.",
+    labelnames=("response_type",),
+)
+
 def _log_player_status_update(player_id: str, status: str, match_id) -> None:
     """Log one incoming player status update."""
-    player_entry = watchlist.get_entry(player_id, {})
-    player_name = player_entry.get("userName") or str(player_id)
-    logger.info("%s's status: %s, matchid: %s", player_name, status, match_id)
+    player_entry = watchlist.get_entry(player_id)
+    player_name = (player_entry.user_name if player_entry else None) or str(player_id)
+    logger.info(
+        "%s's status: %s, matchid: %s",
+        player_name,
+        status,
+        match_id,
+        extra={"player": player_name, "player_id": str(player_id), "status": status, "match_id": match_id},
+    )
+
+def _civ_name_for_slot(player_slot) -> str:
+    """Return the display civ name for a player's match slot."""
+    if not player_slot:
+        return "Player Unavailable"
+    return _cached_civ_name(player_slot.get("civilization", -1))
 
 def _build_toast_payload(player_id: str, match, status: str, match_id):
     """Create payload data used by the toast queue worker."""
-    player_entry = watchlist.get_entry(player_id, {})
-    player_name = player_entry.get("userName") or str(player_id)
+    player_entry = watchlist.get_entry(player_id)
+    if player_entry is None:
+        # Removed from the watchlist while the toast waited for its match.
+        return None
+    player_name = player_entry.user_name or str(player_id)
+    # Look the slot up once; the avatar and the toast text both need it.
+    player_slot = lobby.get_player_slot(player_name, match)
     avatar_filepath = resolve_avatar_filepath(
-        player_entry, match, watchlist.by_id, watchlist.save_index
+        player_entry,
+        match,
+        watchlist.request_entry_save,
+        cache=avatar_cache,
+        fetcher=avatar_fetcher,
+        player_slot=player_slot,
     )
-    return {
-        "player_name": player_name,
-        "match": match,
-        "status": status,
-        "avatar_filepath": avatar_filepath,
-    }
+    # Held until the toast renders, so eviction cannot delete the file first.
+    if not avatar_cache.hold(avatar_filepath):
+        avatar_filepath = default_avatar_path
+    return ToastPayload(player_name, match, status, avatar_filepath, _civ_name_for_slot(player_slot))
+
+def _build_summary_payload(payloads):
+    """Merge a burst of toast payloads into one summary payload."""
+    return SummaryPayload(payloads)
 
 def _display_toast_payload(payload) -> None:
-    """Render one queued payload as a Windows toast."""
-    display_toast(
-        player_name=payload["player_name"],
-        match=payload["match"],
-        status=payload["status"],
-        avatar_filepath=payload["avatar_filepath"],
-    )
+    """Render one queued payload through the notification sink."""
+    if isinstance(payload, SummaryPayload):
+        try:
+            display_summary_toast(payload.payloads)
+        finally:
+            for player_payload in payload.payloads:
+                avatar_cache.release(player_payload.avatar_filepath)
+        return
+    try:
+        display_toast(
+            player_name=payload.player_name,
+            match=payload.match,
+            status=payload.status,
+            avatar_filepath=payload.avatar_filepath,
+            left_match=payload.left_match,
+            player_civ_name=payload.civ_name,
+        )
+    finally:
+        avatar_cache.release(payload.avatar_filepath)
 
 def display_toast(
     player_name: str,
@@ -100,103 +170,139 @@ def display_toast(
     status: str,
     avatar_filepath: str = default_avatar_path,
     left_match: bool = False,
+    player_civ_name: str | None = None,
 ):
     """Build and display a spy alert toast with map, civ, and avatar details."""
-    spy_toast = Toast("Spy Alert")
-    configure_toast_launch_action(spy_toast, status, match, logger)
-
-    # Register toast callbacks
-    spy_toast.on_dismissed = partial(log_toast_dismissal, logger=logger)
-    spy_toast.on_failed = partial(log_toast_failure, logger=logger)
-    
-    # Set toast duration so they display for a long time
-    spy_toast.duration = ToastDuration.Long
-    
-    # Prepare all of the required data that will be used when displaying the toast
-    player_data = lobby.get_player_slot(player_name, match)
-    if player_data:
-        player_civ_name = lobby.get_civ_name(player_data.get("civilization", -1))
-    else:
-        player_civ_name = "Player Unavailable"
-
-    created_time = match.get("created_time", int(time.time()))
-    match_time_alive = int(time.time()) - created_time
-    subscription_description = "Unknown"
-    match status:
-        case "lobby":
-            subscription_description = "lobby"
-        case "spectate":
-            subscription_description = "game"
-            
-    activity_text = (
-        f"{player_name[:25]} left {subscription_description}:\n"
-        f"{match.get('description', f'a {subscription_description}')}"
-        if left_match
-        else f"{player_name[:25]} is in {subscription_description}:\n"
-        f"{match.get('description', f'a {subscription_description}')}"
+    if player_civ_name is None:
+        player_civ_name = _civ_name_for_slot(lobby.get_player_slot(player_name, match))
+    alert = toast_templates.player_alert(
+        player_name, match, status, avatar_filepath, player_civ_name, left_match=left_match
     )
-    toast_fields = [
-        activity_text,
-        f"Map: {match.get('map_name', 'Unknown Map')} | Playing as: {player_civ_name}",
-        f"Started: {match_time_alive}s ago | {match.get('slots_taken', -1)} Player{'s' if match.get('slots_taken', -1) != 1 else ''} in {subscription_description}",
-    ]
-    
-    #Attach the data that is to be displayed to the toast
-    spy_toast.text_fields = toast_fields
-    banner_path = SPIES_ASSETS_DIR / "AgeKeeper-SpiesBanner_Cropped.png"
-    audio_path = SPIES_ASSETS_DIR / "16_enemy_sighted.mp3"
-    spy_toast.AddImage(
-        ToastDisplayImage.fromPath(
-            str(banner_path),
-            position=ToastImagePosition.Hero,
-        )
-    )
-    add_player_avatar_to_toast(spy_toast, avatar_filepath)
-    # Disable native toast audio to avoid the default Windows ding.
-    # We play our custom alert explicitly right after showing the toast.
-    # BUG: The built in ToastAudio was not playing the .mp3 file for some reason,
-    # so instead we play the audio file ourselves.
-    spy_toast.audio = ToastAudio(silent=True)
-    toaster.show_toast(spy_toast)
-    play_alert_audio(audio_path)
+    notification_sink.show_alert(alert)
+    notification_sink.play_audio(toast_templates.audio_path)
+
+    logger.info("New Spy Alert\n%s\n%s\nStart time: %s", ALERT_LOG_RULE, "\n".join(alert["text_fields"]), time.ctime())
+
+def display_summary_toast(payloads) -> None:
+    """Display one toast (and one audio cue) covering a burst of alerts."""
+    alert = toast_templates.summary_alert(payloads)
+    notification_sink.show_alert(alert)
+    notification_sink.play_audio(toast_templates.audio_path)
 
-    logger.info("New Spy Alert\n%s\n%s\nStart time: %s", "=" * 40, "\n".join(toast_fields), time.ctime(time.time()))
+    logger.info("New Spy Alert (summary)\n%s\n%s\nStart time: %s", ALERT_LOG_RULE, "\n".join(alert["text_fields"]), time.ctime())
 
 def _handle_matchbook_player_remove(player_id: str, status: str, match_id, match) -> None:
     if watchlist.get_entry(player_id) is None:
         return
+    if toast_queue_manager is None:
+        return
+    toast_queue_manager.forget_player_match(player_id, status, match_id)
 
     payload = _build_toast_payload(player_id, match, status, match_id)
     if not payload:
         return
 
     _log_player_status_update(player_id, f"left_{status}", match_id)
-    display_toast(
-        player_name=payload["player_name"],
-        match=payload["match"],
-        status=payload["status"],
-        avatar_filepath=payload["avatar_filepath"],
-        left_match=True,
-    )
+    payload.left_match = True
+    # Route through the queue so a "left" toast never overtakes its "joined" toast.
+    toast_queue_manager.enqueue_payload(player_id, payload)
+
+def _prefiltered(event) -> bool:
+    """Handle a frame the prefilter recognises; return False if it must be parsed."""
+    known_status = status_prefilter.check(event)
+    if known_status is None:
+        return False
+    if known_status is not UNTRACKED:
+        # A repeated state: MatchBook still sees it, the toast queue would drop it.
+        MatchBook.resolve_pending_lobby_leave_from_player_status(*known_status)
+    return True
+
+def _accept_event(event):
+    """Return the parsed `(player_id, status, match_id)` of a watched player's frame, or None."""
+    if _prefiltered(event):
+        return None
+    return _parse_event(event)
+
+def _parse_event(event):
+    response_type = lobby.get_response_type(event)
+    EVENTS_RECEIVED.inc(response_type)
+    # Fast-path for the only response type currently used by this module.
+    if response_type != "player_status":
+        return None
+    parsed_status = extract_player_status_update(event)
+    if parsed_status is None:
+        return None
+    tracked = watchlist.get_entry(parsed_status[0]) is not None
+    status_prefilter.record(event, parsed_status, tracked=tracked)
+    # Players removed by a watchlist reload stay subscribed until restart.
+    if not tracked:
+        return None
+    MatchBook.resolve_pending_lobby_leave_from_player_status(*parsed_status)
+    return parsed_status
 
 def spy(event, **kwargs):
     """Dispatch incoming subscription events to the relevant spy handlers."""
-    response_type = lobby.get_response_type(event)
-    match response_type:
-        case "player_status":
-            # Fast-path for the only response type currently used by this module.
-            parsed_status = extract_player_status_update(event)
-            if parsed_status is None:
-                return
-            player_id, status, match_id = parsed_status
-            MatchBook.resolve_pending_lobby_leave_from_player_status(player_id, status, match_id)
-            toast_queue_manager.handle_player_status_update(player_id, status, match_id)
-
-async def main_async():
-    """Initialize state, subscribe to watchlist players, and run indefinitely."""
+    parsed_status = _accept_event(event)
+    if parsed_status is not None:
+        toast_queue_manager.handle_player_status_update(*parsed_status)
+
+def spy_batch(events):
+    """Dispatch every subscription event received in one loop tick.
+
+    Each frame still updates the match books, but the toast queue only sees the
+    latest state per player and looks each match up once. `EventBatcher` has
+    already run `_prefiltered` on the first event; the others are prefiltered
+    here, in arrival order.
+    """
+    parsed = [_parse_event(events[0])]
+    parsed.extend(map(_accept_event, islice(events, 1, None)))
+    updates = [parsed_status for parsed_status in parsed if parsed_status is not None]
+    if len(updates) == 1:
+        # Nothing to collapse; skip the grouping work.
+        toast_queue_manager.handle_player_status_update(*updates[0])
+    elif updates:
+        toast_queue_manager.handle_player_status_updates(updates)
+
+def _handle_shard_updates(updates) -> None:
+    """Apply a batch of status updates forwarded by shard workers.
+
+    Repeated states (`changed` false) only reach the match books, as they do
+    through `_prefiltered` without shards.
+    """
+    accepted = []
+    for player_id, status, match_id, changed in updates:
+        # Players removed by a watchlist reload stay subscribed until restart.
+        if watchlist.get_entry(player_id) is None:
+            continue
+        MatchBook.resolve_pending_lobby_leave_from_player_status(player_id, status, match_id)
+        if changed:
+            accepted.append((player_id, status, match_id))
+    if accepted:
+        toast_queue_manager.handle_player_status_updates(accepted)
+
+def _count_shard_events(response_types) -> None:
+    """Count events that shard workers received, as `spy` does in-process."""
+    for response_type, count in response_types.items():
+        EVENTS_RECEIVED.inc(response_type, amount=count)
+
+async def main_async(
+    record_events: Path | None = None,
+    metrics_port: int | None = None,
+    metrics_file: Path | None = None,
+    shards: int | None = None,
+    dispatch_mode: str = "batch",
+):
+    """Initialize state, subscribe to watchlist players, and run indefinitely.
+
+    With `shards`, player subscriptions run in that many worker processes and
+    this process only tracks matches and delivers alerts. `dispatch_mode`
+    "batch" hands each loop tick's player events to `spy_batch` together;
+    "event" calls `spy` once per event.
+    """
     # Instantiate MatchBook instances.
     lobby_matches = MatchBook("lobby", on_player_remove=_handle_matchbook_player_remove)
     spectate_matches = MatchBook("spectate", on_player_remove=_handle_matchbook_player_remove)
+    recorder = None
 
     def get_match_from_book(status: str, match_id, print_match_count: bool = False):
         """Return a match by id from the status-specific match book."""
@@ -208,7 +314,10 @@ async def main_async():
             return None
         if print_match_count:
             match_book.print_number_of_matches()
-        return match_book.get_match_by_id(match_id)
+        match = match_book.get_match_by_id(match_id)
+        if match and recorder is not None:
+            recorder.record_match(status, match)
+        return match
 
     global toast_queue_manager
     toast_queue_manager = ToastQueueManager(
@@ -216,6 +325,7 @@ async def main_async():
         build_toast_payload=_build_toast_payload,
         display_payload=_display_toast_payload,
         status_logger=_log_player_status_update,
+        build_summary_payload=_build_summary_payload,
     )
 
     # Start the MatchBook instances. This will cause them to connect to their subscriptions
@@ -228,6 +338,35 @@ async def main_async():
     profile_ids = watchlist.get_profile_ids()
     if not profile_ids:
         return
+    toast_queue_manager.track_players(len(profile_ids))
+
+    # Optionally capture raw player events and match snapshots for spies.replay.
+    dispatch = EventBatcher(spy_batch, handle_inline=_prefiltered) if dispatch_mode == "batch" else spy
+    if record_events is not None:
+        from spies.replay import EventRecorder
+
+        recorder = EventRecorder(record_events, watchlist.by_id.values())
+        dispatch = recorder.wrap_dispatch(dispatch)
+        logger.info("Recording subscription events to %s", record_events)
+
+    # Runtime gauges are read lazily whenever metrics are collected.
+    METRICS.gauge("spies_toast_queue_depth", "Toasts waiting to be rendered.", lambda: toast_queue_manager.queue_depth)
+    METRICS.gauge("spies_match_wait_pending", "Toasts waiting for match data.", lambda: toast_queue_manager.pending_wait_count)
+    METRICS.gauge("spies_watched_players", "Players on the watchlist.", lambda: len(watchlist.by_id))
+    metrics_server = None
+    metrics_task = None
+    if metrics_port is not None:
+        metrics_server = start_metrics_server(metrics_port)
+        logger.info("Serving metrics at http://127.0.0.1:%s/metrics", metrics_port)
+    if metrics_file is not None:
+        metrics_task = asyncio.create_task(write_snapshots_periodically(metrics_file))
+        logger.info("Writing metrics snapshots to %s", metrics_file)
+
+    # Remember alerts shown before a restart so players already in a match are not alerted again.
+    restored = load_dedupe_state(toast_queue_manager)
+    if restored:
+        logger.info("Restored %s dedupe entries from %s", restored, DEDUPE_STATE_PATH)
+    dedupe_state_task = asyncio.create_task(save_dedupe_state_periodically(toast_queue_manager))
 
     # Start the toast queue worker before subscription events begin arriving.
     toast_queue_manager.start()
@@ -235,16 +374,79 @@ async def main_async():
     # Subscribe to the "players" subscription. This allows us to see when a player's status
     # has changed. Subscriptions to "lobby" and "spectate" have already occurred when their
     # MatchBook(s) were instantiated, so no need to do it again.
-    subscriptions = lobby.subscribe(["players"], player_ids=profile_ids)
-    lobby.connect_to_subscriptions(subscriptions, spy, create_task=True)
-    
-    # Keep the async process alive indefinitely.
+    shard_supervisor = None
+    if shards:
+        from spies.shards import ShardSupervisor
+
+        # Shard workers own the player subscriptions and forward parsed updates here.
+        shard_supervisor = ShardSupervisor(shards, _handle_shard_updates, on_response_types=_count_shard_events)
+        shard_supervisor.start(profile_ids)
+        METRICS.gauge("spies_shard_workers_alive", "Shard worker processes currently running.", lambda: shard_supervisor.alive_workers)
+        logger.info("Watching %s players across %s shard workers", len(profile_ids), shards)
+    else:
+        subscriptions = lobby.subscribe(["players"], player_ids=profile_ids)
+        lobby.connect_to_subscriptions(subscriptions, dispatch, create_task=True)
+
+    def on_watchlist_change(added_ids, removed_ids):
+        """Subscribe newly watched players and drop state for removed ones."""
+        status_prefilter.clear()
+        if added_ids:
+            logger.info("Watchlist reloaded: now watching %s", ", ".join(added_ids))
+            toast_queue_manager.track_players(len(watchlist.by_id))
+            if shard_supervisor is not None:
+                shard_supervisor.add_players(added_ids)
+            else:
+                added_subscriptions = lobby.subscribe(["players"], player_ids=added_ids)
+                lobby.connect_to_subscriptions(added_subscriptions, dispatch, create_task=True)
+        if removed_ids:
+            logger.info("Watchlist reloaded: stopped watching %s", ", ".join(removed_ids))
+            for player_id in removed_ids:
+                toast_queue_manager.forget_player(player_id)
+
+    # Pick up watchlist.json edits without restarting the process.
+    watchlist_reload_task = asyncio.create_task(watchlist.watch(on_watchlist_change))
+
+    # Keep the async process alive indefinitely, unless a shard keeps failing.
     try:
+        if shard_supervisor is not None:
+            failed_shard = await shard_supervisor.wait_for_failure()
+            logger.error("Stopping: shard worker %s could not be kept running.", failed_shard)
+            return 1
         await asyncio.Event().wait()
     finally:
+        watchlist_reload_task.cancel()
+        if shard_supervisor is not None:
+            await shard_supervisor.stop()
+        if metrics_task is not None:
+            # Cancelling the task writes the final snapshot.
+            metrics_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await metrics_task
+        if metrics_server is not None:
+            metrics_server.shutdown()
         await toast_queue_manager.stop()
+        # Cancelling the task writes the final snapshot.
+        dedupe_state_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await dedupe_state_task
+        notification_sink.close()
+        avatar_fetcher.shutdown()
+        avatar_cache.save_index()
+        watchlist.flush()
+        if watchlist.store is not None:
+            watchlist.store.close()
+        if recorder is not None:
+            recorder.close()
     
-def main():
+def main(
+    sink_name: str | None = None,
+    record_events: Path | None = None,
+    metrics_port: int | None = None,
+    metrics_file: Path | None = None,
+    shards: int | None = None,
+    watchlist_store: str = "json",
+    dispatch_mode: str = "batch",
+):
     """Program entry point for running the spies event loop."""
     # Check for other instances running. Not strictly necessary,
     # but useful when running in background.
@@ -252,27 +454,51 @@ def main():
         logger.warning("Another Spies instance is already running. Exiting.")
         return
     logger.info(f"{time.ctime(time.time())} | Starting spies process. Log file: {SPIES_LOG_FILE}")
-    
-    # Run the main async process
-    asyncio.run(main_async())
 
-if __name__ == "__main__":
-    # CLI handling
-    cli_args = build_cli_parser().parse_args()
-    task_cli_result = handle_task_cli(cli_args)
-    if task_cli_result is not None:
-        raise SystemExit(task_cli_result)
-    
-    register_hkey("AgeKeeper.AgeKeeper.Spies", "AgeKeeper Spies", Path("spies/assets/AgeKeeper-Spies.ico"))
-    
-    # Rather than run the main_async process, tail (display) the log file.
-    # Most useful for when a seperate process is already running the script.
-    if cli_args.tail_logs:
-        raise SystemExit(
-            tail_logs(
-                log_file=SPIES_LOG_FILE,
-                lines=cli_args.tail_lines,
-                follow=not cli_args.no_follow,
-            )
+    global watchlist
+    if watchlist_store == "sqlite":
+        from spies.watchlist_store import SqliteWatchlistStore
+
+        watchlist = Watchlist(store=SqliteWatchlistStore())
+
+    global notification_sink
+    if notification_sink is None:
+        notification_sink = create_sink(sink_name, logger)
+    # Open the alert sound now so the first alert does not pay for it.
+    notification_sink.preload_audio(toast_templates.audio_path)
+
+    # Run the main async process
+    return asyncio.run(
+        main_async(
+            record_events=record_events,
+            metrics_port=metrics_port,
+            metrics_file=metrics_file,
+            shards=shards,
+            dispatch_mode=dispatch_mode,
         )
-    main()
+    )
+
+def run_from_cli(cli_args) -> int:
+    """Start the watcher with options parsed by `spies.cli`."""
+    if cli_args.shards is not None and cli_args.shards < 1:
+        print("--shards must be >= 1")
+        return 2
+    if cli_args.shards and cli_args.record_events is not None:
+        # Raw events never reach this process when shard workers parse them.
+        print("--record-events cannot be combined with --shards")
+        return 2
+    if cli_args.notify_sink in (None, "windows") and sys.platform == "win32":
+        from spies.register_hkey_aumid import register_hkey
+
+        register_hkey(TOAST_AUMID, "AgeKeeper Spies", Path("spies/assets/AgeKeeper-Spies.ico"))
+
+    exit_code = main(
+        sink_name=cli_args.notify_sink,
+        record_events=cli_args.record_events,
+        metrics_port=cli_args.metrics_port,
+        metrics_file=cli_args.metrics_file,
+        shards=cli_args.shards,
+        watchlist_store=cli_args.watchlist_store,
+        dispatch_mode=cli_args.dispatch,
+    )
+    return exit_code or 0
@@ -6,9 +6,12 @@ This script manages a Scheduled Task that starts `spies.spies` on user logon.
 from __future__ import annotations
 
 import argparse
+import csv
+import io
+import json
 import subprocess
 import sys
-import re
+from abc import ABC, abstractmethod
 from pathlib import Path
 
 
@@ -37,15 +40,6 @@ def _build_task_action(project_root: Path, python_exe: str) -> str:
     return f'"{python_exe}" "{script_path}"'
 
 
-def _run_schtasks(args: list[str]) -> subprocess.CompletedProcess[str]:
-    return subprocess.run(
-        ["schtasks", *args],
-        capture_output=True,
-        text=True,
-        check=False,
-    )
-
-
 def _normalize_task_name(task_name: str) -> str:
     normalized = task_name.strip()
     if not normalized:
@@ -55,51 +49,153 @@ def _normalize_task_name(task_name: str) -> str:
     return normalized
 
 
-def _task_name_candidates(task_name: str) -> list[str]:
-    candidates: list[str] = []
-    raw = task_name.strip()
-    normalized = _normalize_task_name(task_name)
-    if raw:
-        candidates.append(raw)
-    if normalized and normalized not in candidates:
-        candidates.append(normalized)
-    return candidates
-
-
-def _resolve_existing_task_name(task_name: str) -> str | None:
-    for candidate in _task_name_candidates(task_name):
-        result = _run_schtasks(["/Query", "/TN", candidate])
+def _parse_csv_task_names(output: str) -> list[str]:
+    """Return the task paths from `schtasks /Query /FO CSV /NH` output, in order."""
+    names = []
+    for row in csv.reader(io.StringIO(output)):
+        # Header and "INFO: ..." lines never start with the root folder.
+        if row and row[0].startswith("\\"):
+            names.append(row[0].strip())
+    return list(dict.fromkeys(names))
+
+
+class TaskBackend(ABC):
+    """Runs schtasks commands and caches task-name lookups for one invocation.
+
+    Subclasses provide `_execute`. Resolving a name costs one targeted CSV
+    query; the full task listing is only fetched (once) when that misses and a
+    fuzzy match on the task's leaf name is needed.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self._resolved: dict[str, str | None] = {}
+        self._task_names: list[str] | None = None
+
+    @abstractmethod
+    def _execute(self, args: list[str]) -> subprocess.CompletedProcess[str]:
+        """Run one schtasks command and return its result."""
+
+    def run(self, args: list[str]) -> subprocess.CompletedProcess[str]:
+        self.calls += 1
+        return self._execute(list(args))
+
+    def invalidate(self) -> None:
+        """Forget cached lookups after a task was created or deleted."""
+        self._resolved.clear()
+        self._task_names = None
+
+    def task_names(self) -> list[str]:
+        """Return every task path on the system from one CSV listing."""
+        if self._task_names is None:
+            result = self.run(["/Query", "/FO", "CSV", "/NH"])
+            self._task_names = _parse_csv_task_names(result.stdout) if result.returncode == 0 else []
+        return self._task_names
+
+    def resolve(self, task_name: str) -> str | None:
+        """Return the registered path for `task_name`, or None when it does not exist."""
+        key = _normalize_task_name(task_name).lower()
+        if key not in self._resolved:
+            self._resolved[key] = self._resolve_uncached(task_name)
+        return self._resolved[key]
+
+    def _resolve_uncached(self, task_name: str) -> str | None:
+        normalized = _normalize_task_name(task_name)
+        if not normalized:
+            return None
+        # schtasks matches names case-insensitively, with or without the leading backslash.
+        result = self.run(["/Query", "/TN", normalized, "/FO", "CSV", "/NH"])
         if result.returncode == 0:
-            return candidate
-    discovered = _discover_task_names()
-    lowered_candidates = {c.lower() for c in _task_name_candidates(task_name)}
-    leaf = task_name.strip().split("\\")[-1].lower()
-    fuzzy_matches = []
-    for name in discovered:
-        lower_name = name.lower()
-        if lower_name in lowered_candidates:
-            return name
-        if leaf and (lower_name.endswith("\\" + leaf) or ("\\" + leaf + "\\") in lower_name):
-            fuzzy_matches.append(name)
-    if len(fuzzy_matches) == 1:
-        return fuzzy_matches[0]
-    return None
-
-
-def _discover_task_names() -> list[str]:
-    result = _run_schtasks(["/Query", "/FO", "LIST"])
-    if result.returncode != 0:
-        return []
-    # Typical output line: "TaskName: \AgeKeeper\Spies"
-    matches = re.findall(r"(?mi)^TaskName:\s*(.+?)\s*$", result.stdout)
-    return [m.strip() for m in matches if m.strip()]
-
-
-def task_exists(task_name: str) -> bool:
-    return _resolve_existing_task_name(task_name) is not None
-
-
-def register_task(task_name: str, python_exe: str) -> int:
+            names = _parse_csv_task_names(result.stdout)
+            return names[0] if names else normalized
+
+        lowered_name = normalized.lower()
+        leaf = normalized.split("\\")[-1].lower()
+        fuzzy_matches = []
+        for name in self.task_names():
+            lower_name = name.lower()
+            if lower_name == lowered_name:
+                return name
+            if leaf and (lower_name.endswith("\\" + leaf) or ("\\" + leaf + "\\") in lower_name):
+                fuzzy_matches.append(name)
+        if len(fuzzy_matches) == 1:
+            return fuzzy_matches[0]
+        return None
+
+
+class SchtasksBackend(TaskBackend):
+    """Run the real `schtasks.exe`, optionally appending each call to a recording."""
+
+    def __init__(self, record_path: Path | None = None):
+        super().__init__()
+        self.record_path = Path(record_path) if record_path else None
+
+    def _execute(self, args: list[str]) -> subprocess.CompletedProcess[str]:
+        result = subprocess.run(
+            ["schtasks", *args],
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+        if self.record_path is not None:
+            record = {
+                "args": args,
+                "returncode": result.returncode,
+                "stdout": result.stdout,
+                "stderr": result.stderr,
+            }
+            with open(self.record_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        return result
+
+
+class ReplaySchtasksBackend(TaskBackend):
+    """Answer schtasks calls from recorded output, so lookups run without Windows.
+
+    Records are matched on their arguments (case-insensitively); anything not
+    recorded fails the way schtasks does for an unknown task.
+    """
+
+    def __init__(self, records):
+        super().__init__()
+        self._responses = {tuple(arg.lower() for arg in record["args"]): record for record in records}
+        self.executed: list[list[str]] = []
+
+    @classmethod
+    def from_file(cls, path: Path) -> ReplaySchtasksBackend:
+        with open(path, "r", encoding="utf-8") as f:
+            return cls([json.loads(line) for line in f if line.strip()])
+
+    def _execute(self, args: list[str]) -> subprocess.CompletedProcess[str]:
+        self.executed.append(args)
+        record = self._responses.get(tuple(arg.lower() for arg in args))
+        if record is None:
+            return subprocess.CompletedProcess(
+                ["schtasks", *args], 1, "", "ERROR: The system cannot find the file specified.\n"
+            )
+        return subprocess.CompletedProcess(
+            ["schtasks", *args], record["returncode"], record["stdout"], record["stderr"]
+        )
+
+
+_default_backend: TaskBackend | None = None
+
+
+def _backend(backend: TaskBackend | None) -> TaskBackend:
+    global _default_backend
+    if backend is not None:
+        return backend
+    if _default_backend is None:
+        _default_backend = SchtasksBackend()
+    return _default_backend
+
+
+def task_exists(task_name: str, backend: TaskBackend | None = None) -> bool:
+    return _backend(backend).resolve(task_name) is not None
+
+
+def register_task(task_name: str, python_exe: str, backend: TaskBackend | None = None) -> int:
+    backend = _backend(backend)
     project_root = _project_root()
     action = _build_task_action(project_root, python_exe)
     target_task_name = _normalize_task_name(task_name)
@@ -115,7 +211,8 @@ def register_task(task_name: str, python_exe: str) -> int:
         "/F",
     ]
 
-    result = _run_schtasks(args)
+    result = backend.run(args)
+    backend.invalidate()
     if result.returncode != 0:
         print(result.stderr.strip() or result.stdout.strip())
         return result.returncode
@@ -125,13 +222,15 @@ def register_task(task_name: str, python_exe: str) -> int:
     return 0
 
 
-def deregister_task(task_name: str) -> int:
-    existing_name = _resolve_existing_task_name(task_name)
+def deregister_task(task_name: str, backend: TaskBackend | None = None) -> int:
+    backend = _backend(backend)
+    existing_name = backend.resolve(task_name)
     if existing_name is None:
         print(f"Task not found: {task_name}")
         return 0
 
-    result = _run_schtasks(["/Delete", "/TN", existing_name, "/F"])
+    result = backend.run(["/Delete", "/TN", existing_name, "/F"])
+    backend.invalidate()
     if result.returncode != 0:
         print(result.stderr.strip() or result.stdout.strip())
         return result.returncode
@@ -140,25 +239,27 @@ def deregister_task(task_name: str) -> int:
     return 0
 
 
-def show_status(task_name: str) -> int:
-    existing_name = _resolve_existing_task_name(task_name)
+def show_status(task_name: str, backend: TaskBackend | None = None) -> int:
+    backend = _backend(backend)
+    existing_name = backend.resolve(task_name)
     if existing_name is None:
         print(f"Task not found: {task_name}")
         return 1
 
-    result = _run_schtasks(["/Query", "/TN", existing_name, "/V", "/FO", "LIST"])
+    result = backend.run(["/Query", "/TN", existing_name, "/V", "/FO", "LIST"])
 
     print(result.stdout.strip())
     return 0
 
 
-def start_task(task_name: str) -> int:
-    existing_name = _resolve_existing_task_name(task_name)
+def start_task(task_name: str, backend: TaskBackend | None = None) -> int:
+    backend = _backend(backend)
+    existing_name = backend.resolve(task_name)
     if existing_name is None:
         print(f"Task not found: {task_name}")
         return 1
 
-    result = _run_schtasks(["/Run", "/TN", existing_name])
+    result = backend.run(["/Run", "/TN", existing_name])
     if result.returncode != 0:
         print(result.stderr.strip() or result.stdout.strip())
         return result.returncode
@@ -167,13 +268,14 @@ def start_task(task_name: str) -> int:
     return 0
 
 
-def stop_task(task_name: str) -> int:
-    existing_name = _resolve_existing_task_name(task_name)
+def stop_task(task_name: str, backend: TaskBackend | None = None) -> int:
+    backend = _backend(backend)
+    existing_name = backend.resolve(task_name)
     if existing_name is None:
         print(f"Task not found: {task_name}")
         return 1
 
-    result = _run_schtasks(["/End", "/TN", existing_name])
+    result = backend.run(["/End", "/TN", existing_name])
     if result.returncode != 0:
         print(result.stderr.strip() or result.stdout.strip())
         return result.returncode
@@ -191,6 +293,19 @@ def build_parser() -> argparse.ArgumentParser:
         default=DEFAULT_TASK_NAME,
         help=f"Scheduled task name (default: {DEFAULT_TASK_NAME})",
     )
+    backend_group = parser.add_mutually_exclusive_group()
+    backend_group.add_argument(
+        "--schtasks-record",
+        type=Path,
+        default=None,
+        help="Append every schtasks call and its output to this JSON-lines file.",
+    )
+    backend_group.add_argument(
+        "--schtasks-replay",
+        type=Path,
+        default=None,
+        help="Answer schtasks calls from a file made with --schtasks-record instead of running schtasks.",
+    )
     subparsers = parser.add_subparsers(dest="command", required=True)
 
     register_parser = subparsers.add_parser(
@@ -225,19 +340,23 @@ def build_parser() -> argparse.ArgumentParser:
 def main() -> int:
     parser = build_parser()
     args = parser.parse_args()
+    if args.schtasks_replay:
+        backend = ReplaySchtasksBackend.from_file(args.schtasks_replay)
+    else:
+        backend = SchtasksBackend(record_path=args.schtasks_record)
 
     if args.command == "register":
-        return register_task(args.task_name, args.python)
+        return register_task(args.task_name, args.python, backend=backend)
 
     if args.command == "deregister":
-        return deregister_task(args.task_name)
+        return deregister_task(args.task_name, backend=backend)
 
     if args.command == "status":
-        return show_status(args.task_name)
+        return show_status(args.task_name, backend=backend)
     if args.command == "start":
-        return start_task(args.task_name)
+        return start_task(args.task_name, backend=backend)
     if args.command == "stop":
-        return stop_task(args.task_name)
+        return stop_task(args.task_name, backend=backend)
 
     parser.print_help()
     return 2
@@ -1,26 +1,30 @@
-"""Toast callback and launch-action helpers for Windows notifications."""
+"""Toast callback and launch-action helpers for spy notifications."""
 
 from __future__ import annotations
 
-from windows_toasts import ToastDismissedEventArgs, ToastFailedEventArgs
+from typing import TYPE_CHECKING
 
+if TYPE_CHECKING:
+    from windows_toasts import ToastDismissedEventArgs, ToastFailedEventArgs
 
-def configure_toast_launch_action(spy_toast, status: str, match, logger) -> None:
-    """Set protocol launch action for supported statuses."""
-    match status:
-        case "lobby":
-            response_type_id = 0
-        case "spectate":
-            response_type_id = 1
-        case _:
-            logger.warning("Unknown response type %s, cannot configure toast activation.", status)
-            return
 
-    match_id = match.get("matchid", -1)
-    protocol_link = f"aoe2de://{response_type_id}/{match_id}"
-    # Use protocol launch on the toast itself to avoid intermittent WinRT callback drops.
-    spy_toast.launch_action = protocol_link
+# Launch links only differ by match id, so the per-status prefix is built once.
+LAUNCH_ACTION_PREFIXES = {
+    "lobby": "aoe2de://0/",
+    "spectate": "aoe2de://1/",
+}
+
+
+def build_launch_action(status: str, match, logger) -> str | None:
+    """Return the `aoe2de://` protocol link for supported statuses."""
+    prefix = LAUNCH_ACTION_PREFIXES.get(status)
+    if prefix is None:
+        logger.warning("Unknown response type %s, cannot configure toast activation.", status)
+        return None
+
+    protocol_link = f"{prefix}{match.get('matchid', -1)}"
     logger.info("Toast launch action configured: %s", protocol_link)
+    return protocol_link
 
 
 def log_toast_dismissal(dismissed_event_args: ToastDismissedEventArgs, logger) -> None:
@@ -1,8 +1,48 @@
 """Async toast queue, dedupe, and delay orchestration for player updates."""
 
 import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import suppress
 
+from spies.expiring_map import ExpiringLRUMap
+from spies.metrics import METRICS
+from spies.records import ToastKey, intern_id
+
+# A toast key only needs to outlive the match it refers to; AoE2 lobbies and
+# games rarely last longer than a few hours.
+DEFAULT_TOAST_KEY_TTL_SECONDS = 6 * 60 * 60
+DEFAULT_MAX_TOAST_KEYS = 10_000
+DEFAULT_MAX_TRACKED_PLAYERS = 50_000
+# Room over the watchlist size for players removed by a reload but not yet aged out.
+TRACKED_PLAYERS_HEADROOM = 1.25
+DEFAULT_MATCH_WAIT_TIMEOUT_SECONDS = 12.0
+DEFAULT_MATCH_SWEEP_INTERVAL_SECONDS = 0.4
+DEFAULT_RENDER_WORKERS = 2
+RENDER_LATENCY_SAMPLES = 256
+DEFAULT_AGGREGATE_WINDOW_SECONDS = 0.5
+DEFAULT_AGGREGATE_RATE_THRESHOLD = 8
+
+DEDUPE_HITS = METRICS.counter(
+    "spies_dedupe_hits_total",
+    "Status updates dropped as repeats, by dedupe stage.",
+    labelnames=("stage",),
+)
+MATCH_WAIT_SECONDS = METRICS.histogram(
+    "spies_match_wait_seconds",
+    "Time a toast waited for its match data to arrive.",
+)
+TOAST_RENDER_SECONDS = METRICS.histogram(
+    "spies_toast_render_seconds",
+    "Time spent rendering one toast payload.",
+)
+
+
+def tracked_players_cap(watched_players: int) -> int:
+    """Return a last-seen state cap that holds every one of `watched_players`."""
+    return max(DEFAULT_MAX_TRACKED_PLAYERS, int(watched_players * TRACKED_PLAYERS_HEADROOM))
+
 
 class ToastQueueManager:
     """Queue and dedupe toast work for player status updates."""
@@ -14,50 +54,184 @@ class ToastQueueManager:
         display_payload,
         valid_statuses=("lobby", "spectate"),
         status_logger=None,
+        toast_key_ttl_seconds: float = DEFAULT_TOAST_KEY_TTL_SECONDS,
+        max_toast_keys: int = DEFAULT_MAX_TOAST_KEYS,
+        max_tracked_players: int = DEFAULT_MAX_TRACKED_PLAYERS,
+        match_wait_timeout_seconds: float = DEFAULT_MATCH_WAIT_TIMEOUT_SECONDS,
+        match_sweep_interval_seconds: float = DEFAULT_MATCH_SWEEP_INTERVAL_SECONDS,
+        render_workers: int = DEFAULT_RENDER_WORKERS,
+        build_summary_payload=None,
+        aggregate_window_seconds: float = DEFAULT_AGGREGATE_WINDOW_SECONDS,
+        aggregate_rate_threshold: int = DEFAULT_AGGREGATE_RATE_THRESHOLD,
     ):
         self.get_match = get_match
         self.build_toast_payload = build_toast_payload
         self.display_payload = display_payload
         self.valid_statuses = {self._normalize_status(status) for status in valid_statuses}
         self.status_logger = status_logger
+        self.match_wait_timeout_seconds = match_wait_timeout_seconds
+        self.match_sweep_interval_seconds = match_sweep_interval_seconds
+        # Aggregation is enabled by supplying `build_summary_payload(payloads)`.
+        self.build_summary_payload = build_summary_payload
+        self.aggregate_window_seconds = aggregate_window_seconds
+        self.aggregate_rate_threshold = aggregate_rate_threshold
 
-        self.toast_queue = asyncio.Queue()
-        self.pending_wait_tasks = {}
-        self.toast_status_by_key = {}
-        self.last_seen_state_by_player = {}
-        self._worker_task = None
+        # One queue per render worker. A player always maps to the same queue, so
+        # their toasts render in order while different players render in parallel.
+        self.render_workers = max(1, render_workers)
+        self.render_queues = [asyncio.Queue() for _ in range(self.render_workers)]
+        self.render_latency_seconds = deque(maxlen=RENDER_LATENCY_SAMPLES)
+        # (status, match_id) -> {toast key: (player_id, raw match_id, deadline)}
+        self.pending_by_match = {}
+        self.toast_status_by_key = ExpiringLRUMap(max_toast_keys, ttl_seconds=toast_key_ttl_seconds)
+        # Shares the toast key TTL: once a player's key has expired, their state may alert again anyway.
+        self.last_seen_state_by_player = ExpiringLRUMap(max_tracked_players, ttl_seconds=toast_key_ttl_seconds)
+        self._worker_tasks = []
+        self._render_executor = None
+        self._sweep_task = None
+        # (status, match_id) -> [(player_id, payload)] collected in the current window
+        self._aggregate_buffer = {}
+        self._aggregate_handle = None
+        # player_id -> future resolved once a summary covering that player has rendered
+        self._outstanding_summaries = {}
 
     @staticmethod
     def _normalize_status(status) -> str:
-        return str(status or "").strip().lower()
+        # Statuses come from a handful of values, so interning makes keys share them.
+        return intern_id(str(status or "").strip().lower())
 
     @classmethod
-    def _build_toast_key(cls, player_id: str, match_id, status: str):
+    def _build_toast_key(cls, player_id: str, match_id, status: str) -> ToastKey:
         # Dedupe by player+match+status so state transitions (lobby <-> spectate)
         # generate separate toasts while repeated updates in the same state do not.
-        return (str(player_id), str(match_id), cls._normalize_status(status))
+        return ToastKey(intern_id(player_id), str(match_id), cls._normalize_status(status))
 
     @staticmethod
     def _build_player_state(status: str, match_id):
-        return (str(status), str(match_id))
+        return (status, str(match_id))
+
+    def track_players(self, watched_players: int) -> None:
+        """Grow the last-seen state cap to fit a watchlist of `watched_players`.
+
+        A watched player evicted from the map would have their next repeated
+        state treated as new, so the cap follows the watchlist size.
+        """
+        cap = tracked_players_cap(watched_players)
+        if cap > self.last_seen_state_by_player.max_entries:
+            self.last_seen_state_by_player.max_entries = cap
+
+    @property
+    def pending_wait_count(self) -> int:
+        """Number of toasts currently waiting for their match data."""
+        return sum(len(waiting) for waiting in self.pending_by_match.values())
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of payloads waiting to be rendered across all workers."""
+        return sum(queue.qsize() for queue in self.render_queues)
 
     def start(self):
-        """Start the queue worker if it is not already running."""
-        if self._worker_task is None or self._worker_task.done():
-            self._worker_task = asyncio.create_task(self._toast_queue_worker())
-        return self._worker_task
+        """Start the render workers if they are not already running."""
+        if self._render_executor is None:
+            self._render_executor = ThreadPoolExecutor(
+                max_workers=self.render_workers,
+                thread_name_prefix="spies-render",
+            )
+        if not self._worker_tasks or any(task.done() for task in self._worker_tasks):
+            for task in self._worker_tasks:
+                task.cancel()
+            self._worker_tasks = [
+                asyncio.create_task(self._toast_queue_worker(queue))
+                for queue in self.render_queues
+            ]
+        return self._worker_tasks
 
     async def stop(self) -> None:
-        """Stop the queue worker."""
-        if self._worker_task is None:
-            return
-        self._worker_task.cancel()
-        with suppress(asyncio.CancelledError):
-            await self._worker_task
-        self._worker_task = None
+        """Stop the queue worker and the pending-match sweep."""
+        if self._aggregate_handle is not None:
+            self._aggregate_handle.cancel()
+            self._aggregate_handle = None
+        if self._sweep_task is not None:
+            self._sweep_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._sweep_task
+            self._sweep_task = None
+        for task in self._worker_tasks:
+            task.cancel()
+        for task in self._worker_tasks:
+            with suppress(asyncio.CancelledError):
+                await task
+        self._worker_tasks = []
+        if self._render_executor is not None:
+            self._render_executor.shutdown(wait=False, cancel_futures=True)
+            self._render_executor = None
 
-    def _enqueue_toast_for_player_match(self, player_id: str, match, status: str, match_id) -> None:
-        key = self._build_toast_key(player_id, match_id, status)
+    def enqueue_payload(self, player_id: str, payload) -> None:
+        """Queue a ready-made payload behind any earlier toasts for the same player."""
+        player_key = str(player_id)
+        if any(
+            queued_player == player_key
+            for group in self._aggregate_buffer.values()
+            for queued_player, _ in group
+        ):
+            # Release the player's buffered toast first so this one cannot overtake it.
+            self._flush_aggregation()
+        summary_rendered = self._outstanding_summaries.get(player_key)
+        if summary_rendered is not None and summary_rendered is not payload.rendered:
+            if summary_rendered.done():
+                self._outstanding_summaries.pop(player_key, None)
+            else:
+                payload.after = summary_rendered
+        payload.enqueued_at = time.monotonic()
+        self.render_queues[hash(player_key) % self.render_workers].put_nowait(payload)
+
+    def _buffer_for_aggregation(self, player_id: str, payload) -> None:
+        match_key = self._match_key_for(payload.key)
+        self._aggregate_buffer.setdefault(match_key, []).append((str(player_id), payload))
+        if self._aggregate_handle is None:
+            self._aggregate_handle = asyncio.get_running_loop().call_later(
+                self.aggregate_window_seconds, self._flush_aggregation
+            )
+
+    def _flush_aggregation(self) -> None:
+        """Release the current window: lone toasts as-is, bursts as summaries.
+
+        Toasts for the same match collapse into one summary. If the whole window
+        holds at least `aggregate_rate_threshold` toasts, every match is merged
+        into a single summary.
+        """
+        if self._aggregate_handle is not None:
+            self._aggregate_handle.cancel()
+            self._aggregate_handle = None
+        groups = list(self._aggregate_buffer.values())
+        self._aggregate_buffer = {}
+        if len(groups) > 1 and sum(len(group) for group in groups) >= self.aggregate_rate_threshold:
+            groups = [[item for group in groups for item in group]]
+        for group in groups:
+            if len(group) == 1:
+                self.enqueue_payload(*group[0])
+            else:
+                self._enqueue_summary(group)
+
+    def _enqueue_summary(self, group) -> None:
+        player_ids = [player_id for player_id, _ in group]
+        summary = self.build_summary_payload([payload for _, payload in group])
+        summary.keys = [payload.key for _, payload in group]
+        summary.player_ids = player_ids
+        # Earlier summaries covering any of these players must render first. Collect
+        # them before this summary takes their place in `_outstanding_summaries`.
+        earlier = {self._outstanding_summaries.get(player_id) for player_id in player_ids}
+        earlier = [rendered for rendered in earlier if rendered is not None and not rendered.done()]
+        if earlier:
+            summary.after = earlier[0] if len(earlier) == 1 else asyncio.gather(*earlier)
+        summary.rendered = asyncio.get_running_loop().create_future()
+        for player_id in player_ids:
+            self._outstanding_summaries[player_id] = summary.rendered
+        self.enqueue_payload(player_ids[0], summary)
+
+    def _enqueue_toast_for_player_match(self, player_id: str, match, status: str, match_id, key=None) -> None:
+        if key is None:
+            key = self._build_toast_key(player_id, match_id, status)
         if self.toast_status_by_key.get(key) in ("queued", "shown"):
             return
 
@@ -68,82 +242,224 @@ class ToastQueueManager:
             if not payload:
                 self.toast_status_by_key.pop(key, None)
                 return
-            payload["key"] = key
-            self.toast_queue.put_nowait(payload)
+            payload.key = key
+            if self.build_summary_payload is not None and self.aggregate_window_seconds > 0:
+                self._buffer_for_aggregation(player_id, payload)
+            else:
+                self.enqueue_payload(player_id, payload)
         except Exception:
             if self.toast_status_by_key.get(key) == "queued":
                 self.toast_status_by_key.pop(key, None)
             raise
 
-    async def _toast_queue_worker(self) -> None:
+    async def _toast_queue_worker(self, queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
         while True:
-            payload = await self.toast_queue.get()
-            key = payload.get("key")
+            payload = await queue.get()
             try:
-                self.display_payload(payload)
-                if key is not None:
+                if payload.after is not None:
+                    # An earlier summary covering this player renders on another worker.
+                    await asyncio.shield(payload.after)
+                # Rendering (toast XML, WinRT call, audio) blocks, so keep it off the loop.
+                render_started = time.perf_counter()
+                await loop.run_in_executor(self._render_executor, self.display_payload, payload)
+                TOAST_RENDER_SECONDS.observe(time.perf_counter() - render_started)
+                self.render_latency_seconds.append(time.monotonic() - payload.enqueued_at)
+                for key in payload.keys:
                     self.toast_status_by_key[key] = "shown"
             finally:
-                self.toast_queue.task_done()
+                if payload.rendered is not None:
+                    self._finish_summary(payload)
+                queue.task_done()
 
-    async def _wait_for_match_and_enqueue_toast(
-        self,
-        player_id: str,
-        status: str,
-        match_id,
-        timeout_seconds: float = 12.0,
-        poll_interval_seconds: float = 0.4,
-    ) -> None:
-        key = self._build_toast_key(player_id, match_id, status)
-        start = asyncio.get_running_loop().time()
-        while asyncio.get_running_loop().time() - start < timeout_seconds:
-            match = self.get_match(status, match_id, print_match_count=False)
-            if match:
-                self._enqueue_toast_for_player_match(player_id, match, status, match_id)
-                break
-            await asyncio.sleep(poll_interval_seconds)
-        self.pending_wait_tasks.pop(key, None)
+    def _finish_summary(self, summary) -> None:
+        rendered = summary.rendered
+        if not rendered.done():
+            rendered.set_result(None)
+        for player_id in summary.player_ids:
+            if self._outstanding_summaries.get(player_id) is rendered:
+                del self._outstanding_summaries[player_id]
+
+    @staticmethod
+    def _match_key_for(toast_key):
+        _, match_id, status = toast_key
+        return (status, match_id)
+
+    def _add_pending(self, key, player_id: str, match_id) -> None:
+        deadline = asyncio.get_running_loop().time() + self.match_wait_timeout_seconds
+        waiting = self.pending_by_match.setdefault(self._match_key_for(key), {})
+        waiting[key] = (player_id, match_id, deadline)
+        self.toast_status_by_key[key] = "waiting"
+        if self._sweep_task is None or self._sweep_task.done():
+            self._sweep_task = asyncio.create_task(self._sweep_pending_matches())
+
+    def _discard_pending(self, key) -> None:
+        match_key = self._match_key_for(key)
+        waiting = self.pending_by_match.get(match_key)
+        if waiting is None or waiting.pop(key, None) is None:
+            return
+        if not waiting:
+            del self.pending_by_match[match_key]
         if self.toast_status_by_key.get(key) == "waiting":
             self.toast_status_by_key.pop(key, None)
 
-    def _cancel_pending_wait_task(self, key) -> None:
-        pending_task = self.pending_wait_tasks.get(key)
-        if pending_task and not pending_task.done():
-            pending_task.cancel()
-        self.pending_wait_tasks.pop(key, None)
+    def notify_match_available(self, status: str, match_id, match) -> None:
+        """Release every toast waiting on this match as soon as its data exists."""
+        waiting = self.pending_by_match.pop((self._normalize_status(status), str(match_id)), None)
+        if not waiting:
+            return
+        now = asyncio.get_running_loop().time()
+        for key, (player_id, raw_match_id, deadline) in waiting.items():
+            MATCH_WAIT_SECONDS.observe(now - (deadline - self.match_wait_timeout_seconds))
+            if self.toast_status_by_key.get(key) == "waiting":
+                self.toast_status_by_key.pop(key, None)
+            self._enqueue_toast_for_player_match(player_id, match, key.status, raw_match_id, key=key)
 
-    def _show_or_queue_player_match(self, player_id: str, status: str, match_id) -> None:
-        normalized_status = self._normalize_status(status)
-        key = self._build_toast_key(player_id, match_id, normalized_status)
+    async def _sweep_pending_matches(self) -> None:
+        """Check each pending match once per tick until none are left.
+
+        MatchBook has no ingestion callback, so this shared sweep covers matches
+        that arrive without passing through `notify_match_available`. It costs one
+        lookup per distinct pending match rather than one task per toast key.
+        """
+        loop = asyncio.get_running_loop()
+        while self.pending_by_match:
+            await asyncio.sleep(self.match_sweep_interval_seconds)
+            now = loop.time()
+            for match_key, waiting in list(self.pending_by_match.items()):
+                status = match_key[0]
+                _, raw_match_id, _ = next(iter(waiting.values()))
+                match = self.get_match(status, raw_match_id, print_match_count=False)
+                if match:
+                    self.notify_match_available(status, raw_match_id, match)
+                    continue
+                for key, (_, _, deadline) in list(waiting.items()):
+                    if deadline <= now:
+                        self._discard_pending(key)
+
+    def _show_or_queue_player_match(self, key: ToastKey, match_id) -> None:
+        player_id, _, normalized_status = key
         state = self.toast_status_by_key.get(key)
         if state in ("queued", "shown"):
+            DEDUPE_HITS.inc("toast_key")
             return
 
         match = self.get_match(normalized_status, match_id, print_match_count=True)
+        self._place_player_match(key, match_id, match)
+        if match:
+            # Other players may be waiting on the same match.
+            self.notify_match_available(normalized_status, match_id, match)
+
+    def _place_player_match(self, key: ToastKey, match_id, match) -> None:
+        """Enqueue the toast for `key` if its match is known, otherwise wait for it."""
+        player_id, _, normalized_status = key
         if match:
-            self._cancel_pending_wait_task(key)
-            self._enqueue_toast_for_player_match(player_id, match, normalized_status, match_id)
+            self._discard_pending(key)
+            self._enqueue_toast_for_player_match(player_id, match, normalized_status, match_id, key=key)
             return
 
         if normalized_status not in self.valid_statuses:
             return
-        if key in self.pending_wait_tasks and not self.pending_wait_tasks[key].done():
+        if key in self.pending_by_match.get(self._match_key_for(key), ()):
             return
+        self._add_pending(key, player_id, match_id)
 
-        self.toast_status_by_key[key] = "waiting"
-        self.pending_wait_tasks[key] = asyncio.create_task(
-            self._wait_for_match_and_enqueue_toast(player_id, normalized_status, match_id)
-        )
+    def forget_player(self, player_id: str) -> None:
+        """Drop per-player state for a player that is no longer watched."""
+        player_key = intern_id(player_id)
+        self.last_seen_state_by_player.pop(player_key, None)
+        for waiting in list(self.pending_by_match.values()):
+            for key in [key for key in waiting if key[0] == player_key]:
+                self._discard_pending(key)
+
+    def forget_player_match(self, player_id: str, status: str, match_id) -> None:
+        """Drop dedupe state for a player's match once MatchBook removes them from it."""
+        key = self._build_toast_key(player_id, match_id, status)
+        if self.toast_status_by_key.get(key) == "queued":
+            # The worker still needs the key to mark the toast as shown.
+            return
+        self._discard_pending(key)
+        self.toast_status_by_key.pop(key, None)
+
+    def export_dedupe_state(self) -> dict:
+        """Return shown toast keys and last-seen player states as JSON-ready lists.
+
+        Toasts that were still queued or waiting for match data are left out, and
+        so is the last-seen state of their players, so after a restart they are
+        alerted rather than silently dropped.
+        """
+        shown = {
+            key: seconds_left
+            for key, state, seconds_left in self.toast_status_by_key.items_with_ttl()
+            if state == "shown"
+        }
+        toasts = [[*key, round(seconds_left, 1)] for key, seconds_left in shown.items()]
+        players = [
+            [player_key, status, match_id]
+            for player_key, (status, match_id), _ in self.last_seen_state_by_player.items_with_ttl()
+            if status not in self.valid_statuses or (player_key, match_id, status) in shown
+        ]
+        return {"toasts": toasts, "players": players}
+
+    def import_dedupe_state(self, state: dict) -> int:
+        """Load state from `export_dedupe_state`, before any updates arrive. Returns the entries restored."""
+        restored = 0
+        # Oldest first, so the map's insertion order still matches expiry order.
+        for player_id, match_id, status, seconds_left in sorted(state.get("toasts", ()), key=lambda toast: toast[3]):
+            if seconds_left > 0:
+                key = self._build_toast_key(player_id, match_id, status)
+                self.toast_status_by_key.restore(key, "shown", seconds_left)
+                restored += 1
+        for player_id, status, match_id in state.get("players", ()):
+            normalized_status = self._normalize_status(status)
+            self.last_seen_state_by_player[intern_id(player_id)] = self._build_player_state(normalized_status, match_id)
+            restored += 1
+        return restored
 
     def handle_player_status_update(self, player_id: str, status: str, match_id) -> None:
         """Handle one player status update by enqueueing or waiting for match data."""
         normalized_status = self._normalize_status(status)
         state = self._build_player_state(normalized_status, match_id)
-        player_key = str(player_id)
+        player_key = intern_id(player_id)
         if self.last_seen_state_by_player.get(player_key) == state:
+            DEDUPE_HITS.inc("player_state")
             return
         self.last_seen_state_by_player[player_key] = state
 
         if self.status_logger:
             self.status_logger(player_id, status, match_id)
-        self._show_or_queue_player_match(player_id, normalized_status, match_id)
+        # The key reuses the interned ID and status and the match string from `state`.
+        self._show_or_queue_player_match(ToastKey(player_key, state[1], normalized_status), match_id)
+
+    def handle_player_status_updates(self, updates) -> None:
+        """Handle a batch of `(player_id, status, match_id)` updates received in one loop tick.
+
+        Only each player's latest update is applied, and each distinct match is
+        looked up once for all the players in it.
+        """
+        latest_by_player = {}
+        for update in updates:
+            latest_by_player[intern_id(update[0])] = update
+
+        keys_by_match = {}
+        for player_key, (player_id, status, match_id) in latest_by_player.items():
+            normalized_status = self._normalize_status(status)
+            state = self._build_player_state(normalized_status, match_id)
+            if self.last_seen_state_by_player.get(player_key) == state:
+                DEDUPE_HITS.inc("player_state")
+                continue
+            self.last_seen_state_by_player[player_key] = state
+            if self.status_logger:
+                self.status_logger(player_id, status, match_id)
+            key = ToastKey(player_key, state[1], normalized_status)
+            if self.toast_status_by_key.get(key) in ("queued", "shown"):
+                DEDUPE_HITS.inc("toast_key")
+                continue
+            keys_by_match.setdefault((normalized_status, state[1]), (match_id, []))[1].append(key)
+
+        for (normalized_status, _), (match_id, keys) in keys_by_match.items():
+            match = self.get_match(normalized_status, match_id, print_match_count=True)
+            for key in keys:
+                self._place_player_match(key, match_id, match)
+            if match:
+                self.notify_match_available(normalized_status, match_id, match)
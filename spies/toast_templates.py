@@ -0,0 +1,110 @@
+"""Precomputed spy alert layouts.
+
+`ToastTemplates` holds the parts of an alert that never change between toasts:
+the title, banner and audio paths, the default avatar and the per-status
+wording. Building an alert then only formats the fields that depend on the
+payload. The player's civ name is looked up once, while the payload is built,
+and passed in here instead of being looked up a second time.
+"""
+
+from __future__ import annotations
+
+import time
+from pathlib import Path
+
+from spies.toast_handlers import build_launch_action
+
+ALERT_TITLE = "Spy Alert"
+MAX_NAME_LENGTH = 25
+MAX_SUMMARY_NAMES = 6
+SUBSCRIPTION_DESCRIPTIONS = {"lobby": "lobby", "spectate": "game"}
+
+
+class ToastTemplates:
+    """Build backend-neutral alert dicts for one player or a burst of players."""
+
+    def __init__(self, hero_image: Path, audio_path: Path, default_avatar_path: str, logger, title: str = ALERT_TITLE):
+        self.hero_image = hero_image
+        self.audio_path = audio_path
+        self.default_avatar_path = default_avatar_path
+        self.logger = logger
+        self.title = title
+        # Fallback text such as "a lobby", keyed by status.
+        self._fallback_descriptions = {
+            status: f"a {description}" for status, description in SUBSCRIPTION_DESCRIPTIONS.items()
+        }
+
+    def player_alert(
+        self,
+        player_name: str,
+        match,
+        status: str,
+        avatar_filepath: str,
+        civ_name: str,
+        left_match: bool = False,
+    ) -> dict:
+        """Return the alert for one player joining (or leaving) a lobby or game."""
+        subscription_description = SUBSCRIPTION_DESCRIPTIONS.get(status, "Unknown")
+        match_description = match.get("description", self._fallback_descriptions.get(status, "a Unknown"))
+        verb = "left" if left_match else "is in"
+        created_time = match.get("created_time", int(time.time()))
+        match_time_alive = int(time.time()) - created_time
+        slots_taken = match.get("slots_taken", -1)
+        text_fields = [
+            f"{player_name[:MAX_NAME_LENGTH]} {verb} {subscription_description}:\n{match_description}",
+            f"Map: {match.get('map_name', 'Unknown Map')} | Playing as: {civ_name}",
+            f"Started: {match_time_alive}s ago | {slots_taken} Player{'s' if slots_taken != 1 else ''} in {subscription_description}",
+        ]
+        return {
+            "title": self.title,
+            "text_fields": text_fields,
+            "hero_image": self.hero_image,
+            "avatar_image": avatar_filepath,
+            "launch_action": build_launch_action(status, match, self.logger),
+            "player_name": player_name,
+            "status": status,
+            "match_id": match.get("matchid"),
+            "left_match": left_match,
+        }
+
+    def summary_alert(self, payloads) -> dict:
+        """Return one alert covering a burst of player payloads."""
+        matches = {}
+        for payload in payloads:
+            match = payload.match
+            matches.setdefault((payload.status, match.get("matchid")), match)
+        player_names = [payload.player_name for payload in payloads]
+
+        if len(matches) == 1:
+            ((status, _), match), = matches.items()
+            subscription_description = "game" if status == "spectate" else "lobby"
+            heading = (
+                f"{len(payloads)} watched players in {subscription_description}:\n"
+                f"{match.get('description', f'a {subscription_description}')}"
+            )
+            detail = f"Map: {match.get('map_name', 'Unknown Map')} | {match.get('slots_taken', -1)} Players in {subscription_description}"
+            launch_action = build_launch_action(status, match, self.logger)
+        else:
+            status, match = None, None
+            heading = f"{len(payloads)} watched players active in {len(matches)} lobbies/games"
+            detail = ""
+            launch_action = None
+
+        names_text = ", ".join(name[:MAX_NAME_LENGTH] for name in player_names[:MAX_SUMMARY_NAMES])
+        if len(player_names) > MAX_SUMMARY_NAMES:
+            names_text += f" +{len(player_names) - MAX_SUMMARY_NAMES} more"
+        text_fields = [heading, names_text, detail] if detail else [heading, names_text]
+
+        avatar_strip = list(dict.fromkeys(payload.avatar_filepath for payload in payloads))
+        return {
+            "title": self.title,
+            "text_fields": text_fields,
+            "hero_image": self.hero_image,
+            "avatar_image": avatar_strip[0] if avatar_strip else self.default_avatar_path,
+            "avatar_strip": avatar_strip,
+            "launch_action": launch_action,
+            "player_name": names_text,
+            "status": status,
+            "match_id": match.get("matchid") if match else None,
+            "left_match": False,
+        }
@@ -1,12 +1,29 @@
-"""Watchlist loading, indexing, and persistence helpers for Spies."""
+"""Watchlist loading, indexing, and persistence helpers for Spies.
+
+Entries live in `watchlist.json` by default. With a `SqliteWatchlistStore`
+(see `spies.watchlist_store`) they live in SQLite and `by_id` loads them on demand.
+"""
 
 from pathlib import Path
+import asyncio
 import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait as wait_for_futures
+from contextlib import suppress
 
-from aoe2api import aoe2api
+from spies.metrics import METRICS
+from spies.name_resolver import NameResolver
+from spies.records import WatchlistEntry, intern_id
 
 DEFAULT_AVATAR_PATH = "spies/assets/default_avatar.png"
 WATCHLIST_PATH = Path("spies/watchlist.json")
+DEFAULT_SAVE_DELAY_SECONDS = 2.0
+DEFAULT_RELOAD_POLL_SECONDS = 2.0
+
+WATCHLIST_SAVES = METRICS.counter("spies_watchlist_saves_total", "Full rewrites of the watchlist file.")
 
 
 class Watchlist:
@@ -16,10 +33,35 @@ class Watchlist:
         self,
         watchlist_path: Path = WATCHLIST_PATH,
         default_avatar_path: str = DEFAULT_AVATAR_PATH,
+        save_delay_seconds: float = DEFAULT_SAVE_DELAY_SECONDS,
+        resolver: NameResolver | None = None,
+        store=None,
     ):
         self.watchlist_path = watchlist_path
+        # Optional SqliteWatchlistStore; watchlist_path is then only imported from.
+        self.store = store
         self.default_avatar_path = default_avatar_path
+        self.save_delay_seconds = save_delay_seconds
+        self._resolver = resolver
         self.by_id = {}
+        self.save_count = 0
+        self._known_mtime_ns = None
+        # Set by the writer when it skipped a save because of an unseen edit.
+        self._save_skipped = False
+
+        self._dirty_index = None
+        self._save_handle = None
+        self._write_lock = threading.Lock()
+        # One writer thread, so snapshots land in the order they were taken.
+        self._writer = None
+        self._pending_write = None
+
+    @property
+    def resolver(self) -> NameResolver:
+        # Built on first use so watchlists that need no lookups never touch aoe2api.
+        if self._resolver is None:
+            self._resolver = NameResolver()
+        return self._resolver
 
     def create_empty(self) -> None:
         if self.watchlist_path.exists():
@@ -53,73 +95,258 @@ class Watchlist:
         ids_missing_usernames = []
         usernames_missing_ids = []
         for item in raw:
-            entry = {}
-            if isinstance(item, (int, str)):
-                entry["profileid"] = str(item)
-            elif isinstance(item, dict):
-                entry = dict(item)
-                if "profileid" in entry and entry["profileid"] is not None:
-                    entry["profileid"] = str(entry["profileid"])
-            else:
+            entry = WatchlistEntry.from_json(item, self.default_avatar_path)
+            if entry is None:
                 continue
 
-            if "avatar_filepath" not in entry or not entry.get("avatar_filepath"):
-                entry["avatar_filepath"] = self.default_avatar_path
+            if entry.profile_id and not entry.user_name:
+                ids_missing_usernames.append(entry.profile_id)
 
-            if entry.get("profileid") and not entry.get("userName"):
-                ids_missing_usernames.append(entry["profileid"])
-
-            if entry.get("userName") and not entry.get("profileid"):
-                usernames_missing_ids.append(entry["userName"])
+            if entry.user_name and not entry.profile_id:
+                usernames_missing_ids.append(entry.user_name)
 
             normalized.append(entry)
 
         updated = False
         if ids_missing_usernames:
-            usernames = aoe2api.get_usernames_from_ids(ids_missing_usernames)
-            id_to_username = dict(zip(ids_missing_usernames, usernames))
+            id_to_username = self.resolver.usernames_for_ids(ids_missing_usernames)
             for entry in normalized:
-                pid = entry.get("profileid")
-                if pid in id_to_username and not entry.get("userName"):
-                    entry["userName"] = id_to_username.get(pid) or ""
+                pid = entry.profile_id
+                if pid in id_to_username and not entry.user_name:
+                    entry.user_name = id_to_username.get(pid) or ""
                     updated = True
 
         if usernames_missing_ids:
-            ids = aoe2api.get_ids_from_usernames(usernames_missing_ids)
-            username_to_id = dict(zip(usernames_missing_ids, ids))
+            username_to_id = self.resolver.ids_for_usernames(usernames_missing_ids)
             for entry in normalized:
-                username = entry.get("userName")
-                if username in username_to_id and not entry.get("profileid"):
-                    entry["profileid"] = str(username_to_id.get(username) or "")
+                username = entry.user_name
+                if username in username_to_id and not entry.profile_id:
+                    entry.profile_id = intern_id(username_to_id.get(username) or "")
                     updated = True
 
+        if ids_missing_usernames or usernames_missing_ids:
+            self.resolver.save_cache()
         if updated:
-            self.save_entries(normalized)
+            self.save_entries([entry.to_json() for entry in normalized])
 
         return normalized
 
-    def save_entries(self, entries) -> None:
-        with open(self.watchlist_path, "w", encoding="utf-8") as f:
-            json.dump(entries, f, indent=2)
+    def save_entries(self, entries, if_unchanged: bool = False) -> bool:
+        """Atomically replace the watchlist file with `entries` (JSON objects).
+
+        With `if_unchanged`, the write is skipped (and False returned) when the
+        file was edited since it was last read, so a snapshot taken earlier
+        cannot overwrite that edit before the reload picks it up.
+        """
+        with self._write_lock:
+            if if_unchanged:
+                mtime_ns = self._stat_mtime_ns()
+                if mtime_ns is not None and mtime_ns != self._known_mtime_ns:
+                    self._save_skipped = True
+                    print("Watchlist changed on disk; saving again after it is reloaded.")
+                    return False
+            self.watchlist_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(
+                prefix=f".{self.watchlist_path.name}.",
+                suffix=".tmp",
+                dir=self.watchlist_path.parent,
+            )
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(entries, f, indent=2)
+                os.replace(tmp_path, self.watchlist_path)
+            except BaseException:
+                with suppress(OSError):
+                    os.unlink(tmp_path)
+                raise
+            self.save_count += 1
+            WATCHLIST_SAVES.inc()
+            self._known_mtime_ns = self._stat_mtime_ns()
+            return True
 
     def load_index(self):
+        if self.store is not None:
+            return self._load_store_index()
+        self._known_mtime_ns = self._stat_mtime_ns()
         entries = self.load_entries()
-        self.by_id = {
-            str(entry.get("profileid")): entry
-            for entry in entries
-            if entry.get("profileid")
-        }
+        self.by_id = {entry.profile_id: entry for entry in entries if entry.profile_id}
         return self.by_id
 
+    def _load_store_index(self):
+        from spies.watchlist_store import StoreIndex
+
+        if self.store.is_empty() and self.watchlist_path.exists():
+            # First run with the store: import the existing JSON watchlist.
+            self.store.replace_all(self.load_entries())
+            print(f"Imported {self.watchlist_path} into {self.store.db_path}")
+        self.by_id = StoreIndex(self.store)
+        return self.by_id
+
+    def _stat_mtime_ns(self):
+        try:
+            return self.watchlist_path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def read_if_changed(self):
+        """Return freshly loaded entries if the file changed on disk, else None.
+
+        Blocking (may resolve names over the network); safe to run in a thread.
+        """
+        mtime_ns = self._stat_mtime_ns()
+        if mtime_ns is None or mtime_ns == self._known_mtime_ns:
+            return None
+        self._known_mtime_ns = mtime_ns
+        return self.load_entries()
+
+    def apply_entries(self, entries):
+        """Merge reloaded entries into `by_id` in place and return (added, removed) IDs.
+
+        Entries that are still present keep their existing record, including the
+        avatar state managed at runtime; only their other fields are refreshed.
+        """
+        fresh = {entry.profile_id: entry for entry in entries if entry.profile_id}
+        removed = [profile_id for profile_id in self.by_id if profile_id not in fresh]
+        added = [profile_id for profile_id in fresh if profile_id not in self.by_id]
+        for profile_id in removed:
+            del self.by_id[profile_id]
+        for profile_id, entry in fresh.items():
+            existing = self.by_id.get(profile_id)
+            if existing is None:
+                self.by_id[profile_id] = entry
+            else:
+                existing.update_from(entry)
+        return added, removed
+
+    async def watch(self, on_change, poll_interval_seconds: float = DEFAULT_RELOAD_POLL_SECONDS) -> None:
+        """Poll the file's mtime and report added/removed IDs via `on_change`.
+
+        With a store, the database is polled for commits from other processes
+        instead. `on_change(added, removed)` runs on the event loop after `by_id`
+        has been updated. Runs until cancelled.
+        """
+        while True:
+            await asyncio.sleep(poll_interval_seconds)
+            if self.store is not None:
+                changes = await asyncio.to_thread(self.by_id.read_changes)
+                if changes is None:
+                    continue
+                added, removed = self.by_id.apply_changes(changes)
+                if added or removed:
+                    on_change(added, removed)
+                continue
+            try:
+                entries = await asyncio.to_thread(self.read_if_changed)
+            except (OSError, ValueError) as exc:
+                print(f"Watchlist reload failed, keeping current entries: {exc}")
+                continue
+            if entries is None:
+                continue
+            added, removed = self.apply_entries(entries)
+            if self._save_skipped:
+                # Write the runtime changes the skipped save held, now merged with the edit.
+                self._save_skipped = False
+                self.request_save()
+            if added or removed:
+                on_change(added, removed)
+
     def save_index(self, by_id=None) -> None:
+        if self.store is not None:
+            self.flush()
+            return
         index = self.by_id if by_id is None else by_id
-        self.save_entries(list(index.values()))
+        self.save_entries([entry.to_json() for entry in index.values()])
+
+    def request_entry_save(self, entry) -> None:
+        """Persist a runtime change to one entry's avatar path.
+
+        With a store only that entry's row is rewritten; otherwise the whole
+        file is saved through `request_save`.
+        """
+        if self.store is None:
+            self.request_save()
+            return
+        self.by_id.mark_dirty(entry)
+        self._schedule_save()
+
+    def request_save(self, by_id=None) -> None:
+        """Mark the index dirty and persist it after the coalescing delay.
+
+        Repeated requests inside one window collapse into a single write, which
+        runs off the event loop on a single writer thread. Without a running
+        loop the index is written immediately.
+        """
+        self._dirty_index = self.by_id if by_id is None else by_id
+        self._schedule_save()
+
+    def _schedule_save(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        if self._save_handle is None:
+            self._save_handle = loop.call_later(self.save_delay_seconds, self._flush_in_background)
+
+    def _take_dirty_snapshot(self):
+        if self.store is not None:
+            return self.by_id.take_dirty() or None
+        index, self._dirty_index = self._dirty_index, None
+        if index is None:
+            return None
+        # Copy on the loop thread so the writer never sees entries mid-update.
+        return [entry.to_json() for entry in index.values()]
+
+    def _flush_in_background(self) -> None:
+        self._save_handle = None
+        snapshot = self._take_dirty_snapshot()
+        if snapshot is None:
+            return
+        if self._writer is None:
+            self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="spies-watchlist")
+        self._pending_write = self._writer.submit(self._write_snapshot, snapshot)
+        self._pending_write.add_done_callback(self._report_write_failure)
+
+    @staticmethod
+    def _report_write_failure(future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Watchlist save failed: {future.exception()}")
+
+    def flush(self) -> None:
+        """Write any pending changes now. Call on shutdown.
+
+        Waits for a background write still in progress first, so it cannot
+        land after this newer snapshot.
+        """
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        pending, self._pending_write = self._pending_write, None
+        if pending is not None:
+            wait_for_futures([pending])
+        snapshot = self._take_dirty_snapshot()
+        if snapshot is not None:
+            self._write_snapshot(snapshot)
+
+    def _write_snapshot(self, snapshot) -> None:
+        if self.store is None:
+            self.save_entries(snapshot, if_unchanged=True)
+            return
+        try:
+            self.store.update_avatars(snapshot)
+        finally:
+            self.by_id.finish_write(snapshot)
 
     def get_profile_ids(self):
         profile_ids = list(self.by_id.keys())
-        if not profile_ids:
+        if not profile_ids and self.store is not None:
+            print(
+                f"Watchlist is empty. Import players into {self.store.db_path} with"
+                " `python -m spies.watchlist_store import FILE` to start spying."
+            )
+        elif not profile_ids:
             print("Watchlist is empty. Add profile IDs to spies/watchlist.json to start spying.")
         return profile_ids
 
     def get_entry(self, profile_id, default=None):
-        return self.by_id.get(str(profile_id), default)
+        return self.by_id.get(profile_id if type(profile_id) is str else str(profile_id), default)
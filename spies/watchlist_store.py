@@ -0,0 +1,300 @@
+"""SQLite-backed watchlist storage for very large watchlists.
+
+`watchlist.json` is parsed in full at startup and rewritten in full on every
+save. With `--watchlist-store sqlite` the watchlist lives in `spies/watchlist.db`
+instead. At startup only the profile IDs are read. Entries are loaded by ID on
+first use and kept in a bounded cache. An avatar change rewrites only that
+player's row.
+
+The database is filled from `watchlist.json` on first use and can be exported
+back to JSON at any time::
+
+    python -m spies.watchlist_store import spies/watchlist.json
+    python -m spies.watchlist_store export watchlist-backup.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+
+from spies.expiring_map import ExpiringLRUMap
+from spies.records import WatchlistEntry, intern_id
+
+WATCHLIST_DB_PATH = Path("spies/watchlist.db")
+DEFAULT_MAX_CACHED_ENTRIES = 10_000
+EXPORT_BATCH_ROWS = 1_000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    position INTEGER PRIMARY KEY,
+    profile_id TEXT,
+    user_name TEXT,
+    avatar_filepath TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_profile_id ON entries(profile_id);
+"""
+
+
+def _entry_row(entry: WatchlistEntry) -> tuple:
+    extra = json.dumps(entry.extra, separators=(",", ":")) if entry.extra else None
+    return (entry.profile_id, entry.user_name, entry.avatar_filepath, extra)
+
+
+def _row_entry(row) -> WatchlistEntry:
+    profile_id, user_name, avatar_filepath, extra = row
+    return WatchlistEntry(
+        intern_id(profile_id) if profile_id is not None else None,
+        user_name,
+        avatar_filepath,
+        json.loads(extra) if extra else None,
+    )
+
+
+class SqliteWatchlistStore:
+    """Watchlist rows in one SQLite table, in watchlist order.
+
+    Entries without a profile ID (unresolved usernames) are stored too, so an
+    export reproduces the imported list. The connection is shared between the
+    event loop and worker threads behind one lock.
+    """
+
+    def __init__(self, db_path: Path = WATCHLIST_DB_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def data_version(self) -> int:
+        """Counter that changes whenever another connection commits to the database."""
+        with self._lock:
+            return self._connection.execute("PRAGMA data_version").fetchone()[0]
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM entries LIMIT 1").fetchone() is None
+
+    def profile_ids(self) -> list[str]:
+        """Every non-empty profile ID, in watchlist order and without duplicates."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT profile_id FROM entries WHERE profile_id IS NOT NULL AND profile_id != '' ORDER BY position"
+            ).fetchall()
+        return list(dict.fromkeys(intern_id(profile_id) for profile_id, in rows))
+
+    def get(self, profile_id: str) -> WatchlistEntry | None:
+        """Load one entry by profile ID. Later duplicates win, as in `Watchlist.by_id`."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT profile_id, user_name, avatar_filepath, extra FROM entries"
+                " WHERE profile_id = ? ORDER BY position DESC LIMIT 1",
+                (profile_id,),
+            ).fetchone()
+        return None if row is None else _row_entry(row)
+
+    def iter_entries(self):
+        """Yield every entry in watchlist order, reading in batches."""
+        last_position = -1
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT position, profile_id, user_name, avatar_filepath, extra FROM entries"
+                    " WHERE position > ? ORDER BY position LIMIT ?",
+                    (last_position, EXPORT_BATCH_ROWS),
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield _row_entry(row[1:])
+            last_position = rows[-1][0]
+
+    def update_avatars(self, entries) -> None:
+        """Store the avatar path of each entry in its existing row."""
+        rows = [(entry.avatar_filepath, entry.profile_id) for entry in entries if entry.profile_id]
+        if not rows:
+            return
+        with self._lock, self._connection:
+            self._connection.executemany("UPDATE entries SET avatar_filepath = ? WHERE profile_id = ?", rows)
+
+    def replace_all(self, entries) -> None:
+        """Replace the whole table with `entries`, keeping their order."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM entries")
+            self._connection.executemany(
+                "INSERT INTO entries (profile_id, user_name, avatar_filepath, extra) VALUES (?, ?, ?, ?)",
+                (_entry_row(entry) for entry in entries),
+            )
+
+    def export_json(self, json_path: Path) -> int:
+        """Write the watchlist as a JSON array, one entry at a time. Returns the entry count."""
+        count = 0
+        with open(json_path, "w", encoding="utf-8") as handle:
+            handle.write("[")
+            for entry in self.iter_entries():
+                handle.write(",\n  " if count else "\n  ")
+                json.dump(entry.to_json(), handle)
+                count += 1
+            handle.write("\n]\n" if count else "]\n")
+        return count
+
+
+class StoreIndex(Mapping):
+    """Read-through `by_id` mapping over a `SqliteWatchlistStore`.
+
+    Only the profile IDs are held in full. Entries are loaded on first access
+    and cached. Entries whose avatar changed stay pinned, first in `dirty` and
+    then until the write that took them has committed, so eviction never
+    exposes an outdated row.
+    """
+
+    def __init__(self, store: SqliteWatchlistStore, max_cached_entries: int = DEFAULT_MAX_CACHED_ENTRIES):
+        self.store = store
+        self.dirty: dict[str, WatchlistEntry] = {}
+        # Entries taken by `take_dirty` whose rows are still being written, with
+        # the number of writes pending for each ID.
+        self._writing: dict[str, WatchlistEntry] = {}
+        self._writes_pending: dict[str, int] = {}
+        self._writing_lock = threading.Lock()
+        self._cache = ExpiringLRUMap(max_cached_entries)
+        self._ids = set()
+        self._ordered_ids = []
+        self._data_version = None
+        self.refresh_ids()
+
+    def refresh_ids(self) -> None:
+        self._data_version = self.store.data_version()
+        self._ordered_ids = self.store.profile_ids()
+        self._ids = set(self._ordered_ids)
+
+    def __getitem__(self, profile_id):
+        entry = self.get(profile_id)
+        if entry is None:
+            raise KeyError(profile_id)
+        return entry
+
+    def get(self, profile_id, default=None):
+        profile_id = profile_id if type(profile_id) is str else str(profile_id)
+        if profile_id not in self._ids:
+            return default
+        entry = self.dirty.get(profile_id) or self._writing.get(profile_id) or self._cache.get(profile_id)
+        if entry is None:
+            entry = self.store.get(profile_id)
+            if entry is None:
+                return default
+            self._cache[profile_id] = entry
+        return entry
+
+    def __contains__(self, profile_id) -> bool:
+        return (profile_id if type(profile_id) is str else str(profile_id)) in self._ids
+
+    def __iter__(self):
+        return iter(self._ordered_ids)
+
+    def __len__(self) -> int:
+        return len(self._ordered_ids)
+
+    def mark_dirty(self, entry: WatchlistEntry) -> None:
+        if entry.profile_id:
+            self.dirty[entry.profile_id] = entry
+
+    def take_dirty(self) -> list[WatchlistEntry]:
+        """Hand the changed entries to a writer. Call `finish_write` once they are stored."""
+        entries, self.dirty = list(self.dirty.values()), {}
+        with self._writing_lock:
+            for entry in entries:
+                self._writing[entry.profile_id] = entry
+                self._writes_pending[entry.profile_id] = self._writes_pending.get(entry.profile_id, 0) + 1
+        return entries
+
+    def finish_write(self, entries) -> None:
+        """Unpin entries from `take_dirty` once their write has finished. Safe from any thread."""
+        with self._writing_lock:
+            for entry in entries:
+                remaining = self._writes_pending.get(entry.profile_id, 0) - 1
+                if remaining > 0:
+                    self._writes_pending[entry.profile_id] = remaining
+                else:
+                    self._writes_pending.pop(entry.profile_id, None)
+                    self._writing.pop(entry.profile_id, None)
+
+    def read_changes(self):
+        """Return `(data_version, profile_ids)` if another process changed the database, else None.
+
+        Blocking; safe to run in a thread. Pass the result to `apply_changes` on
+        the event loop.
+        """
+        data_version = self.store.data_version()
+        if data_version == self._data_version:
+            return None
+        return data_version, self.store.profile_ids()
+
+    def apply_changes(self, changes):
+        """Adopt IDs from `read_changes` and return `(added, removed)` IDs.
+
+        Cached entries are dropped so the next lookup reads the new rows.
+        Avatars changed at runtime stay in `dirty` until they are flushed.
+        """
+        data_version, ordered_ids = changes
+        previous_ids = self._ids
+        self._data_version = data_version
+        self._ordered_ids = ordered_ids
+        self._ids = set(ordered_ids)
+        self._cache = ExpiringLRUMap(self._cache.max_entries)
+        added = [profile_id for profile_id in ordered_ids if profile_id not in previous_ids]
+        removed = [profile_id for profile_id in previous_ids if profile_id not in self._ids]
+        for profile_id in removed:
+            self.dirty.pop(profile_id, None)
+        return added, removed
+
+
+def import_json(store: SqliteWatchlistStore, json_path: Path) -> int:
+    """Load `json_path` (resolving missing names/IDs) into the store. Returns the entry count."""
+    from spies.watchlist import Watchlist
+
+    entries = Watchlist(Path(json_path)).load_entries()
+    store.replace_all(entries)
+    return len(entries)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Import or export the SQLite Spies watchlist.")
+    parser.add_argument("--db", type=Path, default=WATCHLIST_DB_PATH, help=f"Database path (default: {WATCHLIST_DB_PATH}).")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="Replace the database contents with a JSON watchlist.")
+    import_parser.add_argument("json_path", type=Path)
+    export_parser = commands.add_parser("export", help="Write the database contents as a JSON watchlist.")
+    export_parser.add_argument("json_path", type=Path)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    store = SqliteWatchlistStore(args.db)
+    try:
+        if args.command == "import":
+            if not args.json_path.exists():
+                print(f"Watchlist file not found: {args.json_path}")
+                return 1
+            count = import_json(store, args.json_path)
+            print(f"Imported {count} entries into {args.db}")
+        else:
+            count = store.export_json(args.json_path)
+            print(f"Exported {count} entries to {args.json_path}")
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
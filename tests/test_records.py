@@ -0,0 +1,15 @@
+from spies.records import WatchlistEntry
+
+DEFAULT_AVATAR = "spies/assets/default_avatar.png"
+
+
+def test_unresolved_null_fields_round_trip():
+    item = {"userName": None, "profileid": "123", "avatar_filepath": "a.png", "note": "x"}
+    entry = WatchlistEntry.from_json(item, DEFAULT_AVATAR)
+    assert entry.to_json() == item
+
+
+def test_resolved_name_replaces_explicit_null():
+    entry = WatchlistEntry.from_json({"userName": None, "profileid": "123"}, DEFAULT_AVATAR)
+    entry.user_name = "Resolved"
+    assert entry.to_json() == {"userName": "Resolved", "profileid": "123", "avatar_filepath": DEFAULT_AVATAR}